@@ -0,0 +1,51 @@
+"""長い会話での1ターンあたりのペイロードサイズを計測するベンチマーク
+
+会話履歴をそのまま送る従来方式と、HistoryManager でウィンドウ化・要約する方式について、
+200ターンの会話の各ターンでモデルに渡すメッセージのサイズと要約の再計算回数を比較する。
+
+    python benchmarks/bench_history.py
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+from history import HistoryManager, summarize_extractive  # noqa: E402
+from tokens import estimate_tokens  # noqa: E402
+
+
+def main(turns=200):
+    summarize_calls = [0]
+
+    def counting_summarizer(previous_summary, messages, max_tokens):
+        summarize_calls[0] += 1
+        return summarize_extractive(previous_summary, messages, max_tokens)
+
+    manager = HistoryManager(summarizer=counting_summarizer)
+    history = []
+    rows = []
+
+    for turn in range(1, turns + 1):
+        legacy_tokens = sum(estimate_tokens(msg["content"]) for msg in history)
+        summary, window = manager.prepare(history)
+        managed_tokens = estimate_tokens(summary) + sum(estimate_tokens(msg["content"]) for msg in window)
+        rows.append((turn, legacy_tokens, managed_tokens, len(json.dumps(manager.cap(history), ensure_ascii=False))))
+
+        history = history + [
+            {"role": "user", "content": f"問題{turn}の答えはBだと思います。理由は教科書の第{turn}節に書かれているからです。"},
+            {"role": "assistant", "content": f"問題{turn}について解説します。" + "正解はBで、根拠となる記述は次の通りです。" * 8}
+        ]
+
+    print(f"{'turn':>5} | {'legacy tokens':>13} | {'managed tokens':>14} | {'echoed bytes':>12}")
+    for turn, legacy_tokens, managed_tokens, echoed in rows:
+        if turn in (1, 10, 25, 50, 100, 150, 200):
+            print(f"{turn:>5} | {legacy_tokens:>13} | {managed_tokens:>14} | {echoed:>12}")
+
+    managed = [row[2] for row in rows[20:]]
+    print(f"\nmanaged tokens after turn 20: min={min(managed)} max={max(managed)}")
+    print(f"summarizer calls: {summarize_calls[0]} for {turns} turns")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""古い形式（.ppt）のテキスト抽出のベンチマーク
+
+変更前のヒューリスティック（バイト列を3種類の文字コードで復号して正規表現で拾う）と、
+OLE2のPowerPoint Documentストリームのレコードを解析する現在の実装について、
+処理時間と抽出品質（スライドの本文がどれだけ含まれるか）を比較する。
+
+--corpus を指定しない場合は、日本語・英語の本文を含む .ppt をこのスクリプト内で生成して使う。
+実際の .ppt ファイルのディレクトリを指定した場合は正解がないため、処理時間と抽出文字数、
+読み取り可能な文字の割合のみを出力する。
+
+    python benchmarks/bench_legacy_ppt.py [--corpus DIR] [--number 20]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+from index import extract_text_from_ppt_legacy  # noqa: E402
+
+logger = logging.getLogger()
+
+
+def legacy_extract_text_from_ppt(file_content):
+    """変更前の実装（比較用）"""
+    try:
+        logger.info("Processing legacy PPT file")
+        
+        # PPTファイルの基本的なテキスト抽出
+        # 複数のエンコーディングで試行し、最も読みやすい結果を返す
+        
+        extracted_texts = []
+        
+        # 方法1: UTF-8で試行
+        try:
+            text_utf8 = file_content.decode('utf-8', errors='ignore')
+            # 英数字と日本語文字を抽出
+            readable_chars = re.findall(r'[a-zA-Z0-9\s\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FAF.,!?;:\-()\'\"]{4,}', text_utf8)
+            utf8_texts = [s.strip() for s in readable_chars if len(s.strip()) >= 4]
+            extracted_texts.extend(utf8_texts[:20])  # 最大20個
+        except:
+            pass
+        
+        # 方法2: Shift-JIS（日本語）で試行
+        try:
+            text_sjis = file_content.decode('shift-jis', errors='ignore')
+            readable_chars = re.findall(r'[a-zA-Z0-9\s\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FAF.,!?;:\-()\'\"]{4,}', text_sjis)
+            sjis_texts = [s.strip() for s in readable_chars if len(s.strip()) >= 4]
+            extracted_texts.extend(sjis_texts[:20])
+        except:
+            pass
+        
+        # 方法3: バイト列から直接英数字を検索
+        try:
+            ascii_strings = re.findall(rb'[a-zA-Z0-9\s.,!?;:\-()\'\"]{4,}', file_content)
+            ascii_texts = [s.decode('ascii', errors='ignore').strip() for s in ascii_strings]
+            ascii_texts = [s for s in ascii_texts if len(s) >= 4 and s.isascii()]
+            extracted_texts.extend(ascii_texts[:15])
+        except:
+            pass
+        
+        # 重複除去と品質フィルタリング
+        unique_texts = []
+        seen = set()
+        
+        for text in extracted_texts:
+            clean_text = re.sub(r'\s+', ' ', text.strip())  # 連続する空白を一つに
+            
+            if (clean_text and 
+                len(clean_text) >= 4 and 
+                len(clean_text) <= 100 and 
+                clean_text not in seen and
+                not re.match(r'^[^\w\s]*$', clean_text) and  # 記号のみでない
+                not re.match(r'^[\x00-\x1F\x7F-\x9F]+$', clean_text)):  # 制御文字のみでない
+                
+                unique_texts.append(clean_text)
+                seen.add(clean_text)
+        
+        # 結果を生成
+        if unique_texts:
+            # 文字数で昇順ソート（短いものから）
+            unique_texts.sort(key=len)
+            
+            result = "--- PPTファイル（レガシー形式）から抽出されたテキスト ---\n\n"
+            
+            # 最大15個のテキストを表示
+            displayed_texts = unique_texts[:15]
+            for i, text in enumerate(displayed_texts, 1):
+                result += f"{i}. {text}\n"
+            
+            if len(unique_texts) > 15:
+                result += f"\n... 他に{len(unique_texts) - 15}個のテキスト断片があります\n"
+            
+            result += "\n注意: 古いPPT形式のため、文字化けや不完全な抽出が発生する場合があります。"
+            result += "\nより正確な抽出のため、PowerPointで.pptx形式に変換してから再アップロードすることをお勧めします。"
+            
+            return result
+        else:
+            return ("PPTファイルからテキストを抽出できませんでした。\n\n"
+                   "このファイルは古いPowerPoint形式のため、テキスト抽出が困難です。\n"
+                   "解決策: PowerPointでファイルを開き、「名前を付けて保存」で .pptx 形式に変換してから再度アップロードしてください。")
+            
+    except Exception as e:
+        logger.error(f"PPT legacy processing error: {str(e)}")
+        return f"古いPPTファイルの処理中にエラーが発生しました: {str(e)}\n\n解決策: PowerPointでファイルを開き、.pptx形式で保存し直してください。"
+
+
+# --- ベンチマーク用の .ppt の生成 ---
+
+SECTOR_SIZE = 512
+END_OF_CHAIN = 0xFFFFFFFE
+FREE_SECTOR = 0xFFFFFFFF
+FAT_SECTOR = 0xFFFFFFFD
+NO_STREAM = 0xFFFFFFFF
+
+
+def record(rec_type, body, instance=0, version=0):
+    return struct.pack('<HHI', version | (instance << 4), rec_type, len(body)) + body
+
+
+def container(rec_type, children, instance=0):
+    return record(rec_type, b"".join(children), instance, version=0xF)
+
+
+def text_atom(text):
+    """ASCIIのみの場合は TextBytesAtom、それ以外は TextCharsAtom"""
+    text = text.replace("\n", "\r")
+    if text.isascii():
+        return record(0x0FA8, text.encode('latin-1'))
+    return record(0x0FA0, text.encode('utf-16-le'))
+
+
+def build_powerpoint_document(slides):
+    """スライドごとの (プレースホルダーの本文, テキストボックスの本文) から PowerPoint Document ストリームを作る"""
+    master = container(0x03F8, [container(0xF00D, [text_atom("Click to edit Master title style")])])
+    slide_list = []
+    for index, (placeholders, _) in enumerate(slides):
+        slide_list.append(record(0x03F3, struct.pack('<IIIII', index + 2, 0, len(placeholders), 256 + index, 0)))
+        for text in placeholders:
+            slide_list.append(record(0x0F9F, struct.pack('<I', 1)))
+            slide_list.append(text_atom(text))
+    document = container(0x03E8, [record(0x03E9, b"\x00" * 40), container(0x0FF0, slide_list, instance=0)])
+
+    stream = bytearray(master)
+    offsets = [len(stream)]
+    stream += document
+    for _, text_boxes in slides:
+        offsets.append(len(stream))
+        stream += container(0x03EE, [container(0x040C, [container(0xF00D, [text_atom(text)]) for text in text_boxes])])
+
+    persist_directory_offset = len(stream)
+    stream += record(0x1772, struct.pack('<I', 1 | (len(offsets) << 20)) + struct.pack(f'<{len(offsets)}I', *offsets))
+    user_edit_offset = len(stream)
+    stream += record(0x0FF5, struct.pack('<IHBBIIIIHH', 0, 0, 0, 3, 0, persist_directory_offset, 1, len(offsets) + 1, 1, 0))
+
+    user_name = b"bench"
+    current_user = record(0x0FF6, struct.pack('<IIIHHBBH', 0x14, 0xE391C05F, user_edit_offset, len(user_name), 0x03F4, 3, 0, 0)
+                          + user_name + struct.pack('<I', 8))
+    return bytes(stream), current_user
+
+
+def directory_entry(name, entry_type, start_sector=END_OF_CHAIN, size=0, child=NO_STREAM, right=NO_STREAM):
+    encoded = (name + "\x00").encode('utf-16-le') if name else b""
+    return (encoded.ljust(64, b"\x00")
+            + struct.pack('<HBB', len(encoded), entry_type, 1)
+            + struct.pack('<III', NO_STREAM, right, child)
+            + b"\x00" * 16 + struct.pack('<I', 0) + b"\x00" * 16
+            + struct.pack('<IQ', start_sector, size))
+
+
+def build_compound_file(streams):
+    """ストリーム（名前, バイト列）から OLE2 複合ファイルを作る（ミニストリームを使わないよう 4096 バイト以上に揃える）"""
+    streams = [(name, data.ljust(4096, b"\x00")) for name, data in streams]
+    stream_sectors = [-(-len(data) // SECTOR_SIZE) for _, data in streams]
+    data_sectors = 1 + sum(stream_sectors)
+    fat_sectors = 1
+    while fat_sectors * (SECTOR_SIZE // 4) < fat_sectors + data_sectors:
+        fat_sectors += 1
+
+    fat = [FAT_SECTOR] * fat_sectors
+    directory_sector = len(fat)
+    fat.append(END_OF_CHAIN)
+    starts = []
+    for count in stream_sectors:
+        starts.append(len(fat))
+        fat.extend(range(len(fat) + 1, len(fat) + count))
+        fat.append(END_OF_CHAIN)
+    fat.extend([FREE_SECTOR] * (fat_sectors * (SECTOR_SIZE // 4) - len(fat)))
+
+    # 名前は (長さ, 大文字) の順で比較されるため、短い名前を子、長い名前をその右の兄弟にする
+    order = sorted(range(len(streams)), key=lambda i: (len(streams[i][0]), streams[i][0].upper()))
+    entries = [directory_entry("Root Entry", 5, child=order[0] + 1)]
+    for i, (name, data) in enumerate(streams):
+        position = order.index(i)
+        right = order[position + 1] + 1 if position + 1 < len(order) else NO_STREAM
+        entries.append(directory_entry(name, 2, starts[i], len(data), right=right))
+    while len(entries) < SECTOR_SIZE // 128:
+        entries.append(directory_entry("", 0))
+
+    difat = list(range(fat_sectors)) + [FREE_SECTOR] * (109 - fat_sectors)
+    header = (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' + b"\x00" * 16
+              + struct.pack('<HHHHH', 0x3E, 3, 0xFFFE, 9, 6) + b"\x00" * 6
+              + struct.pack('<IIIIIIIII', 0, fat_sectors, directory_sector, 0, 4096, END_OF_CHAIN, 0, END_OF_CHAIN, 0)
+              + struct.pack('<109I', *difat))
+
+    body = struct.pack(f'<{len(fat)}I', *fat) + b"".join(entries)
+    for _, data in streams:
+        body += data.ljust(-(-len(data) // SECTOR_SIZE) * SECTOR_SIZE, b"\x00")
+    return header + body
+
+
+SLIDE_TEMPLATES = [
+    (["第{n}章 光合成のしくみ", "光エネルギーを化学エネルギーに変換する\n明反応と暗反応の2段階で進む"],
+     ["補足: 葉緑体のチラコイド膜で明反応が起こる"]),
+    (["Chapter {n}: Cellular respiration", "Glycolysis, the citric acid cycle and oxidative phosphorylation"],
+     ["Note: ATP yield per glucose is about 30 molecules"]),
+    (["第{n}節 遺伝子の発現", "DNAの情報はmRNAに転写され、リボソームでタンパク質に翻訳される"],
+     []),
+]
+
+
+def make_presentation(slide_count, picture_bytes=0):
+    """スライド数と埋め込み画像（Pictures ストリーム）のサイズを指定して .ppt と本文の行を生成"""
+    slides = []
+    for n in range(slide_count):
+        placeholders, text_boxes = SLIDE_TEMPLATES[n % len(SLIDE_TEMPLATES)]
+        slides.append(([text.format(n=n + 1) for text in placeholders], [text.format(n=n + 1) for text in text_boxes]))
+    document, current_user = build_powerpoint_document(slides)
+    expected = [line for placeholders, text_boxes in slides for text in placeholders + text_boxes for line in text.split("\n")]
+    streams = [("Current User", current_user), ("PowerPoint Document", document)]
+    if picture_bytes:
+        streams.append(("Pictures", random.Random(0).randbytes(picture_bytes)))
+    return build_compound_file(streams), expected
+
+
+# --- 計測 ---
+
+READABLE_PATTERN = re.compile(r'[\w\s　-ヿ一-鿿.,!?;:()\-、。]')
+
+
+def quality(text, expected):
+    """本文の行がどれだけ含まれるか（再現率）と、読み取り可能な文字の割合"""
+    normalized = re.sub(r'\s+', ' ', text)
+    found = sum(1 for line in expected if re.sub(r'\s+', ' ', line).strip() in normalized) if expected else None
+    readable = len(READABLE_PATTERN.findall(text)) / len(text) if text else 0.0
+    return {
+        "recall": round(found / len(expected), 3) if expected else None,
+        "readable_ratio": round(readable, 3),
+        "chars": len(text)
+    }
+
+
+def load_corpus(corpus_dir):
+    corpus = {}
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.lower().endswith('.ppt'):
+            with open(os.path.join(corpus_dir, name), 'rb') as f:
+                corpus[name] = (f.read(), [])
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', help="実際の .ppt ファイルを置いたディレクトリ")
+    parser.add_argument('--number', type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+    else:
+        corpus = {f"generated-{count}-slides.ppt": make_presentation(count) for count in (5, 50, 300)}
+        corpus["generated-50-slides-2mb-pictures.ppt"] = make_presentation(50, picture_bytes=2 * 1024 * 1024)
+
+    report = {}
+    for name, (content, expected) in corpus.items():
+        report[name] = {"bytes": len(content)}
+        for label, extract in (("legacy", legacy_extract_text_from_ppt), ("ole2", extract_text_from_ppt_legacy)):
+            seconds = timeit.timeit(lambda: extract(content), number=args.number) / args.number
+            report[name][label] = {"ms": round(seconds * 1000, 2), **quality(extract(content), expected)}
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
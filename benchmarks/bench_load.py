@@ -0,0 +1,447 @@
+"""lambda_handler の負荷試験・ベンチマーク
+
+API Gateway 形式の合成イベント（履歴が伸びていくチャット、資料付きチャット、
+サイズ別の PDF / PPTX / DOCX / PPT のアップロード、記述問題の採点、問題集の生成）で
+lambda_handler を呼び出し、シナリオごとのレイテンシ（p50/p95/p99）、スループット、
+ピークRSS、段階ごとの処理時間（EMFのメトリクス）をJSONで出力する。
+
+Bedrockの呼び出しは、応答時間のばらつきとスロットリングを注入できる偽のクライアントで置き換えるため、
+AWSアカウントやネットワークは不要。シナリオごとに別のPythonプロセスで実行するため、
+ピークRSSやキャッシュの状態は他のシナリオの影響を受けない。
+--output に保存したJSONを --baseline に指定すると、p50/p95 の変化率も出力する（コミット間の比較用）。
+
+    python benchmarks/bench_load.py [--requests 30] [--concurrency 1] [--latency-ms 300]
+        [--jitter-ms 100] [--throttle-rate 0.05] [--scenarios chat,upload-pdf-large]
+        [--warm-cache] [--output result.json] [--baseline previous.json]
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(BENCH_DIR, '..', 'lambda')
+
+# アップロードするファイルのサイズ（ページ・スライド・段落の数）
+FIXTURE_SIZES = {"small": 5, "large": 200}
+
+PARAGRAPHS = [
+    "光合成は、光エネルギーを用いて二酸化炭素と水から糖を合成し、酸素を放出する反応である。",
+    "明反応は葉緑体のチラコイド膜で起こり、ATPとNADPHが作られる。",
+    "Calvin cycle fixes carbon dioxide in the stroma using ATP and NADPH from the light reactions.",
+    "細胞呼吸では、解糖系・クエン酸回路・電子伝達系を経てATPが合成される。",
+    "DNAの情報はmRNAに転写され、リボソームでタンパク質に翻訳される。"
+]
+
+
+# --- 偽のBedrockクライアント ---
+
+class FakeClientError(Exception):
+    """botocore の ClientError と同じく response にエラーコードを持つ例外"""
+
+    def __init__(self, code):
+        super().__init__(f"An error occurred ({code}) when calling the InvokeModel operation")
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeBedrock:
+    """応答時間（平均 ± ジッター）とスロットリングの発生率を指定できる偽のBedrockクライアント"""
+
+    def __init__(self, latency_ms=300.0, jitter_ms=100.0, throttle_rate=0.0, output_chars=400, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self.output_chars = output_chars
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.injected_throttles = 0
+
+    def wait(self):
+        with self.lock:
+            self.calls += 1
+            throttled = self.random.random() < self.throttle_rate
+            delay = max(0.0, self.random.uniform(self.latency_ms - self.jitter_ms, self.latency_ms + self.jitter_ms))
+            if throttled:
+                self.injected_throttles += 1
+        if throttled:
+            # スロットリングは即座に返る
+            raise FakeClientError('ThrottlingException')
+        time.sleep(delay / 1000)
+
+    def generate(self, prompt):
+        """プロンプトの種類に応じた応答（問題集はJSON、採点は得点付きの講評、それ以外は一定長の文章）"""
+        if "JSONのみを出力" in prompt:
+            if "記述問題" in prompt:
+                item = {"question": "光合成の明反応と暗反応の違いを説明せよ。", "model_answer": PARAGRAPHS[1],
+                        "points": ["明反応の場所", "生成物"]}
+            else:
+                answer = ["A", "C"] if "複数選択" in prompt else ["B"]
+                item = {"question": "光合成について正しいものはどれか。", "options": PARAGRAPHS[:4],
+                        "answer": answer, "explanation": PARAGRAPHS[0]}
+            questions = [dict(item, question=f"{item['question']}（{n + 1}）") for n in range(4)]
+            return json.dumps({"questions": questions}, ensure_ascii=False)[1:]
+        if "記述問題の回答を採点" in prompt:
+            return "得点: 80/100点\n\n各ポイントの評価:\n- ポイント1: ○\n\n総合評価:\n" + PARAGRAPHS[0]
+        text = "".join(PARAGRAPHS)
+        return (text * (self.output_chars // len(text) + 1))[:self.output_chars]
+
+    def respond(self, body):
+        payload = json.loads(body)
+        prompt = "".join(block.get("text", "") for msg in payload["messages"] for block in msg["content"])
+        return self.generate(prompt), {"inputTokens": len(body) // 3, "outputTokens": self.output_chars // 2}
+
+    def invoke_model(self, modelId, body, contentType=None, **kwargs):
+        self.wait()
+        text, usage = self.respond(body)
+        response_body = {"output": {"message": {"content": [{"text": text}]}}, "usage": usage}
+        return {"body": io.BytesIO(json.dumps(response_body).encode('utf-8'))}
+
+
+# --- アップロードするファイルの生成 ---
+
+def make_pdf(pages):
+    """1ページに複数行のテキストを含むPDFを生成"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        lines = [f"Page {page + 1}: photosynthesis converts light energy into chemical energy. Line {i}" for i in range(40)]
+        content = "BT /F1 10 Tf 50 760 Td 14 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {len(objects)} 0 R "
+                       "/Resources << /Font << /F1 3 0 R >> >> >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    output = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n"
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    output += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n"
+    return output.encode('latin-1')
+
+
+def make_pptx(slides):
+    from pptx import Presentation
+    presentation = Presentation()
+    for n in range(slides):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = f"第{n + 1}章"
+        slide.placeholders[1].text = "\n".join(PARAGRAPHS)
+    output = io.BytesIO()
+    presentation.save(output)
+    return output.getvalue()
+
+
+def make_docx(pages):
+    from docx import Document
+    document = Document()
+    for n in range(pages):
+        document.add_heading(f"第{n + 1}節", level=2)
+        for paragraph in PARAGRAPHS:
+            document.add_paragraph(paragraph)
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def make_ppt(slides):
+    from bench_legacy_ppt import make_presentation
+    return make_presentation(slides)[0]
+
+
+FIXTURES = {
+    "pdf": (make_pdf, "application/pdf"),
+    "pptx": (make_pptx, "application/vnd.openxmlformats-officedocument.presentationml.presentation"),
+    "docx": (make_docx, "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    "ppt": (make_ppt, "application/vnd.ms-powerpoint")
+}
+
+
+# --- シナリオ ---
+
+def api_event(path, body):
+    return {"httpMethod": "POST", "path": path, "resource": path, "body": json.dumps(body, ensure_ascii=False)}
+
+
+def upload_events(file_format, size):
+    def build(requests):
+        make, file_type = FIXTURES[file_format]
+        body = {
+            "file": base64.b64encode(make(FIXTURE_SIZES[size])).decode('ascii'),
+            "fileName": f"sample-{size}.{file_format}",
+            "fileType": file_type
+        }
+        return [api_event("/upload", body) for _ in range(requests)]
+    return build
+
+
+def chat_events(requests):
+    """1つの会話で履歴が伸びていくチャット（k番目のリクエストは k-1 往復分の履歴を送る）"""
+    events = []
+    history = []
+    for n in range(requests):
+        message = f"光合成について質問{n + 1}です。明反応と暗反応の違いを教えてください。"
+        events.append(api_event("/chat", {"message": message, "conversationHistory": list(history)}))
+        history += [{"role": "user", "content": message}, {"role": "assistant", "content": PARAGRAPHS[n % 5] * 4}]
+    return events
+
+
+def long_history_chat_events(requests):
+    history = []
+    for n in range(100):
+        history += [{"role": "user", "content": f"質問{n + 1}: " + PARAGRAPHS[n % 5]},
+                    {"role": "assistant", "content": PARAGRAPHS[(n + 1) % 5] * 4}]
+    return [api_event("/chat", {"message": "これまでの内容をまとめてください。", "conversationHistory": history})
+            for _ in range(requests)]
+
+
+def stored_document_ids():
+    """資料付きのシナリオ用に、PDFとDOCXを文書ストアに保存して文書IDを返す"""
+    import index
+    document_ids = []
+    for file_format in ("pdf", "docx"):
+        make, file_type = FIXTURES[file_format]
+        result = index.extract_and_store(make(FIXTURE_SIZES["large"]), file_type, f"material.{file_format}",
+                                         index.MAX_EXTRACTED_CHARS)
+        document_ids.append(result["document_id"])
+    return document_ids
+
+
+def document_chat_events(path):
+    def build(requests):
+        document_ids = stored_document_ids()
+        return [api_event(path, {"message": f"明反応で作られる物質は何ですか（{n + 1}）", "conversationHistory": [],
+                                 "documentIds": document_ids}) for n in range(requests)]
+    return build
+
+
+def grading_info(n):
+    return {
+        "userAnswer": f"明反応では光エネルギーでATPとNADPHが作られ、暗反応で二酸化炭素が固定される。（{n + 1}）",
+        "question": {"question": "光合成の明反応と暗反応の違いを説明せよ。"},
+        "points": ["明反応の場所と生成物", "暗反応での炭素の固定"],
+        "explanation": PARAGRAPHS[1]
+    }
+
+
+def grade_events(requests):
+    return [api_event("/grade", grading_info(n)) for n in range(requests)]
+
+
+def grade_batch_events(requests):
+    return [api_event("/grade/batch", {"answers": [grading_info(n * 5 + i) for i in range(5)]}) for n in range(requests)]
+
+
+def qa_events(requests):
+    document_ids = stored_document_ids()
+    return [api_event("/qa", {"documentIds": document_ids, "difficulty": "中"}) for _ in range(requests)]
+
+
+SCENARIOS = {
+    "chat": chat_events,
+    "chat-long-history": long_history_chat_events,
+    "chat-documents": document_chat_events("/chat"),
+    **{f"upload-{file_format}-{size}": upload_events(file_format, size)
+       for file_format in FIXTURES for size in FIXTURE_SIZES},
+    "grade": grade_events,
+    "grade-batch": grade_batch_events,
+    "qa": qa_events
+}
+
+
+# --- 計測（子プロセス） ---
+
+def percentile(values, q):
+    """最近順位法によるパーセンタイル"""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, -(-len(ordered) * q // 100) - 1))]
+
+
+def latency_summary(values):
+    return {
+        "p50": round(percentile(values, 50), 1),
+        "p95": round(percentile(values, 95), 1),
+        "p99": round(percentile(values, 99), 1),
+        "mean": round(statistics.mean(values), 1),
+        "max": round(max(values), 1)
+    }
+
+
+def stage_summary(records):
+    """EMFのメトリクスから段階ごとの処理時間（*Ms）と計測値の平均を求める"""
+    totals = {}
+    for record in records:
+        for name, value in record.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and name != "_aws":
+                totals.setdefault(name, []).append(value)
+    return {name: round(sum(values) / len(records), 2) for name, values in sorted(totals.items())}
+
+
+def run_scenario(name, args):
+    import resource
+
+    import index
+    import metrics
+    from extraction_cache import get_extraction_cache
+    from model_client import ModelClient, set_model_client
+
+    # EMFの出力を標準出力ではなく集計用のリストに送る
+    records = []
+    records_lock = threading.Lock()
+
+    def collect(self):
+        with records_lock:
+            records.append(self.to_emf())
+    metrics.RequestMetrics.emit = collect
+
+    bedrock = FakeBedrock(args.latency_ms, args.jitter_ms, args.throttle_rate, args.output_chars, args.seed)
+    client = ModelClient(bedrock)
+    set_model_client(client)
+
+    events = SCENARIOS[name](args.requests + 1)
+    records.clear()
+
+    def call(event):
+        if not args.warm_cache:
+            # 同じファイルの再アップロードでも毎回抽出を行う
+            get_extraction_cache().clear()
+        started_at = time.perf_counter()
+        response = index.lambda_handler(event, None)
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        return elapsed_ms, response["statusCode"]
+
+    # 最初のリクエスト（モジュールの読み込みなどを含む）は別に記録する
+    first_ms, _ = call(events[0])
+    records.clear()
+
+    from concurrent.futures import ThreadPoolExecutor
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(call, events[1:]))
+    wall_seconds = time.perf_counter() - started_at
+
+    latencies = [elapsed_ms for elapsed_ms, _ in results]
+    errors = sum(1 for _, status in results if status != 200)
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "first_request_ms": round(first_ms, 1),
+        "latency_ms": latency_summary(latencies),
+        "throughput_rps": round(len(results) / wall_seconds, 2),
+        # Linux の ru_maxrss はKB単位
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "stages": stage_summary(records),
+        "bedrock": {**client.stats(), "injected_throttles": bedrock.injected_throttles}
+    }
+
+
+# --- 実行（親プロセス） ---
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    """ベースラインからの p50/p95 の変化率（%）"""
+    changes = {}
+    for name, result in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous or "latency_ms" not in previous or "latency_ms" not in result:
+            continue
+        changes[name] = {
+            key: round((result["latency_ms"][key] / previous["latency_ms"][key] - 1) * 100, 1)
+            for key in ("p50", "p95") if previous["latency_ms"][key]
+        }
+    return changes
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=30, help="シナリオごとのリクエスト数")
+    parser.add_argument('--concurrency', type=int, default=1, help="同時に処理するリクエスト数")
+    parser.add_argument('--latency-ms', type=float, default=300.0, help="偽のBedrockの平均応答時間")
+    parser.add_argument('--jitter-ms', type=float, default=100.0, help="応答時間のばらつき（±）")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="スロットリングを返す割合（0〜1）")
+    parser.add_argument('--output-chars', type=int, default=400, help="偽のBedrockが返す文章の長さ")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scenarios', default=",".join(SCENARIOS), help="カンマ区切りのシナリオ名")
+    parser.add_argument('--warm-cache', action='store_true', help="抽出キャッシュを毎回クリアしない")
+    parser.add_argument('--output', help="結果のJSONを保存するファイル")
+    parser.add_argument('--baseline', help="比較する以前の結果のJSON")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        sys.path.insert(0, LAMBDA_DIR)
+        print(json.dumps(run_scenario(args.child, args), ensure_ascii=False))
+        return
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"不明なシナリオ: {', '.join(unknown)}（選択肢: {', '.join(SCENARIOS)}）")
+
+    report = {
+        "commit": git_commit(),
+        "options": {key: value for key, value in vars(args).items() if key not in ("child", "output", "baseline")},
+        "scenarios": {}
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            AWS_DEFAULT_REGION='us-east-1',
+            DOCUMENT_STORE_BACKEND='sqlite',
+            DOCUMENT_DB_PATH=os.path.join(tmp, 'documents.db'),
+            EXTRACTION_CACHE_PERSISTENT='false',
+            RESPONSE_CACHE_BACKEND='none',
+            JOB_QUEUE_BACKEND='inprocess',
+            METRICS_ENABLED='true',
+            LOG_LEVEL='ERROR'
+        )
+        for key in ('PREWARM_MODULES', 'AWS_LAMBDA_FUNCTION_NAME'):
+            env.pop(key, None)
+
+        for name in names:
+            print(f"{name} ...", file=sys.stderr)
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--child", name],
+                cwd=LAMBDA_DIR, env=env, capture_output=True, text=True
+            )
+            if result.returncode != 0:
+                report["scenarios"][name] = {"error": result.stderr.strip().splitlines()[-1:]}
+                continue
+            report["scenarios"][name] = json.loads(result.stdout.strip().splitlines()[-1])
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report["change_pct"] = compare(report, json.load(f))
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
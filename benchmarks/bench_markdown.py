@@ -0,0 +1,79 @@
+"""マークダウン削除処理のマイクロベンチマーク
+
+従来の5回の re.sub による実装と、1回の走査で処理する markdown_utils の実装について、
+1024トークン程度のチャット・採点応答を模したテキストでの処理時間を比較する。
+
+    python benchmarks/bench_markdown.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+from markdown_utils import MarkdownStreamStripper, remove_markdown_formatting  # noqa: E402
+
+
+def legacy_remove_markdown_formatting(text):
+    """変更前の実装（比較用）"""
+    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
+    text = re.sub(r'\*(.*?)\*', r'\1', text)
+    text = re.sub(r'\*\*\*(.*?)\*\*\*', r'\1', text)
+    text = re.sub(r'`(.*?)`', r'\1', text)
+    text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
+    return text
+
+
+SECTION = """### 問題{n} (4択)
+**光合成**の明反応で生成される物質として正しいものはどれか。*葉緑体*の`チラコイド膜`で起こる反応に注目すること。
+
+A) ATPとNADPH
+B) グルコース
+C) 二酸化炭素
+D) ***デンプン***
+
+**正解: A**
+**解説:** 明反応では光エネルギーを用いてATPとNADPHが合成される。詳しくは[教科書の第3章](https://example.com/ch3)を参照。
+- ポイント1: 光化学系IIで水が分解される
+- ポイント2: 電子伝達系でATPが合成される
+
+"""
+
+
+def make_response(target_tokens=1024):
+    """1024トークン程度の応答テキストを生成"""
+    parts = []
+    n = 1
+    while len("".join(parts)) < target_tokens:
+        parts.append(SECTION.format(n=n))
+        n += 1
+    return "".join(parts)
+
+
+def stream_strip(text, chunk_size=8):
+    stripper = MarkdownStreamStripper()
+    output = [stripper.feed(text[i:i + chunk_size]) for i in range(0, len(text), chunk_size)]
+    output.append(stripper.flush())
+    return "".join(output)
+
+
+def main():
+    text = make_response()
+    number = 2000
+
+    results = {
+        "legacy (5 x re.sub)": timeit.timeit(lambda: legacy_remove_markdown_formatting(text), number=number),
+        "single pass": timeit.timeit(lambda: remove_markdown_formatting(text), number=number),
+        "single pass, streamed (8-char chunks)": timeit.timeit(lambda: stream_strip(text), number=number // 10) * 10,
+    }
+
+    print(f"input: {len(text)} chars, {number} iterations")
+    for name, seconds in results.items():
+        print(f"{name:>40}: {seconds / number * 1e6:8.1f} us/call")
+
+    assert stream_strip(text) == remove_markdown_formatting(text)
+
+
+if __name__ == '__main__':
+    main()
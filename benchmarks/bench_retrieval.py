@@ -0,0 +1,77 @@
+"""ファイル内容をプロンプトに含める方式の比較ベンチマーク
+
+全文を連結する従来方式と、チャンク検索で関連箇所のみを選ぶ方式について、
+プロンプトの文字数・推定トークン数・構築時間を比較する。
+
+    python benchmarks/bench_retrieval.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+from retrieval import build_index, select_context  # noqa: E402
+from tokens import estimate_tokens  # noqa: E402
+
+TOPICS = ["光合成", "細胞分裂", "遺伝子", "酵素", "生態系", "進化", "免疫", "神経", "ホルモン", "代謝"]
+FILLER = "この章では基本的な概念と具体例を説明し、演習問題を通じて理解を深める。"
+
+
+def make_document(num_paragraphs, seed):
+    """講義資料を模した合成テキストを生成"""
+    rng = random.Random(seed)
+    paragraphs = []
+    for i in range(num_paragraphs):
+        topic = rng.choice(TOPICS)
+        paragraphs.append(f"第{i + 1}節 {topic}について。{topic}は重要なテーマである。{FILLER * rng.randint(2, 6)}")
+    return "\n".join(paragraphs)
+
+
+def legacy_prompt(files, message):
+    context_message = "アップロードされたファイル情報を参考に回答してください。\n\n"
+    for name, text in files:
+        context_message += f"ファイル名: {name}\n"
+        context_message += f"抽出テキスト: {text}\n\n"
+    return context_message + f"ユーザーの質問: {message}"
+
+
+def retrieval_prompt(indexes, message, token_budget):
+    context_message = "アップロードされたファイル情報を参考に回答してください。\n\n"
+    for name, chunks in select_context(indexes, message, token_budget):
+        context_message += f"ファイル名: {name}\n"
+        context_message += f"抽出テキスト: {chr(10).join(chunks)}\n\n"
+    return context_message + f"ユーザーの質問: {message}"
+
+
+def timed(func, repeat):
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - started_at) / repeat * 1000
+
+
+def main():
+    message = "酵素の働きについて説明してください"
+    token_budget = 3000
+    repeat = 20
+
+    print(f"{'files':>5} {'chars/file':>10} | {'legacy tokens':>13} {'ms':>6} | "
+          f"{'retrieval tokens':>16} {'ms':>6} | {'index build ms':>14}")
+    for num_files, num_paragraphs in [(1, 50), (1, 300), (3, 300), (5, 500)]:
+        files = [(f"lecture{i}.pdf", make_document(num_paragraphs, i)) for i in range(num_files)]
+
+        started_at = time.perf_counter()
+        indexes = [(name, build_index(text)) for name, text in files]
+        build_ms = (time.perf_counter() - started_at) * 1000
+
+        legacy, legacy_ms = timed(lambda: legacy_prompt(files, message), repeat)
+        selected, retrieval_ms = timed(lambda: retrieval_prompt(indexes, message, token_budget), repeat)
+
+        print(f"{num_files:>5} {len(files[0][1]):>10} | {estimate_tokens(legacy):>13} {legacy_ms:>6.2f} | "
+              f"{estimate_tokens(selected):>16} {retrieval_ms:>6.2f} | {build_ms:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
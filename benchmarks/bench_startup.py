@@ -0,0 +1,148 @@
+"""コールドスタートのベンチマーク
+
+新しいPythonプロセスごとに index の読み込み時間と、ルートごと（/chat, /upload）の
+最初のリクエストと2回目のリクエストの処理時間を計測し、JSONで出力する。
+Bedrockの呼び出しは偽のクライアントで置き換えるため、ネットワークには接続しない。
+index の読み込み時間の中央値が予算を超えた場合は終了コード1で終了する。
+
+    python benchmarks/bench_startup.py [--runs 5] [--import-budget-ms 150]
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda')
+
+# 子プロセスで実行するコード（argv: ルート名, リクエストボディのファイル）
+CHILD = r'''
+import io, json, sys, time
+started_at = time.perf_counter()
+import index
+import_ms = (time.perf_counter() - started_at) * 1000
+
+import model_client
+
+class FakeBedrock:
+    def invoke_model(self, **kwargs):
+        body = {"output": {"message": {"content": [{"text": "こんにちは。ご質問をどうぞ。"}]}},
+                "usage": {"inputTokens": 10, "outputTokens": 10}}
+        return {"body": io.BytesIO(json.dumps(body).encode("utf-8"))}
+
+# 実際のクライアント作成（boto3の読み込みを含む）の時間は別に計測し、呼び出しは偽のクライアントで行う
+started_at = time.perf_counter()
+model_client.get_model_client()
+client_ms = (time.perf_counter() - started_at) * 1000
+model_client.set_model_client(model_client.ModelClient(FakeBedrock()))
+
+path = sys.argv[1]
+with open(sys.argv[2], encoding="utf-8") as f:
+    event = {"httpMethod": "POST", "path": path, "resource": path, "body": f.read()}
+
+timings = []
+for _ in range(2):
+    started_at = time.perf_counter()
+    response = index.lambda_handler(event, None)
+    timings.append((time.perf_counter() - started_at) * 1000)
+    assert response["statusCode"] == 200, response
+
+print(json.dumps({"import_ms": import_ms, "client_ms": client_ms,
+                  "first_request_ms": timings[0], "second_request_ms": timings[1]}))
+'''
+
+
+def make_pdf(lines):
+    """テキストを含む最小限のPDFを生成"""
+    content = "BT /F1 12 Tf 72 720 Td 14 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        "/Resources << /Font << /F1 5 0 R >> >> >>",
+        f"<< /Length {len(content)} >>\nstream\n{content}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    output = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n"
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    output += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n"
+    return output.encode('latin-1')
+
+
+def scenarios():
+    pdf = make_pdf([f"Photosynthesis converts light energy into chemical energy. Line {i}" for i in range(40)])
+    return {
+        "chat": ("/chat", {"message": "光合成について説明してください", "conversationHistory": []}),
+        "upload": ("/upload", {
+            "file": base64.b64encode(pdf).decode('ascii'),
+            "fileName": "sample.pdf",
+            "fileType": "application/pdf"
+        })
+    }
+
+
+def run_once(path, body_file, env):
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, path, body_file],
+        cwd=LAMBDA_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    return {
+        key: round(statistics.median(sample[key] for sample in samples), 1)
+        for key in samples[0]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--import-budget-ms', type=float, default=150.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base_env = dict(
+            os.environ,
+            AWS_DEFAULT_REGION='us-east-1',
+            DOCUMENT_STORE_BACKEND='sqlite',
+            DOCUMENT_DB_PATH=os.path.join(tmp, 'documents.db'),
+            EXTRACTION_CACHE_PERSISTENT='false',
+            RESPONSE_CACHE_BACKEND='none',
+            METRICS_ENABLED='false',
+            LOG_LEVEL='WARNING'
+        )
+        base_env.pop('PREWARM_MODULES', None)
+
+        report = {"runs": args.runs, "import_budget_ms": args.import_budget_ms, "routes": {}}
+        for name, (path, body) in scenarios().items():
+            body_file = os.path.join(tmp, f"{name}.json")
+            with open(body_file, 'w', encoding='utf-8') as f:
+                json.dump(body, f, ensure_ascii=False)
+
+            for mode, env in (("lazy", base_env), ("prewarm", dict(base_env, PREWARM_MODULES='all'))):
+                samples = [run_once(path, body_file, env) for _ in range(args.runs)]
+                report["routes"][f"{name} ({mode})"] = summarize(samples)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    import_ms = statistics.median(
+        timings["import_ms"] for key, timings in report["routes"].items() if key.endswith("(lazy)")
+    )
+    if import_ms > args.import_budget_ms:
+        print(f"index の読み込み時間 {import_ms:.1f}ms が予算 {args.import_budget_ms:.0f}ms を超えています", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -39,6 +39,12 @@ Amplify.configure({
   },
 });
 
+// このサイズを超えるファイルは非同期ジョブでテキストを抽出する（2MB）
+const ASYNC_UPLOAD_THRESHOLD = 2 * 1024 * 1024;
+
+// 非同期抽出ジョブの完了を待つ上限（Lambdaのタイムアウト5分に余裕を持たせる）
+const EXTRACTION_JOB_TIMEOUT_MS = 6 * 60 * 1000;
+
 // ChatInterfaceコンポーネントの定義
 function ChatInterface({ signOut, user }) {
   const [messages, setMessages] = useState([]);
@@ -61,6 +67,8 @@ function ChatInterface({ signOut, user }) {
   const [currentChatId, setCurrentChatId] = useState(null);
   const [questionRatings, setQuestionRatings] = useState({}); // 問題の評価を管理
   const messagesEndRef = useRef(null);
+  const syncedSessionsRef = useRef({}); // チャットごとにサーバーへ保存済みのファイル参照と評価
+  const seededSessionsRef = useRef(new Set()); // 会話履歴をサーバーに送信済みのチャット
 
 
 
@@ -79,10 +87,34 @@ function ChatInterface({ signOut, user }) {
   // 初回読み込み時に新しいチャットIDを設定
   useEffect(() => {
     if (!currentChatId) {
-      setCurrentChatId(Date.now());
+      setCurrentChatId(String(Date.now()));
     }
   }, []);
 
+  // ファイル参照と問題の評価が変わったらサーバー側のセッションに保存する
+  // （会話の発言はチャットのリクエストごとにサーバー側で追記される）
+  // ファイルをすべて削除した場合も空のリストを保存し、サーバー側の参照を消す
+  useEffect(() => {
+    if (!currentChatId) return;
+    const update = {
+      uploadedFiles: toFileReferences(uploadedFiles),
+      questionRatings: Object.keys(questionRatings)
+        .filter(key => key.startsWith(`${currentChatId}_`))
+        .reduce((obj, key) => {
+          obj[key] = questionRatings[key];
+          return obj;
+        }, {})
+    };
+    const snapshot = JSON.stringify(update);
+    const previous = syncedSessionsRef.current[currentChatId];
+    syncedSessionsRef.current[currentChatId] = snapshot;
+    // 変更がない場合と、まだ何も保存していない新しいチャットの場合は送信しない
+    if (previous === snapshot) return;
+    if (previous === undefined && update.uploadedFiles.length === 0 && Object.keys(update.questionRatings).length === 0) return;
+    postSessionApi('update', { sessionId: currentChatId, ...update })
+      .catch(err => console.error('Session update error:', err));
+  }, [currentChatId, uploadedFiles, questionRatings]);
+
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   };
@@ -97,13 +129,15 @@ function ChatInterface({ signOut, user }) {
                            'application/vnd.openxmlformats-officedocument.presentationml.presentation', // PPTX
                            'application/vnd.openxmlformats-officedocument.wordprocessingml.document', // DOCX
                            'application/msword', // DOC（古い形式）
+                           'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', // XLSX
+                           'text/csv', // CSV
                            'text/plain']; // TXT
     
-    const supportedExtensions = ['.pdf', '.ppt', '.pptx', '.doc', '.docx', '.txt'];
+    const supportedExtensions = ['.pdf', '.ppt', '.pptx', '.doc', '.docx', '.xlsx', '.csv', '.txt'];
     const fileExtension = file.name.toLowerCase().substring(file.name.lastIndexOf('.'));
     
     if (!supportedTypes.includes(file.type) && !supportedExtensions.includes(fileExtension)) {
-      setError('サポートされていないファイル形式です。PDF、PPT、PPTX、DOC、DOCX、TXTファイルをアップロードしてください。');
+      setError('サポートされていないファイル形式です。PDF、PPT、PPTX、DOC、DOCX、XLSX、CSV、TXTファイルをアップロードしてください。');
       return;
     }
 
@@ -114,49 +148,108 @@ function ChatInterface({ signOut, user }) {
       const session = await Auth.currentSession();
       const idToken = session.getIdToken().getJwtToken();
 
-      // ファイルをBase64に変換
-      const fileReader = new FileReader();
-      fileReader.onload = async (e) => {
-        try {
-          const base64Data = e.target.result.split(',')[1]; // Base64データ部分のみ取得
-
-          const uploadResponse = await axios.post(config.apiEndpoint.replace('/chat', '/upload'), {
-            file: base64Data,
-            fileName: file.name,
-            fileType: file.type
-          }, {
-            headers: {
-              'Authorization': idToken,
-              'Content-Type': 'application/json'
-            }
-          });
-
-          if (uploadResponse.data.success) {
-            const newFile = {
-              name: file.name,
-              extractedText: uploadResponse.data.extracted_text,
-              fileKey: uploadResponse.data.file_key
-            };
-            
-            setUploadedFiles(prev => [...prev, newFile]);
-            
-            // シンプルなアップロード完了メッセージ
-            setMessages(prev => [...prev, 
-              { role: 'system', content: `✅ ファイル "${file.name}" がアップロードされ、テキスト抽出が完了しました。チャットでファイルの内容について質問できます。` }
-            ]);
-          } else {
-            setError('ファイルのアップロードに失敗しました');
-          }
-        } catch (err) {
-          console.error("Upload Error:", err);
-          setError(`ファイルアップロードエラー: ${err.message}`);
-        }
+      const uploadEndpoint = config.apiEndpoint.replace('/chat', '/upload');
+      const authHeaders = {
+        'Authorization': idToken,
+        'Content-Type': 'application/json'
       };
 
-      fileReader.readAsDataURL(file);
+      // 署名付きURLを取得し、ファイルをS3へ直接アップロード
+      const urlResponse = await axios.post(`${uploadEndpoint}/url`, {
+        fileName: file.name,
+        fileType: file.type,
+        fileSize: file.size
+      }, { headers: authHeaders });
+
+      if (!urlResponse.data.success) {
+        setError(urlResponse.data.error || 'ファイルのアップロードに失敗しました');
+        return;
+      }
+
+      await axios.put(urlResponse.data.uploadUrl, file, {
+        headers: { 'Content-Type': urlResponse.data.contentType }
+      });
+
+      // アップロード完了を通知してテキストを抽出
+      // 大きなファイルは非同期ジョブで抽出し、完了までステータスを確認する
+      const useAsync = file.size > ASYNC_UPLOAD_THRESHOLD;
+      const completeResponse = await axios.post(`${uploadEndpoint}/complete`, {
+        objectKey: urlResponse.data.objectKey,
+        fileName: file.name,
+        fileType: file.type,
+        async: useAsync
+      }, { headers: authHeaders });
+
+      let uploadResult = completeResponse.data;
+      if (useAsync && uploadResult.success) {
+        uploadResult = await waitForExtractionJob(`${uploadEndpoint}/status`, uploadResult.jobId, authHeaders);
+      }
+
+      if (uploadResult.success) {
+        const newFile = {
+          name: file.name,
+          extractedText: uploadResult.extracted_text,
+          documentId: uploadResult.document_id,
+          fileKey: uploadResult.file_key
+        };
+        
+        setUploadedFiles(prev => [...prev, newFile]);
+        
+        // シンプルなアップロード完了メッセージ
+        setMessages(prev => [...prev, 
+          { role: 'system', content: `✅ ファイル "${file.name}" がアップロードされ、テキスト抽出が完了しました。チャットでファイルの内容について質問できます。` }
+        ]);
+      } else {
+        setError(uploadResult.error || 'ファイルのアップロードに失敗しました');
+      }
     } catch (err) {
-      console.error("File processing error:", err);
-      setError(`ファイル処理エラー: ${err.message}`);
+      console.error("Upload Error:", err);
+      // 抽出できなかったファイルはサーバーからエラーメッセージが返される
+      setError(`ファイルアップロードエラー: ${err.response?.data?.error || err.message}`);
+    }
+  };
+
+  // 非同期抽出ジョブの完了を待って結果を返す
+  const waitForExtractionJob = async (statusEndpoint, jobId, headers) => {
+    const deadline = Date.now() + EXTRACTION_JOB_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+      await new Promise(resolve => setTimeout(resolve, 2000));
+      const statusResponse = await axios.post(statusEndpoint, { jobId }, { headers });
+      const { status, result, error } = statusResponse.data;
+      if (status === 'done') {
+        return result;
+      }
+      if (status === 'error') {
+        return { success: false, error };
+      }
+    }
+    return { success: false, error: 'テキスト抽出がタイムアウトしました。時間をおいて再度アップロードしてください。' };
+  };
+
+  // サーバー側のチャットセッションAPI（list / get / update / delete）を呼び出す
+  const postSessionApi = async (action, payload = {}) => {
+    const session = await Auth.currentSession();
+    const idToken = session.getIdToken().getJwtToken();
+    const response = await axios.post(config.apiEndpoint.replace('/chat', `/sessions/${action}`), payload, {
+      headers: {
+        'Authorization': idToken,
+        'Content-Type': 'application/json'
+      }
+    });
+    return response.data;
+  };
+
+  // サーバー側に保存済みのファイルは文書IDのみを送信する
+  const toFileReferences = (files) => files.map(file =>
+    file.documentId
+      ? { name: file.name, documentId: file.documentId }
+      : { name: file.name, extractedText: file.extractedText }
+  );
+
+  // 保存期間を過ぎて削除された資料があれば、再アップロードを促す
+  const warnMissingDocuments = (data) => {
+    if (data.missingDocuments && data.missingDocuments.length > 0) {
+      setError(`次の資料は保存期間が過ぎたため参照できませんでした。再度アップロードしてください: ${data.missingDocuments.join(', ')}`);
     }
   };
 
@@ -201,11 +294,19 @@ function ChatInterface({ signOut, user }) {
       const session = await Auth.currentSession();
       const idToken = session.getIdToken().getJwtToken();
 
-      const response = await axios.post(config.apiEndpoint, {
+      // 会話履歴はサーバー側のセッションに保存されているため、今回のメッセージのみ送信する。
+      // ただしセッション導入前にブラウザだけに保存したチャットもあるため、チャットごとの最初の送信では
+      // 会話履歴も送り、サーバーにセッションがない場合はそれで初期化させる
+      const request = {
         message: userMessage,
-        conversationHistory: messages,
-        uploadedFiles: uploadedFiles // アップロードされたファイル情報を含める
-      }, {
+        sessionId: currentChatId,
+        uploadedFiles: toFileReferences(uploadedFiles) // アップロードされたファイル情報を含める
+      };
+      const history = messages.filter(msg => msg.role === 'user' || msg.role === 'assistant');
+      if (history.length > 0 && !seededSessionsRef.current.has(currentChatId)) {
+        request.conversationHistory = history;
+      }
+      const response = await axios.post(config.apiEndpoint, request, {
         headers: {
           'Authorization': idToken,
           'Content-Type': 'application/json'
@@ -213,7 +314,9 @@ function ChatInterface({ signOut, user }) {
       });
 
       if (response.data.success) {
+        seededSessionsRef.current.add(currentChatId);
         setMessages(prev => [...prev, { role: 'assistant', content: response.data.response }]);
+        warnMissingDocuments(response.data);
       } else {
         setError('応答の取得に失敗しました');
       }
@@ -294,142 +397,12 @@ function ChatInterface({ signOut, user }) {
       const session = await Auth.currentSession();
       const idToken = session.getIdToken().getJwtToken();
 
-      // 全ファイルの内容を結合
-      const combinedContent = uploadedFiles.map(file => 
-        `--- ${file.name} ---\n${file.extractedText}`
-      ).join('\n\n');
-
-      const qaPrompt = `以下のファイル内容を基に、難易度「${difficulty}」の問題を10個作成してください。
-
-【作成する問題の構成】
-- 4択問題: 4個
-- 複数選択問題: 4個
-- 記述問題: 2個
-
-【出力形式】
-マークダウン形式で以下のように出力してください：
-
-# 学習問題集
-
-## 難易度: ${difficulty}
-
-### 問題1 (4択)
-質問内容
-
-A) 選択肢1
-B) 選択肢2  
-C) 選択肢3
-D) 選択肢4
-
-**正解: A**
-**解説: 正解の理由を詳しく説明**
-
-### 問題2 (4択)
-質問内容
-
-A) 選択肢1
-B) 選択肢2  
-C) 選択肢3
-D) 選択肢4
-
-**正解: B**
-**解説: 正解の理由を詳しく説明**
-
-### 問題3 (4択)
-質問内容
-
-A) 選択肢1
-B) 選択肢2  
-C) 選択肢3
-D) 選択肢4
-
-**正解: C**
-**解説: 正解の理由を詳しく説明**
-
-### 問題4 (4択)
-質問内容
-
-A) 選択肢1
-B) 選択肢2  
-C) 選択肢3
-D) 選択肢4
-
-**正解: D**
-**解説: 正解の理由を詳しく説明**
-
-### 問題5 (複数選択)
-質問内容（複数の正解があります）
-
-A) 選択肢1
-B) 選択肢2  
-C) 選択肢3
-D) 選択肢4
-
-**正解: A, C**
-**解説: 正解の理由を詳しく説明**
-
-### 問題6 (複数選択)
-質問内容（複数の正解があります）
-
-A) 選択肢1
-B) 選択肢2  
-C) 選択肢3
-D) 選択肢4
-
-**正解: B, D**
-**解説: 正解の理由を詳しく説明**
-
-### 問題7 (複数選択)
-質問内容（複数の正解があります）
-
-A) 選択肢1
-B) 選択肢2  
-C) 選択肢3
-D) 選択肢4
-
-**正解: A, B, C**
-**解説: 正解の理由を詳しく説明**
-
-### 問題8 (複数選択)
-質問内容（複数の正解があります）
-
-A) 選択肢1
-B) 選択肢2  
-C) 選択肢3
-D) 選択肢4
-
-**正解: B, C, D**
-**解説: 正解の理由を詳しく説明**
-
-### 問題9 (記述)
-質問内容
-
-**解答例:**
-記述問題の模範解答
-
-**採点ポイント:**
-- ポイント1
-- ポイント2
-
-### 問題10 (記述)
-質問内容
-
-**解答例:**
-記述問題の模範解答
-
-**採点ポイント:**
-- ポイント1
-- ポイント2
-
----
-
-ファイル内容:
-${combinedContent}`;
-
-      const response = await axios.post(config.apiEndpoint, {
-        message: qaPrompt,
-        conversationHistory: [],
-        uploadedFiles: uploadedFiles
+      // 問題の生成はサーバー側で行う（資料は文書IDで参照し、問題は検証済みのJSONで受け取る）
+      const qaEndpoint = config.apiEndpoint.replace('/chat', '/qa');
+      const response = await axios.post(qaEndpoint, {
+        sessionId: currentChatId,
+        uploadedFiles: toFileReferences(uploadedFiles),
+        difficulty: difficulty
       }, {
         headers: {
           'Authorization': idToken,
@@ -438,10 +411,9 @@ ${combinedContent}`;
       });
 
       if (response.data.success) {
-        setGeneratedQA(response.data.response);
+        setGeneratedQA(response.data.qaText);
         
-        // QAテキストから問題を解析
-        const questions = parseQAText(response.data.response);
+        const questions = response.data.questions;
         setCurrentQuestions(questions);
         
         // QA情報をチャット履歴に保存するため、現在のチャットを更新
@@ -449,8 +421,6 @@ ${combinedContent}`;
         // チャット履歴への自動保存のためにgeneratedQAを設定
         // これによりuseEffectでチャット履歴に保存される
         
-        console.log('QA生成完了。解析された問題数:', questions.length);
-        
         const successMessage = questions.length > 0 
           ? `📝 難易度「${difficulty}」のQA問題集が生成されました！\n\n` +
             `✅ ${questions.filter(q => q.type === 'multiple').length}個の4択問題\n` +
@@ -463,391 +433,18 @@ ${combinedContent}`;
         setMessages(prev => [...prev, 
           { role: 'system', content: successMessage }
         ]);
+        warnMissingDocuments(response.data);
       } else {
         setError('QA生成に失敗しました');
       }
     } catch (err) {
       console.error("QA Generation Error:", err);
-      setError(`QA生成エラー: ${err.message}`);
+      setError(`QA生成エラー: ${err.response?.data?.error || err.message}`);
     } finally {
       setIsGeneratingQA(false);
     }
   };
 
-  // QAテキストを解析して問題オブジェクトに変換
-  const parseQAText = (qaText) => {
-    const questions = [];
-    
-    console.log('QA解析開始。テキストの長さ:', qaText.length);
-    console.log('QAテキストの先頭500文字:', qaText.substring(0, 500));
-    
-    // より多様なパターンで問題を分割（PPTファイル対応強化）
-    const problemPatterns = [
-      /###?\s*問題\s*(\d+)/gi,
-      /##?\s*問題\s*(\d+)/gi,
-      /問題\s*(\d+)/gi,
-      /(\d+)[.．]\s*/gi,
-      /Question\s*(\d+)/gi
-    ];
-    
-    let sections = [];
-    let maxSections = 0;
-    
-    // 最も多くの問題を認識できるパターンを選択
-    problemPatterns.forEach((pattern, patternIndex) => {
-      pattern.lastIndex = 0; // グローバル正規表現のリセット
-      const testSections = qaText.split(pattern);
-      console.log(`パターン${patternIndex + 1}での分割結果:`, testSections.length, '個のセクション');
-      
-      if (testSections.length > maxSections) {
-        maxSections = testSections.length;
-        sections = testSections;
-      }
-    });
-    
-    console.log('最終的な分割結果:', sections.length, '個のセクション');
-    
-    if (sections.length <= 1) {
-      console.warn('問題の分割ができませんでした。別の方法を試します...');
-      
-      // フォールバック: より単純な分割方法を試す
-      const simpleSplit = qaText.split(/(?=\d+[.．])/);
-      if (simpleSplit.length > 1) {
-        sections = simpleSplit;
-        console.log('フォールバック分割で', sections.length, '個のセクションを取得');
-      } else {
-        // より積極的なフォールバック処理
-        console.log('数字パターンでも分割できません。内容を詳細に分析します...');
-        
-        // 内容分析のため先頭部分をログ出力
-        const lines = qaText.split('\n');
-        console.log('QAテキストの全行数:', lines.length);
-        lines.slice(0, 20).forEach((line, idx) => {
-          console.log(`行${idx + 1}: "${line}"`);
-        });
-        
-        // 特定のキーワードで分割を試す
-        const keywordSplit = qaText.split(/(?=.*(問題|Question|選択肢|回答|答え|正解))/);
-        if (keywordSplit.length > 1) {
-          sections = keywordSplit.filter(s => s.trim());
-          console.log('キーワード分割で', sections.length, '個のセクションを取得');
-        } else {
-          // 最終フォールバック: 改行ベースの分割
-          const lines = qaText.split('\n').filter(line => line.trim());
-          if (lines.length > 0) {
-            sections = [qaText]; // 全体を1つのセクションとして処理
-            console.log('全体を1つのセクションとして処理します');
-          } else {
-            return questions;
-          }
-        }
-      }
-    }
-    
-    // 問題セクションを解析
-    sections.forEach((sectionContent, index) => {
-      if (!sectionContent || !sectionContent.trim()) return;
-      
-      console.log(`セクション${index}の解析開始:`, sectionContent.substring(0, 200));
-      console.log(`セクション${index}の全内容:\n`, sectionContent);
-      
-      const lines = sectionContent.trim().split('\n').filter(line => line.trim());
-      if (lines.length === 0) return;
-      
-      console.log(`セクション${index}の行数:`, lines.length);
-      lines.forEach((line, lineIdx) => {
-        console.log(`  行${lineIdx + 1}: "${line}"`);
-      });
-      
-      // 問題タイプを判定（より柔軟に）
-      const hasChoices = /[A-D][)）]\s*/.test(sectionContent);
-      const hasMultipleChoice = (sectionContent.match(/[A-D][)）]/g) || []).length >= 4;
-      const isMultipleSelectQuestion = /複数選択/.test(sectionContent);
-      const hasCorrectAnswer = /正解|答え|回答/.test(sectionContent);
-      const hasExplanation = /解説|説明/.test(sectionContent);
-      const hasWrittenElements = /記述|解答例|採点ポイント|模範解答/.test(sectionContent);
-      
-      console.log('問題タイプ判定:', {
-        hasChoices,
-        hasMultipleChoice,
-        isMultipleSelectQuestion,
-        hasCorrectAnswer,
-        hasExplanation,
-        hasWrittenElements,
-        choiceCount: (sectionContent.match(/[A-D][)）]/g) || []).length
-      });
-      
-      if (hasMultipleChoice && hasChoices) {
-        // 4択問題または複数選択問題の解析
-        const questionType = isMultipleSelectQuestion ? '複数選択問題' : '4択問題';
-        console.log(`${questionType}として解析中...`);
-        
-        // 問題文を抽出（より柔軟なアプローチ）
-        let questionText = '';
-        
-        // 1. 最初に全体から問題文を探す（選択肢より前の部分）
-        const beforeChoicesMatch = sectionContent.match(/^(.*?)(?=[A-D][)）])/s);
-        if (beforeChoicesMatch) {
-          const beforeChoices = beforeChoicesMatch[1].trim();
-          const beforeChoicesLines = beforeChoices.split('\n').filter(line => line.trim());
-          
-          // 問題文らしい行を探す（最長の行、または疑問符で終わる行を優先）
-          let bestQuestion = '';
-          for (let line of beforeChoicesLines) {
-            const cleanLine = line.trim()
-              .replace(/^\d+[.．]\s*/, '')
-              .replace(/^(問題|Question)\s*\d*[.．:：]?\s*/i, '')
-              .replace(/^\(4択\)/, '')
-              .replace(/^4択問題/, '')
-              .replace(/^\s*\(.*?\)/, '')
-              .trim();
-            
-            if (cleanLine && 
-                !cleanLine.match(/^[A-D][)）]/) && 
-                !cleanLine.match(/^(正解|答え|解説|説明)[：:]/) &&
-                !cleanLine.match(/^(学習問題集|難易度|###|##|#)/) &&
-                cleanLine.length > 10) { // 十分な長さがある
-              
-              if (cleanLine.includes('？') || cleanLine.includes('?') || 
-                  cleanLine.includes('ですか') || cleanLine.includes('でしょうか') ||
-                  cleanLine.length > bestQuestion.length) {
-                bestQuestion = cleanLine;
-              }
-            }
-          }
-          questionText = bestQuestion;
-        }
-        
-        // 2. 上記で見つからない場合は、従来の方法でフォールバック
-        if (!questionText) {
-          for (let line of lines) {
-            if (line.trim() && 
-                !line.match(/^[A-D][)）]/) && 
-                !line.match(/^(問題|Question)/i) &&
-                !line.match(/^(正解|答え|解説|説明)[：:]/)) {
-              questionText = line.trim()
-                .replace(/^\d+[.．]\s*/, '')
-                .replace(/^\(4択\)/, '')
-                .replace(/^4択問題/, '')
-                .replace(/^\s*\(.*?\)/, '')
-                .trim();
-              if (questionText.length > 5) break; // 短すぎる行は無視
-            }
-          }
-        }
-        
-        console.log('抽出された問題文:', questionText);
-        
-        const options = [];
-        let correctAnswer = '';
-        let explanation = '';
-        
-        // 選択肢を取得（より柔軟なパターン）
-        const choicePatterns = [
-          /([A-D])[)）]\s*(.+)/g,
-          /([A-D])[:：]\s*(.+)/g,
-          /([A-D])\s*[.．]\s*(.+)/g
-        ];
-        
-        console.log('選択肢抽出を開始...');
-        
-        choicePatterns.forEach((pattern, patternIdx) => {
-          pattern.lastIndex = 0;
-          console.log(`パターン${patternIdx + 1} (${pattern}) で検索中...`);
-          let match;
-          let matchCount = 0;
-          while ((match = pattern.exec(sectionContent)) !== null) {
-            matchCount++;
-            console.log(`  マッチ${matchCount}: ${match[1]} -> "${match[2].trim()}"`);
-            const choice = `${match[1]}) ${match[2].trim()}`;
-            if (!options.some(opt => opt.startsWith(match[1]))) {
-              options.push(choice);
-              console.log(`    選択肢に追加: "${choice}"`);
-            } else {
-              console.log(`    既存の選択肢のためスキップ`);
-            }
-          }
-          console.log(`パターン${patternIdx + 1}での総マッチ数:`, matchCount);
-        });
-        
-        console.log('最終的に抽出された選択肢:', options);
-        
-        // 正解を取得（より柔軟なパターン）
-        console.log('正解抽出を開始...');
-        const correctPatterns = [
-          /\*\*正解[：:]\s*([A-D](?:\s*,\s*[A-D])*)\*\*/i,  // 複数選択対応
-          /正解[：:]\s*([A-D](?:\s*,\s*[A-D])*)/i,
-          /答え[：:]\s*([A-D](?:\s*,\s*[A-D])*)/i,
-          /回答[：:]\s*([A-D](?:\s*,\s*[A-D])*)/i,
-          /([A-D](?:\s*,\s*[A-D])*)\s*が正解/i,
-          /正解は\s*([A-D](?:\s*,\s*[A-D])*)/i,
-          /\*\*([A-D](?:\s*,\s*[A-D])*)\*\*/i,
-          /正しいのは\s*([A-D](?:\s*,\s*[A-D])*)/i
-        ];
-        
-        for (const pattern of correctPatterns) {
-          console.log(`正解パターン ${pattern} で検索中...`);
-          const match = sectionContent.match(pattern);
-          if (match) {
-            correctAnswer = match[1].toUpperCase().replace(/\s+/g, '');
-            console.log('正解を発見:', correctAnswer, 'マッチした文字列:', match[0]);
-            break;
-          }
-        }
-        
-        // 解説を取得
-        const explanationPatterns = [
-          /\*\*解説[：:]\*\*\s*(.+?)(?=###|##|\*\*|$)/si,
-          /解説[：:]\s*(.+?)(?=###|##|問題|$)/si,
-          /説明[：:]\s*(.+?)(?=###|##|問題|$)/si
-        ];
-        
-        for (const pattern of explanationPatterns) {
-          const match = sectionContent.match(pattern);
-          if (match) {
-            explanation = match[1].trim().replace(/\n+$/, '');
-            break;
-          }
-        }
-        
-        if (options.length >= 2 && correctAnswer) {
-          // 問題文が空の場合は、デフォルトの問題文を設定
-          if (!questionText || questionText.trim() === '') {
-            questionText = '以下の選択肢から正しいものを選んでください。';
-            console.log('問題文が空のため、デフォルト問題文を設定:', questionText);
-          }
-          
-          // 選択肢が4個未満の場合は警告するが、問題として追加
-          if (options.length < 4) {
-            console.warn('選択肢が4個未満です:', options.length);
-          }
-          
-          const newQuestion = {
-            type: isMultipleSelectQuestion ? 'multiple-select' : 'multiple',
-            question: questionText,
-            options: options,
-            correctAnswer: correctAnswer,
-            explanation: explanation
-          };
-          
-          questions.push(newQuestion);
-          
-          console.log(`${questionType}を追加しました:`, newQuestion);
-        } else {
-          console.warn(`${questionType}として処理できませんでした:`, {
-            originalQuestionText: questionText || '(なし)',
-            optionsCount: options.length,
-            correctAnswer: correctAnswer || '(なし)',
-            hasExplanation: !!explanation
-          });
-          console.warn(`${questionType}の必須要素が不足:`, {
-            optionsCount: options.length,
-            correctAnswer: !!correctAnswer,
-            minimumRequirement: 'options >= 2 && correctAnswer'
-          });
-        }
-        
-      } else if (hasWrittenElements || lines.length > 0) {
-        // 記述問題の解析
-        console.log('記述問題として解析中...');
-        
-        // 記述問題の問題文を抽出（より柔軟なアプローチ）
-        let writtenQuestionText = '';
-        
-        // 全体から問題文を探す
-        const allLines = sectionContent.split('\n').filter(line => line.trim());
-        for (let line of allLines) {
-          const cleanLine = line.trim()
-            .replace(/^\d+[.．]\s*/, '')
-            .replace(/^(問題|Question)\s*\d*[.．:：]?\s*/i, '')
-            .replace(/^\(記述\)/, '')
-            .replace(/^記述問題/, '')
-            .replace(/^\s*\(.*?\)/, '')
-            .trim();
-          
-          if (cleanLine && 
-              !cleanLine.match(/^(正解|答え|解説|説明|解答例|採点ポイント)[：:]/) &&
-              !cleanLine.match(/^(学習問題集|難易度|###|##|#)/) &&
-              cleanLine.length > 5) { // 十分な長さがある
-            writtenQuestionText = cleanLine;
-            console.log('記述問題の問題文候補:', writtenQuestionText);
-            break;
-          }
-        }
-        
-        console.log('記述問題のクリーンアップ後問題文:', writtenQuestionText);
-        
-        let explanation = '';
-        const points = [];
-        
-        // 解答例を取得
-        const answerPatterns = [
-          /\*\*解答例[：:]\*\*\s*(.+?)(?=\*\*採点ポイント[：:]|\*\*|###|##|$)/si,
-          /解答例[：:]\s*(.+?)(?=採点ポイント[：:]|###|##|$)/si,
-          /模範解答[：:]\s*(.+?)(?=採点ポイント[：:]|###|##|$)/si
-        ];
-        
-        for (const pattern of answerPatterns) {
-          const match = sectionContent.match(pattern);
-          if (match) {
-            explanation = match[1].trim();
-            break;
-          }
-        }
-        
-        // 採点ポイントを取得
-        const pointsPatterns = [
-          /\*\*採点ポイント[：:]\*\*\s*(.+?)(?=###|##|$)/si,
-          /採点ポイント[：:]\s*(.+?)(?=###|##|$)/si,
-          /評価基準[：:]\s*(.+?)(?=###|##|$)/si
-        ];
-        
-        for (const pattern of pointsPatterns) {
-          const match = sectionContent.match(pattern);
-          if (match) {
-            const pointsText = match[1];
-            const pointLines = pointsText.split('\n').filter(line => 
-              line.trim() && (line.trim().startsWith('-') || line.trim().startsWith('•') || line.trim().startsWith('・') || line.trim().match(/^\d+/))
-            );
-            pointLines.forEach(point => {
-              const cleanPoint = point.replace(/^[-•・\d+.]\s*/, '').trim();
-              if (cleanPoint) points.push(cleanPoint);
-            });
-            break;
-          }
-        }
-        
-        // 問題文が空の場合でも、記述要素があれば問題として扱う
-        if (!writtenQuestionText && (hasWrittenElements || explanation || points.length > 0)) {
-          writtenQuestionText = 'この内容について記述してください。';
-          console.log('記述問題の問題文が空のため、デフォルト問題文を設定:', writtenQuestionText);
-        }
-        
-        if (writtenQuestionText) {
-          const newQuestion = {
-            type: 'written',
-            question: writtenQuestionText,
-            explanation: explanation,
-            points: points
-          };
-          
-          questions.push(newQuestion);
-          
-          console.log('記述問題を追加しました:', newQuestion);
-        } else {
-          console.warn('記述問題として処理できませんでした - 問題文が見つかりません');
-        }
-      }
-    });
-    
-    console.log('最終的に解析された問題数:', questions.length);
-    questions.forEach((q, i) => {
-      console.log(`問題${i + 1}: ${q.type} - ${q.question?.substring(0, 50)}...`);
-    });
-    
-    return questions;
-  };
-
   // チャットで問題に挑戦を開始
   const startQuizInChat = () => {
     if (currentQuestions.length === 0) {
@@ -904,14 +501,9 @@ ${combinedContent}`;
         explanation: question.explanation || ''
       };
       
-      const gradingRequestMessage = `GRADE_ESSAY_ANSWER:${JSON.stringify(gradingRequest)}`;
-      
-      // APIに採点リクエストを送信
-      const response = await axios.post(config.apiEndpoint, {
-        message: gradingRequestMessage,
-        conversationHistory: [],
-        uploadedFiles: uploadedFiles
-      }, {
+      // 採点専用のエンドポイントに送信（チャットの生成を行わないため応答が速い）
+      const gradeEndpoint = config.apiEndpoint.replace('/chat', '/grade');
+      const response = await axios.post(gradeEndpoint, gradingRequest, {
         headers: {
           'Authorization': idToken,
           'Content-Type': 'application/json'
@@ -1290,7 +882,7 @@ ${combinedContent}`;
     }
     
     // 新しいチャットを開始
-    const newChatId = Date.now();
+    const newChatId = String(Date.now());
     setCurrentChatId(newChatId);
     setMessages([]);
     setUploadedFiles([]);
@@ -1364,11 +956,36 @@ ${combinedContent}`;
     return `チャット ${new Date().toLocaleString()}`;
   };
 
-  const loadChatFromHistory = (chatRecord) => {
+  // サーバー側のセッションを履歴の形式で取得する
+  const fetchSessionRecord = async (chatRecord) => {
+    const data = await postSessionApi('get', { sessionId: chatRecord.id });
+    const session = data.session;
+    return {
+      ...chatRecord,
+      messages: session.messages,
+      uploadedFiles: session.uploadedFiles,
+      generatedQA: session.qa ? session.qa.qaText : '',
+      currentQuestions: session.qa ? session.qa.questions : [],
+      questionRatings: session.questionRatings,
+      remote: false
+    };
+  };
+
+  const loadChatFromHistory = async (chatRecord) => {
     // 現在のチャットを保存
     if (messages.length > 0 && currentChatId) {
       saveChatToHistory();
     }
+
+    if (chatRecord.remote) {
+      try {
+        chatRecord = await fetchSessionRecord(chatRecord);
+      } catch (err) {
+        console.error('Session load error:', err);
+        setError(`チャット履歴の読み込みに失敗しました: ${err.message}`);
+        return;
+      }
+    }
     
     // 選択されたチャットを読み込み
     setCurrentChatId(chatRecord.id);
@@ -1407,6 +1024,8 @@ ${combinedContent}`;
 
   const deleteChatFromHistory = (chatId) => {
     setChatHistory(prev => prev.filter(chat => chat.id !== chatId));
+    postSessionApi('delete', { sessionId: chatId })
+      .catch(err => console.error('Session delete error:', err));
     
     if (currentChatId === chatId) {
       createNewChat();
@@ -1419,6 +1038,10 @@ ${combinedContent}`;
   };
 
   const clearChatHistory = () => {
+    chatHistory.forEach(chat => {
+      postSessionApi('delete', { sessionId: chat.id })
+        .catch(err => console.error('Session delete error:', err));
+    });
     setChatHistory([]);
     createNewChat();
     
@@ -1428,11 +1051,49 @@ ${combinedContent}`;
     }]);
   };
 
+  // 他の端末で作成したセッションも表示できるよう、サーバー側の一覧を履歴に加える
+  const refreshChatHistory = async () => {
+    try {
+      const data = await postSessionApi('list');
+      setChatHistory(prev => {
+        const localIds = new Set(prev.map(chat => String(chat.id)));
+        const remoteRecords = data.sessions
+          .filter(session => !localIds.has(session.sessionId))
+          .map(session => ({
+            id: session.sessionId,
+            timestamp: new Date(session.updatedAt * 1000).toISOString(),
+            title: session.title || `チャット ${new Date(session.createdAt * 1000).toLocaleString()}`,
+            messages: [],
+            uploadedFiles: [],
+            messageCount: session.messageCount,
+            fileCount: session.fileCount,
+            hasQA: session.hasQA,
+            remote: true
+          }));
+        return [...prev, ...remoteRecords];
+      });
+    } catch (err) {
+      console.error('Session list error:', err);
+    }
+  };
+
   const toggleChatHistory = () => {
+    if (!showChatHistory) {
+      refreshChatHistory();
+    }
     setShowChatHistory(!showChatHistory);
   };
 
-  const downloadQAFromChat = (chatRecord) => {
+  const downloadQAFromChat = async (chatRecord) => {
+    if (chatRecord.remote) {
+      try {
+        chatRecord = await fetchSessionRecord(chatRecord);
+      } catch (err) {
+        console.error('Session load error:', err);
+        setError(`QA問題集の取得に失敗しました: ${err.message}`);
+        return;
+      }
+    }
     if (!chatRecord.generatedQA) return;
     
     const blob = new Blob([chatRecord.generatedQA], { type: 'text/markdown' });
@@ -1588,7 +1249,7 @@ ${combinedContent}`;
                           className="file-action-btn preview"
                           onClick={() => {
                             setMessages(prev => [...prev, 
-                              { role: 'system', content: `ファイル "${file.name}" の内容:\n\n${file.extractedText.substring(0, 500)}${file.extractedText.length > 500 ? '...' : ''}` }
+                              { role: 'system', content: `ファイル "${file.name}" の内容:\n\n${(file.extractedText || '（サーバーに保存済み）').substring(0, 500)}${(file.extractedText || '').length > 500 ? '...' : ''}` }
                             ]);
                           }}
                           title="ファイル内容を表示"
@@ -0,0 +1,122 @@
+#lambda/api_responses.py
+import base64
+import gzip
+import json
+import os
+
+from startup import lazy_import
+
+# すべてのレスポンスに付けるCORSヘッダー
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token",
+    "Access-Control-Allow-Methods": "OPTIONS,POST"
+}
+
+# これより小さいレスポンスは圧縮しない（圧縮とBase64化でかえって大きくなるため）
+MIN_COMPRESS_BYTES = int(os.environ.get('RESPONSE_MIN_COMPRESS_BYTES', '1024'))
+
+
+# インストールされていないことが分かった任意の依存パッケージ（毎回の import の失敗を避ける）
+_missing_modules = set()
+
+
+def optional_import(name):
+    """任意の依存パッケージ（orjson / brotli）を読み込む（ない場合は None）"""
+    if name in _missing_modules:
+        return None
+    try:
+        return lazy_import(name)
+    except ImportError:
+        _missing_modules.add(name)
+        return None
+
+
+def dumps(payload):
+    """レスポンスボディのJSON文字列（RESPONSE_JSON=orjson か auto で orjson がある場合は orjson を使う）"""
+    serializer = os.environ.get('RESPONSE_JSON', 'auto')
+    if serializer != 'json':
+        orjson = optional_import('orjson')
+        if orjson is not None:
+            return orjson.dumps(payload).decode('utf-8')
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+
+
+def make_response(status_code, body="", content_type=None):
+    headers = dict(CORS_HEADERS)
+    if content_type:
+        headers["Content-Type"] = content_type
+    return {"statusCode": status_code, "headers": headers, "body": body}
+
+
+def json_response(status_code, payload):
+    return make_response(status_code, dumps(payload), "application/json")
+
+
+def error_response(status_code, message):
+    return json_response(status_code, {"success": False, "error": message})
+
+
+def parse_body(event):
+    """リクエストボディのJSONを解析（バイナリメディアタイプとしてBase64化されている場合は復号する）"""
+    body = event.get("body") or "{}"
+    if event.get("isBase64Encoded"):
+        body = base64.b64decode(body).decode('utf-8')
+    return json.loads(body)
+
+
+def get_header(event, name):
+    """リクエストヘッダーの値（名前の大文字・小文字は区別しない）"""
+    for key, value in (event.get("headers") or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+
+def accepted_encodings(event):
+    """Accept-Encoding で受け入れられる圧縮形式（q=0 のものを除く）"""
+    encodings = set()
+    for item in (get_header(event, "Accept-Encoding") or "").split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        params = params.strip()
+        try:
+            quality = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            quality = 1.0
+        if name and quality > 0:
+            encodings.add(name)
+    return encodings
+
+
+def compress_response(result, event):
+    """Accept-Encoding に応じてレスポンスボディを br / gzip で圧縮する
+
+    圧縮したボディはBase64で返す（API Gateway のバイナリメディアタイプの設定でバイナリに戻される）。
+    br は brotli パッケージがある場合のみ使う。
+    """
+    if not isinstance(result, dict) or result.get("isBase64Encoded") or not isinstance(result.get("body"), str):
+        return result
+    headers = result.get("headers") or {}
+    if "Content-Encoding" in headers:
+        return result
+
+    raw = result["body"].encode('utf-8')
+    if len(raw) < MIN_COMPRESS_BYTES:
+        return result
+
+    encodings = accepted_encodings(event)
+    brotli = optional_import('brotli') if "br" in encodings else None
+    if brotli is not None:
+        encoding, compressed = "br", brotli.compress(raw, quality=5)
+    elif "gzip" in encodings or "*" in encodings:
+        encoding, compressed = "gzip", gzip.compress(raw, compresslevel=6)
+    else:
+        return result
+
+    return {
+        **result,
+        "headers": {**headers, "Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+        "body": base64.b64encode(compressed).decode('ascii'),
+        "isBase64Encoded": True
+    }
@@ -0,0 +1,210 @@
+#lambda/document_store.py
+import json
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+
+def compute_document_id(file_content, max_chars=None):
+    """ファイル内容と抽出上限のハッシュから文書IDを生成
+
+    抽出テキストは抽出上限によって変わるため、上限が異なれば別の文書として保存する。
+    """
+    digest = hashlib.sha256(file_content)
+    if max_chars is not None:
+        digest.update(f":{max_chars}".encode('ascii'))
+    return digest.hexdigest()
+
+
+class DocumentStore:
+    """アップロード文書の保存先の基底クラス
+
+    文書はファイル内容と抽出上限のハッシュ（文書ID）をキーとして一度だけ保存し、
+    チャットリクエストからはIDで参照する。
+    """
+
+    def put(self, document_id, document):
+        raise NotImplementedError
+
+    def get_raw(self, document_id):
+        """保存されているJSON（デコード前）を返す（ない場合は None）"""
+        raise NotImplementedError
+
+    def get(self, document_id):
+        raw = self.get_raw(document_id)
+        return json.loads(raw) if raw is not None else None
+
+    def exists(self, document_id):
+        return self.get(document_id) is not None
+
+
+class SQLiteDocumentStore(DocumentStore):
+    """SQLiteによる文書ストア（ローカル実行・テスト用）"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "document_id TEXT PRIMARY KEY, "
+            "body TEXT NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def put(self, document_id, document):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO documents (document_id, body, created_at) VALUES (?, ?, ?)",
+                (document_id, json.dumps(document, ensure_ascii=False), time.time())
+            )
+            self.conn.commit()
+
+    def get_raw(self, document_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT body FROM documents WHERE document_id = ?", (document_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+
+class S3DocumentStore(DocumentStore):
+    """S3による文書ストア（本番用）"""
+
+    def __init__(self, bucket, prefix="documents/", s3_client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        if s3_client is None:
+            import boto3
+            s3_client = boto3.client('s3')
+        self.s3 = s3_client
+
+    def _key(self, document_id):
+        return f"{self.prefix}{document_id}.json"
+
+    def put(self, document_id, document):
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=self._key(document_id),
+            Body=json.dumps(document, ensure_ascii=False).encode('utf-8'),
+            ContentType='application/json'
+        )
+
+    def get_raw(self, document_id):
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=self._key(document_id))
+        except self.s3.exceptions.NoSuchKey:
+            return None
+        return response['Body'].read()
+
+
+class DocumentCache:
+    """デコード済みの文書のコンテナ内LRUキャッシュ
+
+    文書IDは内容のハッシュで、保存後に内容が変わることはないため、無効化は行わない。
+    保存されているJSONのバイト数の合計で上限を設け、超えた分は古い順に破棄する。
+    内容が更新されるジョブの状態や抽出キャッシュのエントリには使わない。
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, document_id):
+        with self.lock:
+            entry = self.entries.get(document_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(document_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, document_id, document, size):
+        # 上限を超える単一の文書はキャッシュしない
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if document_id in self.entries:
+                self.total_bytes -= self.entries.pop(document_id)[1]
+            self.entries[document_id] = (document, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "total_bytes": self.total_bytes
+            }
+
+
+_document_store = None
+_document_cache = None
+
+
+def get_document_store():
+    """環境変数の設定に従って文書ストアを取得（コンテナ内で使い回す）"""
+    global _document_store
+    if _document_store is None:
+        backend = os.environ.get('DOCUMENT_STORE_BACKEND')
+        bucket = os.environ.get('DOCUMENT_BUCKET')
+        if backend is None:
+            backend = 's3' if bucket else 'sqlite'
+
+        if backend == 's3':
+            _document_store = S3DocumentStore(bucket)
+        elif backend == 'sqlite':
+            db_path = os.environ.get('DOCUMENT_DB_PATH', '/tmp/documents.db')
+            _document_store = SQLiteDocumentStore(db_path)
+        else:
+            raise ValueError(f"不明な文書ストアのバックエンドです: {backend}")
+
+        logger.info(f"Document store initialized: {backend}")
+    return _document_store
+
+
+def set_document_store(store):
+    """文書ストアを差し替える（テスト用）"""
+    global _document_store, _document_cache
+    _document_store = store
+    _document_cache = None
+
+
+def get_document_cache():
+    """文書のLRUキャッシュを取得（上限は DOCUMENT_CACHE_MAX_BYTES で変更可能）"""
+    global _document_cache
+    if _document_cache is None:
+        _document_cache = DocumentCache(int(os.environ.get('DOCUMENT_CACHE_MAX_BYTES', str(16 * 1024 * 1024))))
+    return _document_cache
+
+
+def load_document(document_id):
+    """文書IDから文書を取得（チャットのターンごとにS3からの取得とJSONのデコードを繰り返さない）"""
+    cache = get_document_cache()
+    document = cache.get(document_id)
+    if document is None:
+        raw = get_document_store().get_raw(document_id)
+        if raw is None:
+            return None
+        document = json.loads(raw)
+        cache.put(document_id, document, len(raw))
+    return document
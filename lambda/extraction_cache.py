@@ -0,0 +1,119 @@
+#lambda/extraction_cache.py
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger()
+
+# 抽出ロジックを変更した場合はバージョンを上げて古いキャッシュを無効化する
+EXTRACTOR_VERSION = "4"
+
+
+def compute_cache_key(file_content, file_type, file_name, max_chars=None):
+    """ファイル内容・形式・抽出上限・抽出器バージョンからキャッシュキーを生成"""
+    extension = os.path.splitext(file_name.lower())[1]
+    digest = hashlib.sha256(file_content).hexdigest()
+    limit = max_chars if max_chars is not None else 'all'
+    return f"extract-v{EXTRACTOR_VERSION}-{file_type or '-'}-{extension or '-'}-{limit}-{digest}".replace('/', '_')
+
+
+class ExtractionCache:
+    """抽出結果のキャッシュ（コンテナ内LRU + 任意の永続レイヤー）
+
+    メモリ上のLRUは保持する文字数の合計で上限を設け、超えた分は古い順に破棄する。
+    永続レイヤーには DocumentStore と同じ get/put を持つオブジェクトを渡す。
+    """
+
+    def __init__(self, max_chars=10_000_000, persistent=None):
+        self.max_chars = max_chars
+        self.persistent = persistent
+        self.entries = OrderedDict()
+        self.total_chars = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+        if self.persistent is not None:
+            try:
+                record = self.persistent.get(key)
+            except Exception as e:
+                logger.error(f"永続キャッシュの取得に失敗しました: {str(e)}")
+                record = None
+            if record is not None:
+                text = record.get("extracted_text", "")
+                self._remember(key, text)
+                with self.lock:
+                    self.persistent_hits += 1
+                return text
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, text):
+        self._remember(key, text)
+        if self.persistent is not None:
+            try:
+                self.persistent.put(key, {"extracted_text": text})
+            except Exception as e:
+                logger.error(f"永続キャッシュへの保存に失敗しました: {str(e)}")
+
+    def _remember(self, key, text):
+        # 上限を超える単一エントリはメモリには載せない
+        if len(text) > self.max_chars:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.total_chars -= len(self.entries.pop(key))
+            self.entries[key] = text
+            self.total_chars += len(text)
+            while self.total_chars > self.max_chars:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_chars -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        """ヒット/ミス数などの統計情報を返す"""
+        with self.lock:
+            lookups = self.hits + self.persistent_hits + self.misses
+            return {
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "total_chars": self.total_chars,
+                "hit_rate": round((self.hits + self.persistent_hits) / lookups, 3) if lookups else 0.0
+            }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_chars = 0
+
+
+_extraction_cache = None
+
+
+def get_extraction_cache():
+    """環境変数の設定に従って抽出キャッシュを取得（コンテナ内で使い回す）"""
+    global _extraction_cache
+    if _extraction_cache is None:
+        persistent = None
+        if os.environ.get('EXTRACTION_CACHE_PERSISTENT', 'false').lower() == 'true':
+            from document_store import get_document_store
+            persistent = get_document_store()
+        max_chars = int(os.environ.get('EXTRACTION_CACHE_MAX_CHARS', '10000000'))
+        _extraction_cache = ExtractionCache(max_chars=max_chars, persistent=persistent)
+    return _extraction_cache
@@ -0,0 +1,111 @@
+#lambda/extraction_engine.py
+import logging
+import multiprocessing
+import os
+import threading
+
+logger = logging.getLogger()
+
+# ページ数がこれ未満の場合はプロセス起動のコストの方が大きいため逐次処理する
+PARALLEL_MIN_UNITS = 16
+
+
+class ExtractionError(Exception):
+    """ファイルからテキストを抽出できなかったことを表す例外（メッセージは利用者にそのまま返す）"""
+
+
+def default_workers():
+    """Lambdaに割り当てられたvCPU数からワーカー数を決定（EXTRACTION_WORKERSで上書き可能）"""
+    configured = os.environ.get('EXTRACTION_WORKERS')
+    if configured:
+        return max(1, int(configured))
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _extract_worker(document, extract_unit, unit_indexes, conn):
+    """担当するページを順に抽出し、結果をパイプで親プロセスに送る"""
+    try:
+        for index in unit_indexes:
+            conn.send(("ok", extract_unit(document, index)))
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {str(e)}"))
+    finally:
+        conn.close()
+
+
+def iter_units(document, num_units, extract_unit, workers=None):
+    """ページ・スライド単位のテキストを元の順番で返すジェネレーター
+
+    PyPDF2やpython-pptxはGILを解放しないため、スレッドではなくプロセスで並列化する。
+    Lambdaでは multiprocessing.Pool/Queue が使えないため、fork した Process と Pipe を使う。
+    ワーカー w はページ w, w+W, w+2W, ... を担当し、親プロセスは各パイプを順に読むことで
+    ページ順に結果を受け取る。呼び出し側が途中で読むのをやめた時点でワーカーは停止する。
+
+    他のスレッド（ジョブのワーカーやboto3の通信など）が動いている状態で fork すると、
+    そのスレッドが保持していたロック（logging など）が子プロセスで解放されずデッドロックする
+    おそれがあるため、メインスレッドしかない場合にだけ並列化し、それ以外は逐次処理する。
+    """
+    if workers is None:
+        workers = default_workers()
+    workers = min(workers, num_units)
+
+    if (workers <= 1 or num_units < PARALLEL_MIN_UNITS or threading.active_count() > 1
+            or 'fork' not in multiprocessing.get_all_start_methods()):
+        for index in range(num_units):
+            yield extract_unit(document, index)
+        return
+
+    # 解析済みの document は fork によって各ワーカーに引き継がれる
+    context = multiprocessing.get_context('fork')
+    processes = []
+    connections = []
+    try:
+        for worker in range(workers):
+            reader, writer = context.Pipe(duplex=False)
+            process = context.Process(
+                target=_extract_worker,
+                args=(document, extract_unit, range(worker, num_units, workers), writer),
+                daemon=True
+            )
+            process.start()
+            writer.close()
+            processes.append(process)
+            connections.append(reader)
+
+        for index in range(num_units):
+            status, payload = connections[index % workers].recv()
+            if status == "error":
+                raise RuntimeError(payload)
+            yield payload
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        for connection in connections:
+            connection.close()
+
+
+def collect_text(chunks, max_chars=None, on_progress=None):
+    """チャンクを連結する。max_chars を超えた時点で残りのチャンクは読まない
+
+    on_progress には (処理済みのチャンク数, 連結済みの文字数) が随時渡される。
+    """
+    parts = []
+    total = 0
+    try:
+        for chunk in chunks:
+            parts.append(chunk)
+            total += len(chunk)
+            if on_progress is not None:
+                on_progress(len(parts), total)
+            if max_chars is not None and total > max_chars:
+                break
+    finally:
+        # ジェネレーターを閉じて並列ワーカーを停止する
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    return "".join(parts)
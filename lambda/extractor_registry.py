@@ -0,0 +1,95 @@
+#lambda/extractor_registry.py
+import io
+import os
+import zipfile
+
+from legacy_ppt import OLE_MAGIC
+from startup import lazy_import
+
+ZIP_MAGIC = b'PK\x03\x04'
+
+
+def list_zip_members(file_content):
+    """ZIP（PPTX/DOCX/XLSX）内のファイル名の一覧（中央ディレクトリのみを読む）"""
+    with zipfile.ZipFile(io.BytesIO(file_content)) as archive:
+        return set(archive.namelist())
+
+
+def list_ole_streams(file_content):
+    """OLE2 複合ファイル（PPT/DOC/XLS）内のストリーム名の一覧"""
+    olefile = lazy_import('olefile')
+    with olefile.OleFileIO(file_content) as ole:
+        return {"/".join(path) for path in ole.listdir()}
+
+
+# コンテナ形式ごとの中身の一覧を取得する関数
+CONTAINER_READERS = {
+    ZIP_MAGIC: list_zip_members,
+    OLE_MAGIC: list_ole_streams
+}
+
+
+class ExtractorRegistry:
+    """テキスト抽出器の登録と、ファイル形式の判定
+
+    形式はファイル先頭のマジックバイトで判定する。ZIP・OLE2 のようなコンテナ形式は
+    中に含まれるファイル（ストリーム）名で判定し、マジックバイトで判定できない形式
+    （テキスト・CSVなど）は拡張子、MIMEタイプの順で判定する。
+    """
+
+    def __init__(self):
+        self.extractors = {}
+
+    def register(self, name, extract, label, magic=None, member=None, extensions=(), mime_types=()):
+        """抽出器を登録する
+
+        extract は (file_content, max_chars, on_progress) を受け取る関数。
+        member を指定した場合は、magic のコンテナ内にその名前が含まれるときに一致とする。
+        mime_types の末尾が '/' の場合は前方一致（'text/' など）で判定する。
+        """
+        self.extractors[name] = {
+            "extract": extract,
+            "label": label,
+            "magic": magic,
+            "member": member,
+            "extensions": tuple(extensions),
+            "mime_types": tuple(mime_types)
+        }
+
+    def get(self, name):
+        return self.extractors[name]["extract"]
+
+    def labels(self):
+        return ", ".join(extractor["label"] for extractor in self.extractors.values())
+
+    def detect(self, file_content, file_type, file_name):
+        """ファイル形式名を返す（対応していない場合は None）"""
+        head = file_content[:16]
+        for name, extractor in self.extractors.items():
+            if extractor["magic"] and extractor["member"] is None and head.startswith(extractor["magic"]):
+                return name
+
+        for magic, list_members in CONTAINER_READERS.items():
+            if not head.startswith(magic):
+                continue
+            try:
+                members = list_members(file_content)
+            except Exception:
+                # 壊れたコンテナは拡張子・MIMEタイプでの判定に任せる
+                break
+            for name, extractor in self.extractors.items():
+                if extractor["magic"] == magic and extractor["member"] in members:
+                    return name
+            break
+
+        extension = os.path.splitext(file_name.lower())[1]
+        for name, extractor in self.extractors.items():
+            if extension and extension in extractor["extensions"]:
+                return name
+
+        file_type = (file_type or "").lower()
+        for name, extractor in self.extractors.items():
+            for mime_type in extractor["mime_types"]:
+                if file_type == mime_type or (mime_type.endswith('/') and file_type.startswith(mime_type)):
+                    return name
+        return None
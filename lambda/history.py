@@ -0,0 +1,125 @@
+#lambda/history.py
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from tokens import estimate_tokens
+
+ROLE_LABELS = {"user": "ユーザー", "assistant": "アシスタント"}
+
+
+def summarize_extractive(previous_summary, messages, max_tokens):
+    """各発言の冒頭を並べて要約とする（モデル呼び出しなしの簡易要約）"""
+    lines = previous_summary.split("\n") if previous_summary else []
+    for msg in messages:
+        content = " ".join(str(msg.get("content", "")).split())
+        if len(content) > 100:
+            content = content[:100] + "…"
+        lines.append(f"{ROLE_LABELS.get(msg.get('role'), msg.get('role'))}: {content}")
+
+    # 要約が上限を超える場合は古い行から削る
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class HistoryManager:
+    """会話履歴をトークン予算内に収めるクラス
+
+    直近のメッセージはそのまま残し、それより古いメッセージは fold_size 件単位で
+    要約に畳み込む。要約は履歴の先頭からのハッシュをキーにキャッシュするため、
+    ウィンドウが fold_size 件進んだときにだけ再計算される。
+    """
+
+    def __init__(self, max_messages=12, token_budget=4000, fold_size=4,
+                 summary_tokens=500, summarizer=None, cache_size=256):
+        self.max_messages = max_messages
+        self.token_budget = token_budget
+        self.fold_size = fold_size
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer or summarize_extractive
+        self.cache_size = cache_size
+        self.summary_cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def prepare(self, conversation_history):
+        """履歴を (要約テキスト, そのまま送るメッセージ一覧) に分割"""
+        messages = [
+            {"role": msg["role"], "content": msg["content"]}
+            for msg in conversation_history
+            if msg.get("role") in ("user", "assistant")
+        ]
+
+        # 件数とトークン予算の両方を満たす位置で分割
+        split = max(0, len(messages) - self.max_messages)
+        window_tokens = sum(estimate_tokens(msg["content"]) for msg in messages[split:])
+        while split < len(messages) - 1 and window_tokens > self.token_budget:
+            window_tokens -= estimate_tokens(messages[split]["content"])
+            split += 1
+
+        # 要約のキャッシュが効くよう、分割位置を fold_size の倍数に切り上げる
+        if split % self.fold_size:
+            split = min(len(messages) - 1, split + self.fold_size - split % self.fold_size)
+        split = max(split, 0)
+
+        summary = self._summary_for(messages, split)
+        window = messages[split:]
+
+        # モデルに渡すメッセージはユーザーの発言から始める
+        leading = []
+        while window and window[0]["role"] != "user":
+            leading.append(window.pop(0))
+        if leading:
+            summary = summarize_extractive(summary, leading, self.summary_tokens)
+
+        return summary, window
+
+    def cap(self, conversation_history):
+        """レスポンスで返す履歴を直近の件数に制限"""
+        return conversation_history[-self.max_messages:]
+
+    def _summary_for(self, messages, split):
+        if split <= 0:
+            return ""
+
+        # fold_size 件ごとの区切りで、先頭からのハッシュを計算
+        boundaries = []
+        digest = hashlib.sha256()
+        for pos, msg in enumerate(messages[:split], 1):
+            digest.update(json.dumps(msg, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+            if pos % self.fold_size == 0 or pos == split:
+                boundaries.append((pos, digest.hexdigest()))
+
+        with self.lock:
+            target_key = boundaries[-1][1]
+            if target_key in self.summary_cache:
+                self.summary_cache.move_to_end(target_key)
+                return self.summary_cache[target_key]
+
+            # キャッシュ済みの最も新しい区切りから続きを要約する
+            start, summary = 0, ""
+            for pos, key in reversed(boundaries[:-1]):
+                if key in self.summary_cache:
+                    start, summary = pos, self.summary_cache[key]
+                    break
+
+        summary = self.summarizer(summary, messages[start:split], self.summary_tokens)
+
+        with self.lock:
+            self.summary_cache[target_key] = summary
+            while len(self.summary_cache) > self.cache_size:
+                self.summary_cache.popitem(last=False)
+        return summary
+
+
+def history_manager_from_env(summarizer=None):
+    """環境変数の設定から HistoryManager を作成"""
+    return HistoryManager(
+        max_messages=int(os.environ.get('HISTORY_MAX_MESSAGES', '12')),
+        token_budget=int(os.environ.get('HISTORY_TOKEN_BUDGET', '4000')),
+        fold_size=int(os.environ.get('HISTORY_FOLD_SIZE', '4')),
+        summary_tokens=int(os.environ.get('HISTORY_SUMMARY_TOKENS', '500')),
+        summarizer=summarizer
+    )
@@ -1,298 +1,557 @@
 #lambda/index.py
 import json
-import boto3
 import logging
 import os
 import base64
+import codecs
 import io
-import re
+import struct
+
+from document_store import compute_document_id, get_document_store, load_document
+from extraction_cache import compute_cache_key, get_extraction_cache
+from extraction_engine import ExtractionError, collect_text, iter_units
+from extractor_registry import ZIP_MAGIC, ExtractorRegistry
+from history import history_manager_from_env
+from jobs import JobStore, ProgressReporter, create_job_queue
+from legacy_doc import DocFormatError, iter_document_text, table_stream_name
+from legacy_ppt import OLE_MAGIC, PptFormatError, iter_all_texts, iter_slide_texts
+from log_utils import begin_request_logging, configure_logging, log_payload
+from markdown_utils import remove_markdown_formatting
+from metrics import current_metrics, operation_from_event, request_metrics, span
+from model_client import get_model_client
+from qa import QUESTION_TYPES, build_prompt, parse_counts, parse_questions, render_markdown, split_segments
+from response_cache import get_response_cache, invoke_model_cached
+from api_responses import compress_response, error_response, json_response, make_response, parse_body
+from retrieval import INDEX_VERSION, build_index, chunk_text, select_context
+from sessions import fold_history, get_session_store, load_history, session_summary, user_id_from_event
+from spreadsheet import iter_csv_text, iter_xlsx_text
+from startup import lazy_import, prewarm, prewarm_targets_from_env
+from uploads import (create_upload_url, delete_object, get_object_size, get_s3_client,
+                     get_upload_bucket, is_upload_key, read_object)
 
 # ログ設定
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+configure_logging(logger)
 
-# Bedrockクライアントの初期化
-bedrock = boto3.client('bedrock-runtime', region_name='us-east-1')
+# Bedrockクライアント（再試行・レート制限付き）は get_model_client() で初回利用時に作成する
 
-def remove_markdown_formatting(text):
-    """マークダウンフォーマッティングを削除する関数"""
-    import re
-    
-    # **強調** を削除
-    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
-    
-    # *斜体* を削除
-    text = re.sub(r'\*(.*?)\*', r'\1', text)
-    
-    # ***太字斜体*** を削除
-    text = re.sub(r'\*\*\*(.*?)\*\*\*', r'\1', text)
-    
-    # `コード` を削除
-    text = re.sub(r'`(.*?)`', r'\1', text)
-    
-    # [リンク](url) を削除
-    text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
-    
-    return text
+# アップロードできるファイルサイズの上限（10MB）
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+# アップロード時に抽出するテキストの上限文字数（既定値と、リクエストで指定できる最大値）
+MAX_EXTRACTED_CHARS = 50000
+MAX_EXTRACTED_CHARS_LIMIT = int(os.environ.get('MAX_EXTRACTED_CHARS_LIMIT', '200000'))
+
+# 一括採点の同時実行数と1リクエストあたりの最大件数
+GRADING_CONCURRENCY = int(os.environ.get('GRADING_CONCURRENCY', '4'))
+MAX_BATCH_GRADING = 20
 
-def extract_text_from_pdf(file_content):
+# プロンプトに含めるファイル内容のトークン予算（既定値と、リクエストの contextTokenBudget で指定できる最大値）
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', '3000'))
+MAX_CONTEXT_TOKEN_BUDGET = int(os.environ.get('MAX_CONTEXT_TOKEN_BUDGET', '12000'))
+
+# サーバーにセッションがないチャットを、クライアントの会話履歴で初期化するときに受け取る最大件数
+MAX_SEEDED_MESSAGES = 200
+
+# 問題集の生成で、問題の種類ごとのプロンプトに含める資料のトークン予算と同時実行数
+QA_CONTEXT_TOKEN_BUDGET = int(os.environ.get('QA_CONTEXT_TOKEN_BUDGET', '2500'))
+QA_CONCURRENCY = int(os.environ.get('QA_CONCURRENCY', '3'))
+
+def extract_pdf_page(pdf_reader, page_index):
+    """PDFの1ページ分のテキストを抽出"""
+    return pdf_reader.pages[page_index].extract_text()
+
+def iter_pdf_text(file_content):
+    """PDFのテキストをページ単位で順に返す（PyPDF2使用、ページ単位で並列処理）"""
+    PyPDF2 = lazy_import('PyPDF2')
+    pdf_file = io.BytesIO(file_content)
+    pdf_reader = PyPDF2.PdfReader(pdf_file)
+    for page_text in iter_units(pdf_reader, len(pdf_reader.pages), extract_pdf_page):
+        yield page_text + "\n"
+
+def extract_text_from_pdf(file_content, max_chars=None, on_progress=None):
     """PDFからテキストを抽出（PyPDF2使用）"""
     try:
-        import PyPDF2
-        pdf_file = io.BytesIO(file_content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text.strip()
+        return collect_text(iter_pdf_text(file_content), max_chars, on_progress).strip()
     except Exception as e:
         logger.error(f"PDF processing error: {str(e)}")
-        return f"PDFの処理中にエラーが発生しました: {str(e)}"
+        raise ExtractionError(f"PDFの処理中にエラーが発生しました: {str(e)}") from e
+
+def iter_ppt_text(file_content):
+    """古い形式のPPTのテキストをスライド単位で順に返す（OLE2のPowerPoint Documentストリームを解析）"""
+    olefile = lazy_import('olefile')
+    with olefile.OleFileIO(file_content) as ole:
+        document = ole.openstream('PowerPoint Document').read()
+        current_user = ole.openstream('Current User').read() if ole.exists('Current User') else b""
+
+    slide_count = 0
+    try:
+        for texts in iter_slide_texts(document, current_user):
+            slide_count += 1
+            lines = [f"--- スライド {slide_count} ---"]
+            lines.extend(text for text in texts if text.strip())
+            yield "\n".join(lines) + "\n\n"
+    except (PptFormatError, struct.error) as e:
+        if slide_count:
+            logger.warning(f"PPTの解析を途中で終了しました: {str(e)}")
+            return
+        # スライドの構造を読めない場合は、ストリーム内のテキストレコードを出現順に返す
+        logger.warning(f"PPTのスライド構造を解析できないため、テキストレコードを順に抽出します: {str(e)}")
+        for text in iter_all_texts(document):
+            if text.strip():
+                yield text + "\n"
 
-def extract_text_from_ppt_legacy(file_content):
+def extract_text_from_ppt_legacy(file_content, max_chars=None, on_progress=None):
     """古い形式のPPTファイルからテキストを抽出"""
     try:
-        import re
-        import struct
-        
         logger.info("Processing legacy PPT file")
         
-        # PPTファイルの基本的なテキスト抽出
-        # 複数のエンコーディングで試行し、最も読みやすい結果を返す
-        
-        extracted_texts = []
+        if not file_content.startswith(OLE_MAGIC):
+            raise ExtractionError("PPTファイルの形式を認識できませんでした。\n\n"
+                                  "解決策: PowerPointでファイルを開き、「名前を付けて保存」で .pptx 形式に変換してから再度アップロードしてください。")
         
-        # 方法1: UTF-8で試行
-        try:
-            text_utf8 = file_content.decode('utf-8', errors='ignore')
-            # 英数字と日本語文字を抽出
-            readable_chars = re.findall(r'[a-zA-Z0-9\s\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FAF.,!?;:\-()\'\"]{4,}', text_utf8)
-            utf8_texts = [s.strip() for s in readable_chars if len(s.strip()) >= 4]
-            extracted_texts.extend(utf8_texts[:20])  # 最大20個
-        except:
-            pass
-        
-        # 方法2: Shift-JIS（日本語）で試行
-        try:
-            text_sjis = file_content.decode('shift-jis', errors='ignore')
-            readable_chars = re.findall(r'[a-zA-Z0-9\s\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FAF.,!?;:\-()\'\"]{4,}', text_sjis)
-            sjis_texts = [s.strip() for s in readable_chars if len(s.strip()) >= 4]
-            extracted_texts.extend(sjis_texts[:20])
-        except:
-            pass
-        
-        # 方法3: バイト列から直接英数字を検索
-        try:
-            ascii_strings = re.findall(rb'[a-zA-Z0-9\s.,!?;:\-()\'\"]{4,}', file_content)
-            ascii_texts = [s.decode('ascii', errors='ignore').strip() for s in ascii_strings]
-            ascii_texts = [s for s in ascii_texts if len(s) >= 4 and s.isascii()]
-            extracted_texts.extend(ascii_texts[:15])
-        except:
-            pass
-        
-        # 重複除去と品質フィルタリング
-        unique_texts = []
-        seen = set()
-        
-        for text in extracted_texts:
-            clean_text = re.sub(r'\s+', ' ', text.strip())  # 連続する空白を一つに
-            
-            if (clean_text and 
-                len(clean_text) >= 4 and 
-                len(clean_text) <= 100 and 
-                clean_text not in seen and
-                not re.match(r'^[^\w\s]*$', clean_text) and  # 記号のみでない
-                not re.match(r'^[\x00-\x1F\x7F-\x9F]+$', clean_text)):  # 制御文字のみでない
-                
-                unique_texts.append(clean_text)
-                seen.add(clean_text)
-        
-        # 結果を生成
-        if unique_texts:
-            # 文字数で昇順ソート（短いものから）
-            unique_texts.sort(key=len)
-            
-            result = "--- PPTファイル（レガシー形式）から抽出されたテキスト ---\n\n"
-            
-            # 最大15個のテキストを表示
-            displayed_texts = unique_texts[:15]
-            for i, text in enumerate(displayed_texts, 1):
-                result += f"{i}. {text}\n"
-            
-            if len(unique_texts) > 15:
-                result += f"\n... 他に{len(unique_texts) - 15}個のテキスト断片があります\n"
-            
-            result += "\n注意: 古いPPT形式のため、文字化けや不完全な抽出が発生する場合があります。"
-            result += "\nより正確な抽出のため、PowerPointで.pptx形式に変換してから再アップロードすることをお勧めします。"
-            
-            return result
-        else:
-            return ("PPTファイルからテキストを抽出できませんでした。\n\n"
-                   "このファイルは古いPowerPoint形式のため、テキスト抽出が困難です。\n"
-                   "解決策: PowerPointでファイルを開き、「名前を付けて保存」で .pptx 形式に変換してから再度アップロードしてください。")
+        text = collect_text(iter_ppt_text(file_content), max_chars, on_progress).strip()
+        if text:
+            return text
+        raise ExtractionError("PPTファイルからテキストを抽出できませんでした。\n\n"
+                              "解決策: PowerPointでファイルを開き、「名前を付けて保存」で .pptx 形式に変換してから再度アップロードしてください。")
             
+    except ExtractionError:
+        raise
     except Exception as e:
         logger.error(f"PPT legacy processing error: {str(e)}")
-        return f"古いPPTファイルの処理中にエラーが発生しました: {str(e)}\n\n解決策: PowerPointでファイルを開き、.pptx形式で保存し直してください。"
+        raise ExtractionError(f"古いPPTファイルの処理中にエラーが発生しました: {str(e)}\n\n解決策: PowerPointでファイルを開き、.pptx形式で保存し直してください。") from e
+
+def extract_pptx_slide(slides, slide_index):
+    """PPTXの1スライド分のテキストを抽出"""
+    lines = [f"--- スライド {slide_index + 1} ---"]
+    for shape in slides[slide_index].shapes:
+        if hasattr(shape, "text") and shape.text.strip():
+            lines.append(shape.text)
+    return "\n".join(lines) + "\n\n"
 
-def extract_text_from_pptx(file_content):
+def iter_pptx_text(file_content):
+    """PPTXのテキストをスライド単位で順に返す（python-pptx使用、スライド単位で並列処理）"""
+    pptx = lazy_import('pptx')
+    pptx_file = io.BytesIO(file_content)
+    prs = pptx.Presentation(pptx_file)
+    slides = list(prs.slides)
+    yield from iter_units(slides, len(slides), extract_pptx_slide)
+
+def extract_text_from_pptx(file_content, max_chars=None, on_progress=None):
     """PPTXからテキストを抽出（python-pptx使用）"""
     try:
-        from pptx import Presentation
-        pptx_file = io.BytesIO(file_content)
-        prs = Presentation(pptx_file)
-        text = ""
-        for slide_num, slide in enumerate(prs.slides, 1):
-            text += f"--- スライド {slide_num} ---\n"
-            for shape in slide.shapes:
-                if hasattr(shape, "text") and shape.text.strip():
-                    text += shape.text + "\n"
-            text += "\n"
-        return text.strip()
+        return collect_text(iter_pptx_text(file_content), max_chars, on_progress).strip()
     except Exception as e:
         logger.error(f"PPTX processing error: {str(e)}")
-        return f"PPTXの処理中にエラーが発生しました: {str(e)}"
+        raise ExtractionError(f"PPTXの処理中にエラーが発生しました: {str(e)}") from e
+
+def iter_docx_text(file_content):
+    """DOCXのテキストを段落単位で順に返す（python-docx使用）"""
+    docx = lazy_import('docx')
+    docx_file = io.BytesIO(file_content)
+    doc = docx.Document(docx_file)
+    for paragraph in doc.paragraphs:
+        if paragraph.text.strip():
+            yield paragraph.text + "\n"
 
-def extract_text_from_docx(file_content):
+def extract_text_from_docx(file_content, max_chars=None, on_progress=None):
     """DOCXからテキストを抽出（python-docx使用）"""
     try:
-        from docx import Document
-        docx_file = io.BytesIO(file_content)
-        doc = Document(docx_file)
-        text = ""
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():
-                text += paragraph.text + "\n"
-        return text.strip()
+        return collect_text(iter_docx_text(file_content), max_chars, on_progress).strip()
     except Exception as e:
         logger.error(f"DOCX processing error: {str(e)}")
-        return f"DOCXの処理中にエラーが発生しました: {str(e)}"
+        raise ExtractionError(f"DOCXの処理中にエラーが発生しました: {str(e)}") from e
+
+def iter_plain_text(file_content, block_size=16 * 1024):
+    """テキストファイルをUTF-8として一定サイズごとに順にデコードして返す"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for start in range(0, len(file_content), block_size):
+        text = decoder.decode(file_content[start:start + block_size])
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+def extract_text_from_txt(file_content, max_chars=None, on_progress=None):
+    """テキストファイルをデコード"""
+    return collect_text(iter_plain_text(file_content), max_chars, on_progress)
 
-def process_file_content(file_content, file_type, file_name):
-    """ファイル内容を処理してテキストを抽出"""
+def iter_doc_text(file_content):
+    """古い形式のDOCの本文を順に返す（OLE2のWordDocumentストリームのピーステーブルを解析）"""
+    olefile = lazy_import('olefile')
+    with olefile.OleFileIO(file_content) as ole:
+        word_document = ole.openstream('WordDocument').read()
+        table_name = table_stream_name(word_document)
+        if not ole.exists(table_name):
+            raise DocFormatError(f"{table_name} ストリームが見つかりません")
+        table = ole.openstream(table_name).read()
+    yield from iter_document_text(word_document, table)
+
+def extract_text_from_doc(file_content, max_chars=None, on_progress=None):
+    """古い形式のDOCファイルからテキストを抽出"""
+    try:
+        text = collect_text(iter_doc_text(file_content), max_chars, on_progress).strip()
+        if text:
+            return text
+        raise ExtractionError("DOCファイルからテキストを抽出できませんでした。.docx形式で保存し直してアップロードしてください。")
+    except ExtractionError:
+        raise
+    except Exception as e:
+        logger.error(f"DOC processing error: {str(e)}")
+        raise ExtractionError(f"DOCファイルの処理中にエラーが発生しました: {str(e)}\n\n解決策: Wordでファイルを開き、.docx形式で保存し直してください。") from e
+
+def extract_text_from_xlsx(file_content, max_chars=None, on_progress=None):
+    """XLSXからテキストを抽出（シートを1行ずつ読み込み、上限文字数に達したら打ち切る）"""
+    try:
+        return collect_text(iter_xlsx_text(file_content), max_chars, on_progress).strip()
+    except Exception as e:
+        logger.error(f"XLSX processing error: {str(e)}")
+        raise ExtractionError(f"XLSXの処理中にエラーが発生しました: {str(e)}") from e
+
+def extract_text_from_csv(file_content, max_chars=None, on_progress=None):
+    """CSVからテキストを抽出（UTF-8またはShift_JIS）"""
+    try:
+        return collect_text(iter_csv_text(file_content), max_chars, on_progress).strip()
+    except Exception as e:
+        logger.error(f"CSV processing error: {str(e)}")
+        raise ExtractionError(f"CSVの処理中にエラーが発生しました: {str(e)}") from e
+
+# 抽出器の登録（形式はファイル先頭のマジックバイトで判定し、判定できない形式は拡張子・MIMEタイプで判定する）
+extractors = ExtractorRegistry()
+extractors.register('pdf', extract_text_from_pdf, 'PDF', magic=b'%PDF-',
+                    extensions=('.pdf',), mime_types=('application/pdf',))
+extractors.register('pptx', extract_text_from_pptx, 'PPTX', magic=ZIP_MAGIC, member='ppt/presentation.xml',
+                    extensions=('.pptx',),
+                    mime_types=('application/vnd.openxmlformats-officedocument.presentationml.presentation',))
+extractors.register('ppt', extract_text_from_ppt_legacy, 'PPT', magic=OLE_MAGIC, member='PowerPoint Document',
+                    extensions=('.ppt',), mime_types=('application/vnd.ms-powerpoint',))
+extractors.register('docx', extract_text_from_docx, 'DOCX', magic=ZIP_MAGIC, member='word/document.xml',
+                    extensions=('.docx',),
+                    mime_types=('application/vnd.openxmlformats-officedocument.wordprocessingml.document',))
+extractors.register('doc', extract_text_from_doc, 'DOC', magic=OLE_MAGIC, member='WordDocument',
+                    extensions=('.doc',), mime_types=('application/msword',))
+extractors.register('xlsx', extract_text_from_xlsx, 'XLSX', magic=ZIP_MAGIC, member='xl/workbook.xml',
+                    extensions=('.xlsx',),
+                    mime_types=('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',))
+extractors.register('csv', extract_text_from_csv, 'CSV',
+                    extensions=('.csv',), mime_types=('text/csv',))
+extractors.register('txt', extract_text_from_txt, 'TXT',
+                    extensions=('.txt',), mime_types=('text/',))
+
+def extract_file_content(file_content, file_type, file_name, max_chars=None, on_progress=None):
+    """ファイル形式を判定し、対応する抽出処理を呼び出す（抽出できない場合は ExtractionError）"""
+    name = extractors.detect(file_content, file_type, file_name)
+    if name is None:
+        raise ExtractionError(f"サポートされていないファイル形式です: {file_type}。対応形式: {extractors.labels()}")
+    current_metrics().set_property("FileFormat", name)
+    return extractors.get(name)(file_content, max_chars, on_progress)
+
+def process_file_content(file_content, file_type, file_name, max_chars=None, on_progress=None):
+    """ファイル内容を処理してテキストを抽出（同一内容の再アップロードはキャッシュから返す）
+
+    抽出できなかった場合は ExtractionError を送出し、失敗した結果はキャッシュしない。
+    max_chars を指定した場合、その文字数に達した時点で残りのページの解析を打ち切る。
+    on_progress には (処理済みのページ数, 抽出済みの文字数) が随時渡される。
+    """
     logger.info(f"Processing file: {file_name}, type: {file_type}")
+    metrics = current_metrics()
+    metrics.put("FileBytes", len(file_content), "Bytes")
+    
+    def track_progress(units_done, text_length):
+        metrics.put("ExtractedUnits", units_done)
+        if on_progress is not None:
+            on_progress(units_done, text_length)
     
     try:
-        if file_type == 'application/pdf' or file_name.lower().endswith('.pdf'):
-            return extract_text_from_pdf(file_content)
-        
-        elif (file_type == 'application/vnd.openxmlformats-officedocument.presentationml.presentation' 
-              or file_name.lower().endswith('.pptx')):
-            return extract_text_from_pptx(file_content)
-        
-        elif (file_type == 'application/vnd.ms-powerpoint' 
-              or file_name.lower().endswith('.ppt')):
-            return extract_text_from_ppt_legacy(file_content)
-        
-        elif (file_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-              or file_name.lower().endswith('.docx')):
-            return extract_text_from_docx(file_content)
+        cache = get_extraction_cache()
+        with metrics.span("ExtractionCacheLookup"):
+            cache_key = compute_cache_key(file_content, file_type, file_name, max_chars)
+            cached_text = cache.get(cache_key)
+        metrics.set_property("ExtractionCacheHit", cached_text is not None)
+        if cached_text is not None:
+            logger.info(f"Extraction cache hit: {file_name}, stats: {json.dumps(cache.stats())}")
+            return cached_text
         
-        elif (file_type == 'application/msword'
-              or file_name.lower().endswith('.doc')):
-            return "古いDOCファイル形式です。.docx形式で保存し直してアップロードしてください。"
-        
-        elif file_type.startswith('text/') or file_name.lower().endswith('.txt'):
-            return file_content.decode('utf-8')
-        
-        else:
-            return f"サポートされていないファイル形式です: {file_type}。対応形式: PDF, PPTX, PPT, DOCX, TXT"
+        with metrics.span("Extraction"):
+            extracted_text = extract_file_content(file_content, file_type, file_name, max_chars, track_progress)
+        metrics.put("ExtractedChars", len(extracted_text))
+        cache.put(cache_key, extracted_text)
+        logger.info(f"Extraction cache miss: {file_name}, stats: {json.dumps(cache.stats())}")
+        return extracted_text
     
+    except ExtractionError:
+        raise
     except Exception as e:
         logger.error(f"File processing error: {str(e)}")
-        return f"ファイル処理エラー: {str(e)}"
+        raise ExtractionError(f"ファイル処理エラー: {str(e)}") from e
+
+def parse_max_chars(body):
+    """抽出する最大文字数（リクエストごとに指定可能、上限あり）"""
+    return min(int(body.get("maxChars") or MAX_EXTRACTED_CHARS), MAX_EXTRACTED_CHARS_LIMIT)
+
+def parse_context_token_budget(body):
+    """ファイル内容のトークン予算（リクエストごとに指定可能、不正な値は既定値、上限あり）"""
+    try:
+        budget = int(body.get("contextTokenBudget") or CONTEXT_TOKEN_BUDGET)
+    except (TypeError, ValueError):
+        budget = CONTEXT_TOKEN_BUDGET
+    return max(0, min(budget, MAX_CONTEXT_TOKEN_BUDGET))
+
+def extract_and_store(file_content, file_type, file_name, max_chars, on_progress=None):
+    """ファイルからテキストを抽出して文書ストアに保存し、アップロード結果を返す
+
+    抽出に失敗した場合は ExtractionError を送出し、文書ストアには保存しない。
+    """
+    # 上限文字数に達した時点で残りのページ・段落の解析は行わない
+    extracted_text = process_file_content(file_content, file_type, file_name, max_chars, on_progress)
+    
+    # 抽出されたテキストの長さをチェック
+    if len(extracted_text) > max_chars:
+        extracted_text = extracted_text[:max_chars] + "\n...(テキストが長すぎるため切り詰められました)"
+    
+    # 抽出結果をサーバー側に保存し、以降のチャットでは文書IDで参照する
+    # 同じ内容・同じ抽出上限の文書は保存済みのものを使い、上書きしない
+    document_id = compute_document_id(file_content, max_chars)
+    try:
+        if load_document(document_id) is not None:
+            return upload_result(extracted_text, document_id, file_name, len(file_content))
+        with span("BuildIndex"):
+            retrieval_index = build_index(extracted_text)
+        with span("StoreDocument"):
+            get_document_store().put(document_id, {
+                "file_name": file_name,
+                "file_type": file_type,
+                "file_size": len(file_content),
+                "extracted_text": extracted_text,
+                "retrieval_index": retrieval_index
+            })
+    except Exception as e:
+        logger.error(f"文書の保存に失敗しました: {str(e)}", exc_info=True)
+        document_id = None
+    
+    return upload_result(extracted_text, document_id, file_name, len(file_content))
+
+def upload_result(extracted_text, document_id, file_name, file_size):
+    """アップロード結果（/upload・抽出ジョブの応答）"""
+    return {
+        "success": True,
+        "message": "ファイルが正常に処理されました",
+        "extracted_text": extracted_text,
+        "document_id": document_id,
+        "file_name": file_name,
+        "file_size": file_size,
+        "text_length": len(extracted_text)
+    }
 
 def handle_file_upload(event):
     """ファイルアップロードを処理（Lambda内で完結）"""
     try:
-        body = json.loads(event.get("body", "{}"))
+        with span("ParseRequest"):
+            body = parse_body(event)
         file_data = body.get("file")
         file_name = body.get("fileName")
         file_type = body.get("fileType", "")
+        max_chars = parse_max_chars(body)
         
         if not file_data or not file_name:
-            return {
-                "statusCode": 400,
-                "headers": {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*"
-                },
-                "body": json.dumps({
-                    "success": False,
-                    "error": "ファイルデータまたはファイル名が見つかりません"
-                })
-            }
+            return error_response(400, "ファイルデータまたはファイル名が見つかりません")
         
         # Base64デコード
         try:
-            file_content = base64.b64decode(file_data)
+            with span("Base64Decode"):
+                file_content = base64.b64decode(file_data)
         except Exception as e:
-            return {
-                "statusCode": 400,
-                "headers": {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*"
-                },
-                "body": json.dumps({
-                    "success": False,
-                    "error": f"ファイルデータのデコードに失敗しました: {str(e)}"
-                })
-            }
+            return error_response(400, f"ファイルデータのデコードに失敗しました: {str(e)}")
         
         # ファイルサイズチェック（10MB制限）
-        if len(file_content) > 10 * 1024 * 1024:
-            return {
-                "statusCode": 400,
-                "headers": {
-                    "Content-Type": "application/json",
-                    "Access-Control-Allow-Origin": "*"
-                },
-                "body": json.dumps({
-                    "success": False,
-                    "error": "ファイルサイズが大きすぎます（10MB以下にしてください）"
-                })
-            }
+        if len(file_content) > MAX_UPLOAD_BYTES:
+            return error_response(400, "ファイルサイズが大きすぎます（10MB以下にしてください）")
         
         # Lambda内でファイルからテキストを抽出
-        extracted_text = process_file_content(file_content, file_type, file_name)
-        
-        # 抽出されたテキストの長さをチェック
-        if len(extracted_text) > 50000:  # 50KB制限
-            extracted_text = extracted_text[:50000] + "\n...(テキストが長すぎるため切り詰められました)"
-        
-        return {
-            "statusCode": 200,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*"
-            },
-            "body": json.dumps({
+        result = extract_and_store(file_content, file_type, file_name, max_chars)
+        
+        return json_response(200, result)
+        
+    except ExtractionError as e:
+        return error_response(400, str(e))
+    except Exception as e:
+        logger.error(f"ファイルアップロードエラー: {str(e)}", exc_info=True)
+        return error_response(500, str(e))
+
+def handle_upload_url(event):
+    """S3へ直接アップロードするための署名付きURLを発行"""
+    try:
+        body = parse_body(event)
+        file_name = body.get("fileName")
+        file_type = body.get("fileType", "")
+        file_size = body.get("fileSize")
+        
+        if not file_name:
+            return error_response(400, "ファイル名が見つかりません")
+        
+        # ファイルサイズチェック（10MB制限、実際のサイズは完了通知時にも確認）
+        if file_size is not None and int(file_size) > MAX_UPLOAD_BYTES:
+            return error_response(400, "ファイルサイズが大きすぎます（10MB以下にしてください）")
+        
+        upload = create_upload_url(get_s3_client(), get_upload_bucket(), file_name, file_type)
+        
+        return json_response(200, {
+            "success": True,
+            **upload
+        })
+        
+    except Exception as e:
+        logger.error(f"署名付きURL発行エラー: {str(e)}", exc_info=True)
+        return error_response(500, str(e))
+
+def extract_uploaded_object(object_key, file_type, file_name, max_chars, on_progress=None):
+    """S3上のアップロードファイルからテキストを抽出（サイズ超過の場合は None を返す）"""
+    s3 = get_s3_client()
+    bucket = get_upload_bucket()
+    try:
+        # ファイルサイズチェック（10MB制限）
+        if get_object_size(s3, bucket, object_key) > MAX_UPLOAD_BYTES:
+            return None
+        
+        with span("ReadObject"):
+            file_content = read_object(s3, bucket, object_key)
+        return extract_and_store(file_content, file_type, file_name, max_chars, on_progress)
+    finally:
+        # 抽出結果は文書ストアに保存するため、元ファイルは削除する
+        try:
+            delete_object(s3, bucket, object_key)
+        except Exception as e:
+            logger.error(f"アップロードファイルの削除に失敗しました: {str(e)}")
+
+def run_extraction_job(job_id, payload):
+    """抽出ジョブを実行し、進捗と結果をジョブストアに保存（ワーカー側の処理）"""
+    job_store = get_job_store()
+    logger.info(f"Running extraction job: {job_id}")
+    try:
+        job_store.update(job_id, status="running")
+        result = extract_uploaded_object(
+            payload["objectKey"], payload.get("fileType", ""), payload["fileName"],
+            payload.get("maxChars", MAX_EXTRACTED_CHARS), ProgressReporter(job_store, job_id)
+        )
+        if result is None:
+            job_store.update(job_id, status="error", error="ファイルサイズが大きすぎます（10MB以下にしてください）")
+        else:
+            job_store.update(job_id, status="done", text_length=result["text_length"], result=result)
+    except Exception as e:
+        logger.error(f"抽出ジョブエラー: {str(e)}", exc_info=True)
+        job_store.update(job_id, status="error", error=str(e))
+
+_job_queue = None
+
+def get_job_store():
+    """抽出ジョブの状態の保存先（文書ストアを共用）"""
+    return JobStore(get_document_store())
+
+def get_job_queue():
+    """抽出ジョブのキューを取得（Lambda上では自身の非同期呼び出し、ローカルではスレッド）"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = create_job_queue(run_extraction_job)
+    return _job_queue
+
+def handle_upload_status(event):
+    """非同期抽出ジョブの進捗と結果を返す"""
+    try:
+        body = parse_body(event)
+        job_id = body.get("jobId") or (event.get("queryStringParameters") or {}).get("jobId")
+        job_store = get_job_store()
+        job = job_store.get(job_id) if job_id else None
+        
+        if job is None:
+            return error_response(404, "ジョブが見つかりません")
+        
+        # ワーカーがタイムアウト・異常終了して更新が止まったジョブはエラーとして返す
+        job = job_store.expire_stale(job_id, job)
+        
+        return json_response(200, {
+            "success": True,
+            "jobId": job_id,
+            "status": job.get("status"),
+            "unitsDone": job.get("units_done", 0),
+            "textLength": job.get("text_length", 0),
+            "error": job.get("error"),
+            "result": job.get("result")
+        })
+        
+    except Exception as e:
+        logger.error(f"ジョブ状態の取得エラー: {str(e)}", exc_info=True)
+        return error_response(500, str(e))
+
+def handle_upload_complete(event):
+    """S3へ直接アップロードされたファイルからテキストを抽出"""
+    try:
+        body = parse_body(event)
+        object_key = body.get("objectKey")
+        file_name = body.get("fileName")
+        file_type = body.get("fileType", "")
+        max_chars = parse_max_chars(body)
+        
+        if not is_upload_key(object_key) or not file_name:
+            return error_response(400, "オブジェクトキーまたはファイル名が正しくありません")
+        
+        # 非同期モード: ジョブIDをすぐに返し、抽出はワーカーで実行する
+        if body.get("async"):
+            payload = {
+                "objectKey": object_key,
+                "fileName": file_name,
+                "fileType": file_type,
+                "maxChars": max_chars
+            }
+            job_id = get_job_store().create(payload)
+            get_job_queue().submit(job_id, payload)
+            return json_response(202, {
                 "success": True,
-                "message": "ファイルが正常に処理されました",
-                "extracted_text": extracted_text,
-                "file_name": file_name,
-                "file_size": len(file_content),
-                "text_length": len(extracted_text)
+                "jobId": job_id,
+                "status": "queued"
             })
-        }
         
+        result = extract_uploaded_object(object_key, file_type, file_name, max_chars)
+        if result is None:
+            return error_response(400, "ファイルサイズが大きすぎます（10MB以下にしてください）")
+        
+        return json_response(200, result)
+        
+    except ExtractionError as e:
+        return error_response(400, str(e))
     except Exception as e:
         logger.error(f"ファイルアップロードエラー: {str(e)}", exc_info=True)
-        return {
-            "statusCode": 500,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*"
-            },
-            "body": json.dumps({
-                "success": False,
-                "error": str(e)
-            })
-        }
+        return error_response(500, str(e))
 
 def lambda_handler(event, context):
+    """リクエストを処理し、段階ごとの処理時間などのメトリクスを出力する"""
+    # ウォームアップ用のイベント（定期実行など）は事前初期化だけを行う
+    if event.get("warmup"):
+        return {"status": "warm", "prewarmed": prewarm(PREWARM_TARGETS, event.get("targets") or ["all"])}
+    
+    begin_request_logging()
+    with request_metrics(operation_from_event(event)) as metrics:
+        result = route_request(event, context)
+        if isinstance(result, dict) and "statusCode" in result:
+            metrics.set_property("StatusCode", result["statusCode"])
+            # Accept-Encoding に応じてレスポンスボディを圧縮する
+            with metrics.span("CompressResponse"):
+                result = compress_response(result, event)
+            if isinstance(result.get("body"), str):
+                metrics.put("ResponseBytes", len(result["body"].encode('utf-8')), "Bytes")
+        return result
+
+def route_request(event, context):
+    # 非同期呼び出しされた抽出ジョブ（API Gatewayを経由しない）
+    if "extractionJob" in event:
+        job = dict(event["extractionJob"])
+        run_extraction_job(job.pop("jobId"), job)
+        return {"status": "completed"}
+    
     try:
-        logger.info(f"Received event: {json.dumps(event)}")
+        # イベント全体（Base64のファイル本体を含む）は、DEBUG時または抽選されたリクエストのみ伏せ字にして出力
+        log_payload("Received event", event)
         
         # HTTPメソッドとパスを取得
         http_method = event.get('httpMethod', '')
@@ -303,18 +562,27 @@ def lambda_handler(event, context):
         
         # OPTIONSリクエスト（CORS preflight）への対応
         if http_method == 'OPTIONS':
-            return {
-                "statusCode": 200,
-                "headers": {
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Headers": "Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token",
-                    "Access-Control-Allow-Methods": "OPTIONS,POST"
-                },
-                "body": ""
-            }
+            return make_response(200)
         
         # パスに基づいてルーティング
-        if '/upload' in path or '/upload' in resource:
+        if '/qa' in path or '/qa' in resource:
+            return handle_qa(event)
+        elif '/sessions/' in path or '/sessions/' in resource:
+            action = (resource if '/sessions/' in resource else path).rsplit('/', 1)[-1]
+            if action not in ("list", "get", "update", "delete"):
+                return error_response(404, "不明なセッション操作です")
+            return handle_sessions(event, action)
+        elif '/grade/batch' in path or '/grade/batch' in resource:
+            return handle_grade_batch(event)
+        elif '/grade' in path or '/grade' in resource:
+            return handle_grade(event)
+        elif '/upload/url' in path or '/upload/url' in resource:
+            return handle_upload_url(event)
+        elif '/upload/complete' in path or '/upload/complete' in resource:
+            return handle_upload_complete(event)
+        elif '/upload/status' in path or '/upload/status' in resource:
+            return handle_upload_status(event)
+        elif '/upload' in path or '/upload' in resource:
             return handle_file_upload(event)
         elif '/chat' in path or '/chat' in resource:
             return handle_chat(event)
@@ -324,130 +592,399 @@ def lambda_handler(event, context):
     
     except Exception as e:
         logger.error(f"Error in lambda_handler: {str(e)}", exc_info=True)
-        return {
-            "statusCode": 500,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token",
-                "Access-Control-Allow-Methods": "OPTIONS,POST"
-            },
-            "body": json.dumps({
-                "success": False,
-                "error": str(e)
+        return error_response(500, str(e))
+
+def resolve_uploaded_files(body):
+    """リクエストのファイル参照（文書ID）を保存済みの抽出テキストに解決
+
+    (解決したファイル情報, 見つからなかった文書のファイル名) を返す。
+    文書は保存期間（文書バケットのライフサイクル）を過ぎると削除されるため、
+    見つからなかった分はプロンプトに含めず、呼び出し元からクライアントに知らせる。
+    """
+    uploaded_files = list(body.get("uploadedFiles", []))
+    for document_id in body.get("documentIds", []):
+        uploaded_files.append({"documentId": document_id})
+
+    resolved = []
+    missing = []
+    for file_info in uploaded_files:
+        document_id = file_info.get("documentId")
+        if document_id and not file_info.get("extractedText"):
+            document = None
+            try:
+                document = load_document(document_id)
+            except Exception as e:
+                logger.error(f"文書の取得に失敗しました: {str(e)}", exc_info=True)
+            if document is None:
+                logger.warning(f"Document not found: {document_id}")
+                missing.append(file_info.get("name") or "Unknown")
+                continue
+            resolved.append({
+                "name": file_info.get("name") or document.get("file_name", "Unknown"),
+                "documentId": document_id,
+                "extractedText": document.get("extracted_text", ""),
+                "retrievalIndex": document.get("retrieval_index")
             })
-        }
+        else:
+            resolved.append(file_info)
+    return resolved, missing
 
-def handle_chat(event):
+def has_file_references(body):
+    """リクエストでファイル参照を指定したか（空のリストはファイルをすべて削除したことを表す）"""
+    return "uploadedFiles" in body or "documentIds" in body
+
+def file_references(body):
+    """リクエストのファイル参照のうち、文書IDを持つもの（セッションに記録する分）"""
+    references = [
+        {"name": file_info.get("name", "Unknown"), "documentId": file_info["documentId"]}
+        for file_info in body.get("uploadedFiles", []) if file_info.get("documentId")
+    ]
+    references += [{"name": "Unknown", "documentId": document_id} for document_id in body.get("documentIds", [])]
+    return references
+
+def seed_messages(conversation_history):
+    """クライアントから受け取った会話履歴のうち、セッションに保存できる発言（直近の分）"""
+    if not isinstance(conversation_history, list):
+        return []
+    messages = [
+        {"role": msg["role"], "content": msg["content"]}
+        for msg in conversation_history
+        if isinstance(msg, dict) and msg.get("role") in ("user", "assistant") and isinstance(msg.get("content"), str)
+    ]
+    return messages[-MAX_SEEDED_MESSAGES:]
+
+def load_chat_session(event, body):
+    """リクエストの sessionId に対応するセッションを読み込む（sessionId がなければ None）
+
+    会話履歴はリクエストでは受け取らず、要約に畳み込まれていない発言だけをストアから読み込む。
+    ただしセッションがまだない場合は、セッション導入前にブラウザだけに保存されていたチャットとして、
+    リクエストの conversationHistory でセッションを初期化する。
+    ファイル参照が指定されたときは（空のリストでも）セッションに記録し、
+    キー自体が省略されたときだけセッションの参照を使う。
+    """
+    session_id = body.get("sessionId")
+    if not session_id:
+        return None
+    store = get_session_store()
+    user_id = user_id_from_event(event)
+    session_id = str(session_id)
+    with span("LoadSession"):
+        session, messages = load_history(store, user_id, session_id)
+    if session is None:
+        seed = seed_messages(body.get("conversationHistory"))
+        if seed:
+            with span("SeedSession"):
+                first_user_message = next((msg["content"] for msg in seed if msg["role"] == "user"), "")
+                store.append_messages(user_id, session_id, seed, title=first_user_message[:30] or None)
+                session, messages = load_history(store, user_id, session_id)
+    session = session or {}
+
+    if has_file_references(body):
+        references = file_references(body)
+        if references != (session.get("files") or []):
+            store.update_session(user_id, session_id, files=references)
+            session["files"] = references
+    elif session.get("files"):
+        body["uploadedFiles"] = session["files"]
+
+    return {"store": store, "user_id": user_id, "session_id": session_id, "session": session, "messages": messages}
+
+def save_chat_turn(chat_session, message, generated_text):
+    """今回のターンをセッションに追記し、古い発言を要約に畳み込む"""
+    new_messages = [
+        {"role": "user", "content": message},
+        {"role": "assistant", "content": generated_text}
+    ]
+    store, user_id, session_id = chat_session["store"], chat_session["user_id"], chat_session["session_id"]
+    with span("SaveSession"):
+        store.append_messages(user_id, session_id, new_messages, title=message[:30])
+        fold_history(store, user_id, session_id, chat_session["session"],
+                     chat_session["messages"] + new_messages, get_history_manager())
+
+def handle_sessions(event, action):
+    """保存済みのチャットセッションの一覧・読み込み・更新・削除"""
     try:
-        logger.info("Handling chat request")
-        
-        # 1) リクエストボディを取得・解析
-        body = json.loads(event.get("body", "{}"))
-        message = body.get("message", "")
-        conversation_history = body.get("conversationHistory", [])
-        uploaded_files = body.get("uploadedFiles", [])
-        
-        logger.info(f"Processing message: {message}")
-        
-        # 2) アップロードされたファイル情報を含めてコンテキストを構築
-        context_message = message
-        if uploaded_files:
-            context_message = f"アップロードされたファイル情報を参考に回答してください。\n\n"
-            for file_info in uploaded_files:
-                context_message += f"ファイル名: {file_info.get('name', 'Unknown')}\n"
-                context_message += f"抽出テキスト: {file_info.get('extractedText', 'No text')}\n\n"
-            context_message += f"ユーザーの質問: {message}"
-
-        # 3) Nova Liteモデル用のリクエストペイロードを作成
-        messages = []
-        
-        # 会話履歴を追加（システムメッセージを除く）
-        for msg in conversation_history:
-            if msg.get("role") != "system":
-                messages.append({
-                    "role": msg["role"],
-                    "content": [{"text": msg["content"]}]
-                })
-        
-        # 現在のユーザーメッセージを追加
+        body = parse_body(event)
+        store = get_session_store()
+        user_id = user_id_from_event(event)
+
+        if action == "list":
+            return json_response(200, {
+                "success": True,
+                "sessions": [session_summary(session) for session in store.list_sessions(user_id)]
+            })
+
+        session_id = body.get("sessionId")
+        if not session_id:
+            return error_response(400, "セッションIDが見つかりません")
+        session_id = str(session_id)
+
+        if action == "get":
+            session = store.get_session(user_id, session_id)
+            if session is None:
+                return error_response(404, "セッションが見つかりません")
+            # limit を指定した場合は直近の発言のみ返す
+            limit = body.get("limit")
+            start = max(0, session["message_count"] - int(limit)) if limit else 0
+            return json_response(200, {
+                "success": True,
+                "session": {
+                    **session_summary(session),
+                    "messages": store.load_messages(user_id, session_id, start),
+                    "uploadedFiles": session.get("files") or [],
+                    "qa": session.get("qa"),
+                    "questionRatings": session.get("question_ratings") or {}
+                }
+            })
+
+        if action == "update":
+            fields = {}
+            if body.get("title"):
+                fields["title"] = str(body["title"])[:100]
+            if "questionRatings" in body:
+                fields["question_ratings"] = body["questionRatings"]
+            if has_file_references(body):
+                fields["files"] = file_references(body)
+            store.update_session(user_id, session_id, **fields)
+            return json_response(200, {"success": True})
+
+        store.delete_session(user_id, session_id)
+        return json_response(200, {"success": True})
+
+    except Exception as e:
+        logger.error(f"セッション操作エラー: {str(e)}", exc_info=True)
+        return error_response(500, str(e))
+
+def select_file_context(uploaded_files, message, token_budget):
+    """各ファイルの索引から質問に関連する箇所をトークン予算内で選択"""
+    indexes = []
+    for file_info in uploaded_files:
+        index = file_info.get("retrievalIndex")
+        if not index or index.get("version") != INDEX_VERSION:
+            # 索引が保存されていないファイルはその場で構築する
+            index = build_index(file_info.get("extractedText") or "")
+        indexes.append((file_info.get('name', 'Unknown'), index))
+    return select_context(indexes, message, token_budget)
+
+def build_chat_messages(message, conversation_history, uploaded_files, context_token_budget=None,
+                        history_summary=None):
+    """ファイル情報と会話履歴からNova Lite用のメッセージ一覧を構築
+
+    history_summary にはセッションに保存済みの要約（conversation_history より前の会話）を渡す。
+    """
+    if context_token_budget is None:
+        context_token_budget = CONTEXT_TOKEN_BUDGET
+
+    # アップロードされたファイル情報を含めてコンテキストを構築
+    context_message = message
+    if uploaded_files:
+        context_message = f"アップロードされたファイル情報を参考に回答してください。\n\n"
+        for file_name, chunks in select_file_context(uploaded_files, message, context_token_budget):
+            context_message += f"ファイル名: {file_name}\n"
+            context_message += f"抽出テキスト: {chr(10).join(chunks)}\n\n"
+        context_message += f"ユーザーの質問: {message}"
+
+    # 会話履歴を予算内に収め、古い部分は要約としてシステムプロンプトに含める
+    summary, window = get_history_manager().prepare(conversation_history)
+    summary = "\n".join(part for part in (history_summary, summary) if part)
+    system = []
+    if summary:
+        system.append({"text": f"これまでの会話の要約:\n{summary}"})
+
+    messages = []
+    
+    # 会話履歴を追加（システムメッセージを除く）
+    for msg in window:
         messages.append({
-            "role": "user",
-            "content": [{"text": context_message}]
+            "role": msg["role"],
+            "content": [{"text": msg["content"]}]
         })
+    
+    # 現在のユーザーメッセージを追加
+    messages.append({
+        "role": "user",
+        "content": [{"text": context_message}]
+    })
+
+    return context_message, messages, system
+
+def summarize_history_with_model(previous_summary, messages, max_tokens):
+    """Bedrockで会話履歴を要約（HISTORY_SUMMARIZER=bedrock の場合に使用）"""
+    transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+    prompt = ("以下の「これまでの要約」と「新しい会話」を統合し、"
+              "後続の会話に必要な事実・質問・回答の要点を簡潔な日本語で要約してください。\n\n"
+              f"【これまでの要約】\n{previous_summary or 'なし'}\n\n【新しい会話】\n{transcript}")
 
-        payload = {
-            "messages": messages,
+    response = get_model_client().invoke_model(
+        modelId='us.amazon.nova-lite-v1:0',
+        body=json.dumps({
+            "messages": [{"role": "user", "content": [{"text": prompt}]}],
             "inferenceConfig": {
-                "temperature": 0.7,
+                "temperature": 0.2,
                 "topP": 0.9,
-                "maxTokens": 1024
+                "maxTokens": max_tokens
             }
+        }),
+        contentType='application/json'
+    )
+    response_body = json.loads(response['body'].read())
+    current_metrics().record_usage(response_body)
+    return remove_markdown_formatting(response_body['output']['message']['content'][0]['text'])
+
+_history_manager = None
+
+def get_history_manager():
+    """会話履歴マネージャーを取得（要約キャッシュをコンテナ内で使い回す）"""
+    global _history_manager
+    if _history_manager is None:
+        summarizer = None
+        if os.environ.get('HISTORY_SUMMARIZER', 'extractive') == 'bedrock':
+            summarizer = summarize_history_with_model
+        _history_manager = history_manager_from_env(summarizer)
+    return _history_manager
+
+def generate_chat_text(message, conversation_history, uploaded_files, context_token_budget=None,
+                       bypass_cache=False, history_summary=None):
+    """チャットの応答をBedrockで生成"""
+    # 2) アップロードされたファイル情報を含めてコンテキストを構築
+    # 3) Nova Liteモデル用のリクエストペイロードを作成
+    with span("BuildPrompt"):
+        _, messages, system = build_chat_messages(
+            message, conversation_history, uploaded_files, context_token_budget, history_summary
+        )
+
+    payload = {
+        "messages": messages,
+        "inferenceConfig": {
+            "temperature": 0.7,
+            "topP": 0.9,
+            "maxTokens": 1024
         }
-        
-        logger.info(f"Bedrock payload: {json.dumps(payload, ensure_ascii=False)}")
+    }
+    if system:
+        payload["system"] = system
+    
+    log_payload("Bedrock payload", payload)
 
-        # 4) Bedrockでテキスト生成を実行
-        response = bedrock.invoke_model(
-            modelId='us.amazon.nova-lite-v1:0',
-            body=json.dumps(payload),
-            contentType='application/json'
+    # 4) Bedrockでテキスト生成を実行（同じプロンプトは応答キャッシュから返す）
+    # 5) レスポンスを解析
+    with span("ModelInvoke"):
+        response_body = invoke_model_cached(
+            get_model_client(), 'us.amazon.nova-lite-v1:0', payload, get_response_cache(), bypass=bypass_cache
         )
+    log_payload("Bedrock response", response_body)
+    
+    # Nova Liteのレスポンス形式から生成テキストを取得
+    generated_text = response_body['output']['message']['content'][0]['text']
+    
+    # マークダウン形式を削除（**強調**など）
+    with span("PostProcess"):
+        return remove_markdown_formatting(generated_text)
 
-        # 5) レスポンスを解析
-        response_body = json.loads(response['body'].read())
-        logger.info(f"Bedrock response: {json.dumps(response_body, ensure_ascii=False)}")
+def handle_chat(event):
+    try:
+        logger.info("Handling chat request")
         
-        # Nova Liteのレスポンス形式から生成テキストを取得
-        generated_text = response_body['output']['message']['content'][0]['text']
+        # 1) リクエストボディを取得・解析
+        with span("ParseRequest"):
+            body = parse_body(event)
+        message = body.get("message", "")
+        conversation_history = body.get("conversationHistory", [])
+        history_summary = None
         
-        # マークダウン形式を削除（**強調**など）
-        generated_text = remove_markdown_formatting(generated_text)
+        # sessionId を指定した場合は、会話履歴とファイル参照をサーバー側のセッションから読み込む
+        chat_session = load_chat_session(event, body)
+        if chat_session is not None:
+            conversation_history = chat_session["messages"]
+            history_summary = chat_session["session"].get("summary")
+        
+        logger.info(f"Processing message: {len(message)} chars, history: {len(conversation_history)} messages")
+        
+        # 記述問題の採点要求はチャットの生成を行わず、採点のみ実行する（モデル呼び出しは1回）
+        generated_text = None
+        missing_documents = []
+        if is_essay_grading_request(message, message, []):
+            generated_text = grade_essay_answer(message, message, [])
+        
+        if generated_text is None:
+            with span("ResolveDocuments"):
+                uploaded_files, missing_documents = resolve_uploaded_files(body)
+            generated_text = generate_chat_text(
+                message, conversation_history, uploaded_files, parse_context_token_budget(body),
+                bypass_cache=bool(body.get("bypassCache")), history_summary=history_summary
+            )
 
-        # 記述問題の採点が要求されているかチェック
-        if is_essay_grading_request(message, context_message, uploaded_files):
-            essay_score = grade_essay_answer(message, context_message, uploaded_files)
-            if essay_score:
-                generated_text = essay_score
+        if chat_session is not None:
+            save_chat_turn(chat_session, message, generated_text)
 
-        # 6) 会話履歴に新しいメッセージを追加
-        updated_history = conversation_history + [
+        # 6) 今回のターンを返す（fullHistory を指定した場合は、直近分に制限した会話履歴全体も返す）
+        new_messages = [
             {"role": "user", "content": message},
             {"role": "assistant", "content": generated_text}
         ]
+        result = {
+            "success": True,
+            "response": generated_text,
+            "newMessages": new_messages
+        }
+        if missing_documents:
+            result["missingDocuments"] = missing_documents
+        if body.get("fullHistory"):
+            result["conversationHistory"] = get_history_manager().cap(conversation_history + new_messages)
 
         # 7) 正常レスポンスを返す
-        return {
-            "statusCode": 200,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token",
-                "Access-Control-Allow-Methods": "OPTIONS,POST"
-            },
-            "body": json.dumps({
-                "success": True,
-                "response": generated_text,
-                "conversationHistory": updated_history
-            }, ensure_ascii=False)
-        }
+        return json_response(200, result)
 
     except Exception as e:
         logger.error(f"Error occurred in chat: {str(e)}", exc_info=True)
         # エラー時のレスポンス
-        return {
-            "statusCode": 500,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token",
-                "Access-Control-Allow-Methods": "OPTIONS,POST"
-            },
-            "body": json.dumps({
-                "success": False,
-                "error": str(e)
-            })
-        }
+        return error_response(500, str(e))
+
+def handle_grade(event):
+    """記述問題1問を採点（チャットを経由しない採点専用ルート）"""
+    try:
+        grading_info = parse_body(event)
+        
+        if not grading_info.get("userAnswer") or not grading_info.get("question"):
+            return error_response(400, "回答または問題が見つかりません")
+        
+        return json_response(200, {
+            "success": True,
+            "response": grade_essay(grading_info)
+        })
+        
+    except Exception as e:
+        logger.error(f"記述問題採点エラー: {str(e)}", exc_info=True)
+        return error_response(500, str(e))
+
+def grade_essays(answers):
+    """複数の記述問題を同時実行数を制限して並列に採点（結果は入力と同じ順番）"""
+    def grade_one(grading_info):
+        try:
+            return {"success": True, "response": grade_essay(grading_info)}
+        except Exception as e:
+            logger.error(f"記述問題採点エラー: {str(e)}", exc_info=True)
+            return {"success": False, "error": str(e)}
+
+    return get_model_client().map(grade_one, answers, max_workers=GRADING_CONCURRENCY)
+
+def handle_grade_batch(event):
+    """クイズの記述問題をまとめて採点"""
+    try:
+        body = parse_body(event)
+        answers = body.get("answers", [])
+        
+        if not answers or len(answers) > MAX_BATCH_GRADING:
+            return error_response(400, f"採点する回答を1〜{MAX_BATCH_GRADING}件指定してください")
+        
+        return json_response(200, {
+            "success": True,
+            "results": grade_essays(answers)
+        })
+        
+    except Exception as e:
+        logger.error(f"一括採点エラー: {str(e)}", exc_info=True)
+        return error_response(500, str(e))
 
 def is_essay_grading_request(message, context_message, uploaded_files):
     """記述問題の採点要求かどうかを判定する関数"""
@@ -464,28 +1001,17 @@ def is_essay_grading_request(message, context_message, uploaded_files):
     
     return False
 
-def grade_essay_answer(message, context_message, uploaded_files):
-    """記述問題の回答を採点する関数"""
-    try:
-        logger.info("記述問題の採点を開始")
-        
-        # メッセージから採点に必要な情報を抽出
-        import json
-        
-        # GRADE_ESSAY_ANSWERマーカーの後にJSON形式で情報が含まれていることを想定
-        if 'GRADE_ESSAY_ANSWER:' in message:
-            json_part = message.split('GRADE_ESSAY_ANSWER:')[1].strip()
-            try:
-                grading_info = json.loads(json_part)
-                user_answer = grading_info.get('userAnswer', '')
-                question = grading_info.get('question', {})
-                points = grading_info.get('points', [])
-                explanation = grading_info.get('explanation', '')
-                
-                logger.info(f"採点情報: 問題={question.get('question', '')[:50]}, 回答長={len(user_answer)}, ポイント数={len(points)}")
-                
-                # Bedrockを使用して採点
-                grading_prompt = f"""以下の記述問題の回答を採点してください。
+def grade_essay(grading_info):
+    """採点情報（回答・問題・採点ポイント・解答例）から記述問題を採点する関数"""
+    user_answer = grading_info.get('userAnswer', '')
+    question = grading_info.get('question', {})
+    points = grading_info.get('points', [])
+    explanation = grading_info.get('explanation', '')
+    
+    logger.info(f"採点情報: 問題={question.get('question', '')[:50]}, 回答長={len(user_answer)}, ポイント数={len(points)}")
+    
+    # Bedrockを使用して採点
+    grading_prompt = f"""以下の記述問題の回答を採点してください。
 
 【問題】
 {question.get('question', '')}
@@ -520,42 +1046,174 @@ def grade_essay_answer(message, context_message, uploaded_files):
 改善点:
 （具体的な改善提案）"""
 
-                # Bedrockで採点を実行
-                messages = [{
-                    "role": "user",
-                    "content": [{"text": grading_prompt}]
-                }]
-
-                payload = {
-                    "messages": messages,
-                    "inferenceConfig": {
-                        "temperature": 0.3,  # 採点では一貫性を重視するため低めに設定
-                        "topP": 0.8,
-                        "maxTokens": 1024
-                    }
-                }
+    # Bedrockで採点を実行
+    metrics = current_metrics()
+    metrics.add("GradedAnswers", 1)
+    messages = [{
+        "role": "user",
+        "content": [{"text": grading_prompt}]
+    }]
 
-                response = bedrock.invoke_model(
-                    modelId='us.amazon.nova-lite-v1:0',
-                    body=json.dumps(payload),
-                    contentType='application/json'
-                )
+    payload = {
+        "messages": messages,
+        "inferenceConfig": {
+            "temperature": 0.3,  # 採点では一貫性を重視するため低めに設定
+            "topP": 0.8,
+            "maxTokens": 1024
+        }
+    }
+
+    # 同じ問題への同一の回答は応答キャッシュの採点結果を返す
+    with metrics.span("ModelInvoke"):
+        response_body = invoke_model_cached(
+            get_model_client(), 'us.amazon.nova-lite-v1:0', payload, get_response_cache(),
+            bypass=bool(grading_info.get('bypassCache'))
+        )
+    grading_result = response_body['output']['message']['content'][0]['text']
+    
+    # マークダウンフォーマッティングを削除
+    with metrics.span("PostProcess"):
+        grading_result = remove_markdown_formatting(grading_result)
+    
+    logger.info("記述問題の採点が完了")
+    return f"📝 記述問題の採点結果\n\n{grading_result}"
 
-                response_body = json.loads(response['body'].read())
-                grading_result = response_body['output']['message']['content'][0]['text']
-                
-                # マークダウンフォーマッティングを削除
-                grading_result = remove_markdown_formatting(grading_result)
-                
-                logger.info("記述問題の採点が完了")
-                return f"📝 記述問題の採点結果\n\n{grading_result}"
-                
+def grade_essay_answer(message, context_message, uploaded_files):
+    """チャットメッセージ内の採点要求（GRADE_ESSAY_ANSWER:）を採点する関数"""
+    try:
+        logger.info("記述問題の採点を開始")
+        
+        # GRADE_ESSAY_ANSWERマーカーの後にJSON形式で情報が含まれていることを想定
+        if 'GRADE_ESSAY_ANSWER:' in message:
+            json_part = message.split('GRADE_ESSAY_ANSWER:')[1].strip()
+            try:
+                grading_info = json.loads(json_part)
             except json.JSONDecodeError as e:
                 logger.error(f"採点情報のJSON解析エラー: {str(e)}")
                 return None
+            return grade_essay(grading_info)
         
         return None
         
     except Exception as e:
         logger.error(f"記述問題採点エラー: {str(e)}", exc_info=True)
         return None
+
+def collect_document_chunks(uploaded_files):
+    """問題集の生成に使う資料のチャンクをファイルの順に集める"""
+    chunks = []
+    for file_info in uploaded_files:
+        index = file_info.get("retrievalIndex")
+        if index and index.get("version") == INDEX_VERSION:
+            chunks.extend(index["chunks"])
+        else:
+            chunks.extend(chunk_text(file_info.get("extractedText") or ""))
+    return chunks
+
+def generate_questions(question_type, count, difficulty, chunks):
+    """1種類の問題をJSON形式で生成し、検証済みの問題を返す（有効な問題がなければ1回だけ再生成）"""
+    payload = {
+        "messages": [
+            {"role": "user", "content": [{"text": build_prompt(question_type, count, difficulty, "\n\n".join(chunks))}]},
+            # 出力をJSONから始めさせる
+            {"role": "assistant", "content": [{"text": "{"}]}
+        ],
+        "inferenceConfig": {
+            "temperature": 0.5,
+            "topP": 0.9,
+            "maxTokens": 2048
+        }
+    }
+
+    for attempt in range(2):
+        # 再生成で別の問題を作れるよう、応答キャッシュは使わない
+        with span("ModelInvoke"):
+            response_body = invoke_model_cached(get_model_client(), 'us.amazon.nova-lite-v1:0', payload)
+        generated_text = response_body['output']['message']['content'][0]['text']
+        try:
+            questions = parse_questions(question_type, "{" + generated_text, count)
+        except ValueError as e:
+            logger.warning(f"問題のJSON解析エラー（{question_type}）: {str(e)}")
+            questions = []
+        if questions:
+            return questions
+    return []
+
+def generate_qa(uploaded_files, difficulty, counts=None):
+    """問題の種類ごとに資料の別々の箇所から並列に問題を生成し、種類の順にまとめる"""
+    counts = parse_counts(counts)
+    jobs = [question_type for question_type in QUESTION_TYPES if counts[question_type] > 0]
+    if not jobs:
+        return []
+    with span("BuildPrompt"):
+        segments = split_segments(collect_document_chunks(uploaded_files), len(jobs), QA_CONTEXT_TOKEN_BUDGET)
+
+    def generate_one(job):
+        question_type, chunks = job
+        try:
+            return generate_questions(question_type, counts[question_type], difficulty, chunks)
+        except Exception as e:
+            logger.error(f"問題生成エラー（{question_type}）: {str(e)}", exc_info=True)
+            return []
+
+    results = get_model_client().map(generate_one, list(zip(jobs, segments)), max_workers=QA_CONCURRENCY)
+    questions = [question for result in results for question in result]
+    current_metrics().add("GeneratedQuestions", len(questions))
+    return questions
+
+def handle_qa(event):
+    """アップロード済みの資料から学習問題集を生成"""
+    try:
+        with span("ParseRequest"):
+            body = parse_body(event)
+        difficulty = body.get("difficulty") or "中"
+        chat_session = load_chat_session(event, body)
+
+        with span("ResolveDocuments"):
+            uploaded_files, missing_documents = resolve_uploaded_files(body)
+            uploaded_files = [file_info for file_info in uploaded_files if file_info.get("extractedText")]
+        if not uploaded_files:
+            if missing_documents:
+                return error_response(400, f"資料の保存期間が過ぎています。再度アップロードしてください: {', '.join(missing_documents)}")
+            return error_response(400, "問題を作成する資料が見つかりません")
+
+        questions = generate_qa(uploaded_files, difficulty, body.get("counts"))
+        if not questions:
+            raise ValueError("問題を生成できませんでした")
+        qa_text = render_markdown(questions, difficulty)
+
+        # 生成した問題集はセッションに保存し、履歴から再利用できるようにする
+        if chat_session is not None:
+            with span("SaveSession"):
+                chat_session["store"].update_session(
+                    chat_session["user_id"], chat_session["session_id"],
+                    qa={"difficulty": difficulty, "questions": questions, "qaText": qa_text}
+                )
+
+        result = {
+            "success": True,
+            "questions": questions,
+            "qaText": qa_text
+        }
+        if missing_documents:
+            result["missingDocuments"] = missing_documents
+        return json_response(200, result)
+
+    except Exception as e:
+        logger.error(f"問題集生成エラー: {str(e)}", exc_info=True)
+        return error_response(500, str(e))
+
+# 事前初期化できる対象（PREWARM_MODULES に all またはカンマ区切りで指定）
+PREWARM_TARGETS = {
+    'bedrock': get_model_client,
+    's3': get_s3_client,
+    'pdf': lambda: lazy_import('PyPDF2'),
+    'pptx': lambda: lazy_import('pptx'),
+    'ppt': lambda: lazy_import('olefile'),
+    'docx': lambda: lazy_import('docx')
+}
+
+# Lambdaの初期化フェーズ（プロビジョニングされた同時実行など）で初期化を済ませる場合に使う
+prewarm_names = prewarm_targets_from_env()
+if prewarm_names:
+    prewarm(PREWARM_TARGETS, prewarm_names)
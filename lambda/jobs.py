@@ -0,0 +1,133 @@
+#lambda/jobs.py
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger()
+
+# 進捗の保存間隔（ページごとに書き込むとストアへのアクセスが多すぎるため）
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+# この時間以上更新されていない実行中のジョブは、ワーカーがタイムアウト・異常終了したとみなす
+# （Lambda関数のタイムアウトに合わせる）
+JOB_TIMEOUT_SECONDS = float(os.environ.get('EXTRACTION_JOB_TIMEOUT_SECONDS', '300'))
+
+# 完了していないジョブの状態
+PENDING_STATUSES = ("queued", "running")
+
+
+class JobStore:
+    """抽出ジョブの状態を保存するクラス（DocumentStore と同じ get/put を持つストアを利用）"""
+
+    def __init__(self, store, prefix="job-"):
+        self.store = store
+        self.prefix = prefix
+
+    def create(self, payload):
+        job_id = uuid.uuid4().hex
+        self.store.put(self.prefix + job_id, {
+            "job_id": job_id,
+            "status": "queued",
+            "file_name": payload.get("fileName"),
+            "units_done": 0,
+            "text_length": 0,
+            "created_at": time.time(),
+            "updated_at": time.time()
+        })
+        return job_id
+
+    def get(self, job_id):
+        return self.store.get(self.prefix + job_id)
+
+    def expire_stale(self, job_id, record, timeout=JOB_TIMEOUT_SECONDS, now=None):
+        """timeout 秒以上更新されていない未完了のジョブをエラーにして、最新の状態を返す"""
+        if record.get("status") not in PENDING_STATUSES:
+            return record
+        now = time.time() if now is None else now
+        if now - record.get("updated_at", record.get("created_at", now)) <= timeout:
+            return record
+        logger.warning(f"抽出ジョブがタイムアウトしました: {job_id}")
+        return self.update(job_id, status="error", error="テキスト抽出がタイムアウトしました。時間をおいて再度アップロードしてください。")
+
+    def update(self, job_id, **fields):
+        record = self.get(job_id) or {"job_id": job_id}
+        record.update(fields)
+        record["updated_at"] = time.time()
+        self.store.put(self.prefix + job_id, record)
+        return record
+
+
+class ProgressReporter:
+    """抽出の進捗を一定間隔でジョブストアに書き込むコールバック"""
+
+    def __init__(self, job_store, job_id, interval=PROGRESS_INTERVAL_SECONDS):
+        self.job_store = job_store
+        self.job_id = job_id
+        self.interval = interval
+        self.last_saved = 0.0
+
+    def __call__(self, units_done, text_length):
+        now = time.monotonic()
+        if now - self.last_saved < self.interval:
+            return
+        self.last_saved = now
+        try:
+            self.job_store.update(self.job_id, status="running", units_done=units_done, text_length=text_length)
+        except Exception as e:
+            logger.error(f"ジョブの進捗の保存に失敗しました: {str(e)}")
+
+
+class InProcessJobQueue:
+    """同一プロセス内のスレッドでジョブを実行するキュー（ローカル実行・テスト用）"""
+
+    def __init__(self, worker, max_workers=2):
+        self.worker = worker
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def submit(self, job_id, payload):
+        future = self.executor.submit(self.worker, job_id, payload)
+        with self.lock:
+            self.futures[job_id] = future
+
+    def wait(self, job_id, timeout=None):
+        """ジョブの完了を待つ（テスト用）"""
+        with self.lock:
+            future = self.futures.get(job_id)
+        if future is not None:
+            future.result(timeout)
+
+
+class LambdaJobQueue:
+    """同じLambda関数を非同期呼び出ししてジョブを実行するキュー（本番用）"""
+
+    def __init__(self, function_name, lambda_client=None):
+        self.function_name = function_name
+        if lambda_client is None:
+            import boto3
+            lambda_client = boto3.client('lambda')
+        self.lambda_client = lambda_client
+
+    def submit(self, job_id, payload):
+        self.lambda_client.invoke(
+            FunctionName=self.function_name,
+            InvocationType='Event',
+            Payload=json.dumps({"extractionJob": {"jobId": job_id, **payload}}).encode('utf-8')
+        )
+
+
+def create_job_queue(worker):
+    """環境変数の設定に従ってジョブキューを作成"""
+    function_name = os.environ.get('AWS_LAMBDA_FUNCTION_NAME')
+    backend = os.environ.get('JOB_QUEUE_BACKEND') or ('lambda' if function_name else 'inprocess')
+
+    if backend == 'lambda':
+        return LambdaJobQueue(function_name)
+    elif backend == 'inprocess':
+        return InProcessJobQueue(worker)
+    raise ValueError(f"不明なジョブキューのバックエンドです: {backend}")
@@ -0,0 +1,114 @@
+#lambda/legacy_doc.py
+import re
+import struct
+
+# Word 97-2003 バイナリ形式（[MS-DOC]）の File Information Block（FIB）内の位置
+FIB_IDENT = 0xA5EC
+FIB_FLAGS_OFFSET = 0x000A
+FIB_CCP_TEXT_OFFSET = 0x004C
+FIB_FC_CLX_OFFSET = 0x01A2
+
+FLAG_ENCRYPTED = 0x0100
+FLAG_WHICH_TABLE_STREAM = 0x0200
+
+# 圧縮された（1文字1バイトの）ピースを示すビット
+FC_COMPRESSED = 0x40000000
+
+# 本文を区切って返す文字数
+BLOCK_CHARS = 16 * 1024
+
+# 改行に変換する制御文字: 段落区切り（\r）、行内改行（\x0b）、改ページ（\x0c）、表のセルの終端（\x07）
+TEXT_TRANSLATION = str.maketrans({'\r': '\n', '\x0b': '\n', '\x0c': '\n', '\x07': '\n'})
+
+# 出力しない制御文字（画像・図形などのアンカー）
+DROPPED_CHARS_PATTERN = re.compile(r'[\x00-\x06\x08\x0e-\x12\x16-\x1f]')
+
+# フィールドの開始（\x13）・区切り（\x14）・終了（\x15）
+FIELD_MARK_PATTERN = re.compile(r'[\x13\x14\x15]')
+
+
+class DocFormatError(ValueError):
+    """DOCファイルの構造が想定と異なる場合の例外"""
+
+
+def read_pieces(word_document, table):
+    """Clx の PlcPcd から (開始CP, 終了CP, ストリーム内の位置, 圧縮の有無) を順に返す"""
+    fc_clx, lcb_clx = struct.unpack_from('<II', word_document, FIB_FC_CLX_OFFSET)
+    if not lcb_clx or fc_clx + lcb_clx > len(table):
+        raise DocFormatError("ピーステーブルが見つかりません")
+
+    position = fc_clx
+    end = fc_clx + lcb_clx
+    # Prc（書式の差分）は読み飛ばし、Pcdt（ピーステーブル）を探す
+    while position < end and table[position] == 0x01:
+        cb_grpprl, = struct.unpack_from('<h', table, position + 1)
+        position += 3 + cb_grpprl
+    if position >= end or table[position] != 0x02:
+        raise DocFormatError("ピーステーブルが見つかりません")
+
+    lcb, = struct.unpack_from('<I', table, position + 1)
+    plc = position + 5
+    count = (lcb - 4) // 12
+    cps = struct.unpack_from(f'<{count + 1}I', table, plc)
+    descriptors = plc + (count + 1) * 4
+    for i in range(count):
+        fc, = struct.unpack_from('<I', table, descriptors + i * 8 + 2)
+        compressed = bool(fc & FC_COMPRESSED)
+        offset = (fc & ~FC_COMPRESSED) // 2 if compressed else fc
+        yield cps[i], cps[i + 1], offset, compressed
+
+
+def iter_raw_text(word_document, table):
+    """本文（メイン文書）の文字列を、ピースごと・一定の文字数ごとに順に返す"""
+    ident, = struct.unpack_from('<H', word_document, 0)
+    if ident != FIB_IDENT:
+        raise DocFormatError("Word文書ではありません")
+    flags, = struct.unpack_from('<H', word_document, FIB_FLAGS_OFFSET)
+    if flags & FLAG_ENCRYPTED:
+        raise DocFormatError("パスワードで保護された文書です")
+    ccp_text, = struct.unpack_from('<I', word_document, FIB_CCP_TEXT_OFFSET)
+
+    for cp_start, cp_end, offset, compressed in read_pieces(word_document, table):
+        if cp_start >= ccp_text:
+            break
+        # 本文より後ろ（脚注・ヘッダーなど）は含めない
+        cp_end = min(cp_end, ccp_text)
+        for block_start in range(cp_start, cp_end, BLOCK_CHARS):
+            block_end = min(block_start + BLOCK_CHARS, cp_end)
+            if compressed:
+                start = offset + (block_start - cp_start)
+                yield word_document[start:start + block_end - block_start].decode('cp1252', errors='replace')
+            else:
+                start = offset + (block_start - cp_start) * 2
+                yield word_document[start:start + (block_end - block_start) * 2].decode('utf-16-le', errors='replace')
+
+
+def table_stream_name(word_document):
+    """FIB のフラグから、ピーステーブルを含むストリーム（0Table / 1Table）の名前を返す"""
+    flags, = struct.unpack_from('<H', word_document, FIB_FLAGS_OFFSET)
+    return '1Table' if flags & FLAG_WHICH_TABLE_STREAM else '0Table'
+
+
+def iter_document_text(word_document, table):
+    """本文のテキストを順に返す（フィールドはコードを除いて表示結果のみ残す）"""
+    # フィールドの入れ子ごとに、コード部分（\x13〜\x14）の中にいるかを記録する
+    fields = []
+    for raw in iter_raw_text(word_document, table):
+        parts = []
+        position = 0
+        for mark in FIELD_MARK_PATTERN.finditer(raw):
+            if not any(fields):
+                parts.append(raw[position:mark.start()])
+            char = mark.group()
+            if char == '\x13':
+                fields.append(True)
+            elif char == '\x14' and fields:
+                fields[-1] = False
+            elif char == '\x15' and fields:
+                fields.pop()
+            position = mark.end()
+        if not any(fields):
+            parts.append(raw[position:])
+        text = DROPPED_CHARS_PATTERN.sub('', "".join(parts)).translate(TEXT_TRANSLATION)
+        if text:
+            yield text
@@ -0,0 +1,172 @@
+#lambda/legacy_ppt.py
+import struct
+
+# OLE2（複合ファイル）のシグネチャ
+OLE_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+# PowerPoint 97-2003 バイナリ形式（[MS-PPT]）のレコード種別
+RT_DOCUMENT = 0x03E8
+RT_SLIDE = 0x03EE
+RT_SLIDE_PERSIST_ATOM = 0x03F3
+RT_TEXT_CHARS_ATOM = 0x0FA0
+RT_TEXT_BYTES_ATOM = 0x0FA8
+RT_SLIDE_LIST_WITH_TEXT = 0x0FF0
+RT_USER_EDIT_ATOM = 0x0FF5
+RT_CURRENT_USER_ATOM = 0x0FF6
+RT_PERSIST_DIRECTORY_ATOM = 0x1772
+
+# SlideListWithText の種類（recInstance）: 0 = スライド, 1 = マスター, 2 = ノート
+SLIDE_LIST_SLIDES = 0
+
+RECORD_HEADER = struct.Struct('<HHI')
+
+# 段落区切り（\r）と行内改行（垂直タブ）を改行に変換する
+TEXT_TRANSLATION = str.maketrans({'\r': '\n', '\x0b': '\n'})
+
+
+class PptFormatError(ValueError):
+    """PPTファイルの構造が想定と異なる場合の例外"""
+
+
+def read_header(data, offset):
+    """offset 位置のレコードヘッダーを (recVer, recInstance, recType, recLen) で返す"""
+    if offset + RECORD_HEADER.size > len(data):
+        raise PptFormatError(f"レコードヘッダーがストリームの範囲外です: {offset}")
+    ver_instance, rec_type, rec_len = RECORD_HEADER.unpack_from(data, offset)
+    return ver_instance & 0x000F, ver_instance >> 4, rec_type, rec_len
+
+
+def decode_text_atom(rec_type, body):
+    """TextCharsAtom（UTF-16LE）/ TextBytesAtom（上位バイトを省略したUnicode）を文字列に変換"""
+    if rec_type == RT_TEXT_CHARS_ATOM:
+        text = body.decode('utf-16-le', errors='replace')
+    else:
+        text = body.decode('latin-1')
+    return text.translate(TEXT_TRANSLATION)
+
+
+def iter_text_atoms(data, start=0, end=None):
+    """start〜end のレコードを先頭から1回だけ走査し、テキストレコードを順に返す
+
+    コンテナ（recVer == 0xF）は中に入り、それ以外のレコードは読み飛ばす。
+    戻り値は (レコード種別, recInstance, 位置, 文字列または None) で、
+    テキスト以外では SlidePersistAtom など呼び出し側が必要なレコードのみを返す。
+    """
+    end = len(data) if end is None else min(end, len(data))
+    offset = start
+    while offset + RECORD_HEADER.size <= end:
+        rec_ver, rec_instance, rec_type, rec_len = read_header(data, offset)
+        body_start = offset + RECORD_HEADER.size
+        body_end = min(body_start + rec_len, end)
+
+        if rec_ver == 0xF:
+            # コンテナの子レコードへ進む
+            yield rec_type, rec_instance, offset, None
+            offset = body_start
+            continue
+
+        if rec_type in (RT_TEXT_CHARS_ATOM, RT_TEXT_BYTES_ATOM):
+            yield rec_type, rec_instance, offset, decode_text_atom(rec_type, data[body_start:body_end])
+        elif rec_type == RT_SLIDE_PERSIST_ATOM:
+            yield rec_type, rec_instance, offset, None
+        offset = body_end
+
+
+def read_persist_directory(data, offset_to_current_edit):
+    """UserEditAtom をたどって永続オブジェクトID → ストリーム内の位置の対応表を作る
+
+    新しい編集の内容を優先するため、最新の UserEditAtom から古い方へたどる。
+    戻り値は (対応表, DocumentContainer の永続オブジェクトID)。
+    """
+    persist = {}
+    doc_persist_id = None
+    offset = offset_to_current_edit
+    visited = set()
+
+    while offset and offset not in visited:
+        visited.add(offset)
+        _, _, rec_type, _ = read_header(data, offset)
+        if rec_type != RT_USER_EDIT_ATOM:
+            raise PptFormatError("UserEditAtom が見つかりません")
+        body = offset + RECORD_HEADER.size
+        offset_last_edit, offset_persist_directory, edit_doc_persist_id = struct.unpack_from('<III', data, body + 8)
+        if doc_persist_id is None:
+            doc_persist_id = edit_doc_persist_id
+
+        _, _, rec_type, rec_len = read_header(data, offset_persist_directory)
+        if rec_type != RT_PERSIST_DIRECTORY_ATOM:
+            raise PptFormatError("PersistDirectoryAtom が見つかりません")
+        position = offset_persist_directory + RECORD_HEADER.size
+        directory_end = position + rec_len
+        while position + 4 <= directory_end:
+            entry, = struct.unpack_from('<I', data, position)
+            persist_id, count = entry & 0xFFFFF, entry >> 20
+            position += 4
+            for i in range(count):
+                # 新しい編集で既に登録されているIDは上書きしない
+                persist.setdefault(persist_id + i, struct.unpack_from('<I', data, position)[0])
+                position += 4
+
+        offset = offset_last_edit
+
+    return persist, doc_persist_id
+
+
+def read_current_edit_offset(current_user):
+    """Current User ストリームの CurrentUserAtom から最新の UserEditAtom の位置を取得"""
+    _, _, rec_type, _ = read_header(current_user, 0)
+    if rec_type != RT_CURRENT_USER_ATOM:
+        raise PptFormatError("CurrentUserAtom が見つかりません")
+    _, _, offset_to_current_edit = struct.unpack_from('<III', current_user, RECORD_HEADER.size)
+    return offset_to_current_edit
+
+
+def record_end(data, offset):
+    _, _, _, rec_len = read_header(data, offset)
+    return offset + RECORD_HEADER.size + rec_len
+
+
+def iter_slide_texts(document, current_user):
+    """スライドの順番どおりに、スライドごとのテキストのリストを返す
+
+    プレースホルダー（タイトル・本文）のテキストは DocumentContainer の SlideListWithText に、
+    テキストボックスのテキストは各スライドの Slide コンテナ内にあるため、両方を合わせる。
+    """
+    persist, doc_persist_id = read_persist_directory(document, read_current_edit_offset(current_user))
+    if doc_persist_id not in persist:
+        raise PptFormatError("DocumentContainer が見つかりません")
+
+    doc_offset = persist[doc_persist_id]
+    _, _, rec_type, _ = read_header(document, doc_offset)
+    if rec_type != RT_DOCUMENT:
+        raise PptFormatError("DocumentContainer が見つかりません")
+
+    # SlideListWithText（スライド用）の範囲を、DocumentContainer を走査して見つける
+    slides = []
+    slide_list_end = None
+    for rec_type, rec_instance, offset, text in iter_text_atoms(document, doc_offset, record_end(document, doc_offset)):
+        if rec_type == RT_SLIDE_LIST_WITH_TEXT:
+            slide_list_end = record_end(document, offset) if rec_instance == SLIDE_LIST_SLIDES else None
+        elif slide_list_end is None or offset >= slide_list_end:
+            continue
+        elif rec_type == RT_SLIDE_PERSIST_ATOM:
+            persist_id_ref, = struct.unpack_from('<I', document, offset + RECORD_HEADER.size)
+            slides.append((persist_id_ref, []))
+        elif text is not None and slides:
+            slides[-1][1].append(text)
+
+    for persist_id_ref, texts in slides:
+        slide_offset = persist.get(persist_id_ref)
+        if slide_offset is not None and read_header(document, slide_offset)[2] == RT_SLIDE:
+            texts.extend(
+                text for _, _, _, text in iter_text_atoms(document, slide_offset, record_end(document, slide_offset))
+                if text is not None
+            )
+        yield texts
+
+
+def iter_all_texts(document):
+    """構造を解析できない場合の代替: ストリーム全体のテキストレコードを出現順に返す"""
+    for _, _, _, text in iter_text_atoms(document):
+        if text is not None:
+            yield text
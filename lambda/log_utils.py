@@ -0,0 +1,107 @@
+#lambda/log_utils.py
+import contextvars
+import json
+import logging
+import os
+import random
+
+from api_responses import parse_body
+
+logger = logging.getLogger()
+
+# ファイル本体や抽出テキストなど、ログに出力しない項目
+REDACTED_KEYS = {
+    'file',
+    'extractedText',
+    'extracted_text',
+    'retrievalIndex',
+    'retrieval_index'
+}
+
+# 文字列1つあたりの最大文字数
+MAX_STRING_CHARS = 200
+
+_payload_sampled = contextvars.ContextVar('payload_sampled', default=False)
+
+
+def configure_logging(target=None):
+    """環境変数 LOG_LEVEL に従ってログレベルを設定（既定は INFO）"""
+    target = target or logger
+    target.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+
+def payload_sample_rate():
+    return float(os.environ.get('LOG_PAYLOAD_SAMPLE_RATE', '0'))
+
+
+def payload_max_chars():
+    return int(os.environ.get('LOG_PAYLOAD_MAX_CHARS', '4000'))
+
+
+def begin_request_logging():
+    """リクエストごとに、ペイロードをログに出力するかを抽選する"""
+    rate = payload_sample_rate()
+    _payload_sampled.set(rate > 0 and random.random() < rate)
+
+
+def truncate(text, max_chars):
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}...({len(text)}文字)"
+
+
+def _size(value):
+    if isinstance(value, (str, bytes, list, dict)):
+        return f"{len(value)}"
+    return type(value).__name__
+
+
+def redact(value, max_string_chars=MAX_STRING_CHARS):
+    """ファイル本体・抽出テキストを伏せ、長い文字列を切り詰めたコピーを返す"""
+    if isinstance(value, dict):
+        redacted = {}
+        for key, item in value.items():
+            if key in REDACTED_KEYS:
+                redacted[key] = f"<redacted: {_size(item)}>"
+            elif key == 'body' and isinstance(item, str):
+                # API Gatewayのイベントのボディ（JSON文字列、Base64化されている場合もある）は中身を伏せてから出力する
+                try:
+                    redacted[key] = redact(parse_body(value), max_string_chars)
+                except ValueError:
+                    redacted[key] = truncate(item, max_string_chars)
+            else:
+                redacted[key] = redact(item, max_string_chars)
+        return redacted
+    if isinstance(value, (list, tuple)):
+        return [redact(item, max_string_chars) for item in value]
+    if isinstance(value, str):
+        return truncate(value, max_string_chars)
+    if isinstance(value, bytes):
+        return f"<bytes: {len(value)}>"
+    return value
+
+
+class LazyPayload:
+    """ログが実際に出力されるときだけ、伏せ字・切り詰め・JSON変換を行う"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        try:
+            text = json.dumps(redact(self.value), ensure_ascii=False, default=str)
+        except Exception as e:
+            text = f"<unserializable: {str(e)}>"
+        return truncate(text, payload_max_chars())
+
+
+def should_log_payload():
+    """DEBUG レベルの場合、または抽選されたリクエストの場合のみペイロードを出力する"""
+    return logger.isEnabledFor(logging.DEBUG) or _payload_sampled.get()
+
+
+def log_payload(label, value):
+    """イベントやモデルの入出力をログに出力（既定では出力しない）"""
+    if not should_log_payload():
+        return
+    logger.info("%s: %s", label, LazyPayload(value))
@@ -0,0 +1,116 @@
+#lambda/markdown_utils.py
+import re
+
+# インライン記法を1つの正規表現（コンパイル済みの状態機械）にまとめ、1回の走査で処理する。
+# 左側から最初に一致した記法が優先されるため、コード内の * や [ は強調・リンクとして扱われない。
+# どの記法も行をまたがない。各分岐をリテラル文字で始めることで、記法の開始文字
+# （*, `, [）以外の位置は正規表現エンジンが高速に読み飛ばせる。
+MARKDOWN_TOKEN_PATTERN = re.compile(r"""
+    \*\*\*(?=\S)(?P<bold_italic>[^\n]+?)(?<=\S)\*\*\*             # ***太字斜体***
+  | \*\*(?=\S)(?P<bold>[^\n]+?)(?<=\S)\*\*                        # **強調**
+  | \*(?<!\*\*)(?=[^\s*])(?P<italic>[^\n]+?)(?<=[^\s*])\*(?!\*)    # *斜体*（行頭の「* 」は箇条書きとして残す）
+  | `(?!`)(?P<code>[^`\n]+)`(?!`)                                  # `コード`（```のコードブロックは残す）
+  | \[(?P<link>[^\]\n]+)\]\([^)\n]+\)                             # [リンク](url)
+""", re.VERBOSE)
+
+# 見出し（# 見出し）と箇条書き（- 項目 / * 項目 / + 項目）の行頭記号
+MARKDOWN_BLOCK_PATTERN = re.compile(r'^[ \t]*(?:#{1,6}[ \t]+|[-*+][ \t]+)', re.MULTILINE)
+
+# 行頭記号（後ろの空白を含む）になる可能性がある未確定の行（ストリーミング時に保留する）
+PENDING_BLOCK_PATTERN = re.compile(r'[ \t]*(?:(?:#{1,6}|[-*+])[ \t]*)?')
+
+# 行頭の「* 」（インライン記法の開始にはならない箇条書き記号）
+STAR_BULLET_PATTERN = re.compile(r'[ \t]*\*[ \t]')
+
+# ストリーミング時に、行が確定するまで出力を保留する記法の開始文字
+MARKER_CHARS = ('*', '`', '[')
+
+
+def _marker_position(text):
+    """最初の記法の開始文字の位置（ない場合は文字列の長さ）"""
+    positions = [text.find(c) for c in MARKER_CHARS if c in text]
+    return min(positions) if positions else len(text)
+
+
+def _replace_token(match):
+    kind = match.lastgroup
+    inner = match.group(kind)
+    if kind == 'code' or not ('*' in inner or '`' in inner or '[' in inner):
+        return inner
+    # 強調やリンクの中に含まれる記法も削除する
+    return MARKDOWN_TOKEN_PATTERN.sub(_replace_token, inner)
+
+
+def remove_markdown_formatting(text, strip_blocks=False):
+    """マークダウンのインライン記法（強調・斜体・コード・リンク）を削除する
+
+    見出しや箇条書きの行頭記号は、問題集の解析やダウンロードで使うため既定では残す。
+    strip_blocks=True の場合はそれらも削除する。
+    """
+    text = MARKDOWN_TOKEN_PATTERN.sub(_replace_token, text)
+    if strip_blocks:
+        text = MARKDOWN_BLOCK_PATTERN.sub('', text)
+    return text
+
+
+class MarkdownStreamStripper:
+    """ストリーミングされるテキストからマークダウンを逐次削除するクラス
+
+    マークダウン記法は行をまたがないため、確定した行はそのまま
+    remove_markdown_formatting に通し、未確定の行は記法の開始文字
+    （*, `, [）より前の部分だけを先に出力する。
+    """
+
+    def __init__(self, strip_blocks=False):
+        self.strip_blocks = strip_blocks
+        self.buffer = ""
+        # 現在の行をまだ1文字も出力していないか（行頭記号の判定に使う）
+        self.at_line_start = True
+
+    def _strip_lines(self, text):
+        if self.strip_blocks and not self.at_line_start:
+            # 行の途中から始まる部分には行頭記号の削除を適用しない
+            first_newline = text.find("\n") + 1 or len(text)
+            return (remove_markdown_formatting(text[:first_newline])
+                    + remove_markdown_formatting(text[first_newline:], True))
+        return remove_markdown_formatting(text, self.strip_blocks)
+
+    def feed(self, chunk):
+        """チャンクを受け取り、出力可能になったテキストを返す"""
+        self.buffer += chunk
+        output = ""
+
+        # 改行までの確定部分を処理
+        last_newline = self.buffer.rfind("\n")
+        if last_newline != -1:
+            output += self._strip_lines(self.buffer[:last_newline + 1])
+            self.buffer = self.buffer[last_newline + 1:]
+            self.at_line_start = True
+
+        # 行頭の見出し・箇条書き記号は、記号かどうか確定するまで保留してから削除する。
+        # 記法の開始文字より前が記号（と空白）だけの場合は、インライン記法を削除した結果が
+        # 行頭記号に含まれる可能性があるため、行が確定するまで保留する
+        if self.strip_blocks and self.at_line_start:
+            bullet = STAR_BULLET_PATTERN.match(self.buffer)
+            start = bullet.end() if bullet else 0
+            if PENDING_BLOCK_PATTERN.fullmatch(self.buffer[:start + _marker_position(self.buffer[start:])]):
+                return output
+            block = MARKDOWN_BLOCK_PATTERN.match(self.buffer)
+            if block:
+                self.buffer = self.buffer[block.end():]
+            self.at_line_start = False
+
+        # 未確定部分は記法の開始文字より前だけを出力
+        safe_end = _marker_position(self.buffer)
+        if safe_end:
+            self.at_line_start = False
+        output += self.buffer[:safe_end]
+        self.buffer = self.buffer[safe_end:]
+        return output
+
+    def flush(self):
+        """残りのバッファを処理して返す"""
+        output = self._strip_lines(self.buffer)
+        self.buffer = ""
+        self.at_line_start = True
+        return output
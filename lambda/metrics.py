@@ -0,0 +1,152 @@
+#lambda/metrics.py
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# コンテナ起動後の最初のリクエストかどうか
+_cold_start = True
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def metrics_enabled():
+    return os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+
+
+def operation_from_event(event):
+    """メトリクスのディメンションに使う処理名（APIのリソースパス）"""
+    if "extractionJob" in event:
+        return "extractionJob"
+    path = event.get('resource') or event.get('path') or ''
+    return path.strip('/') or 'chat'
+
+
+class RequestMetrics:
+    """1リクエスト分の段階ごとの処理時間と計測値
+
+    emit() で CloudWatch Embedded Metric Format（EMF）のJSONを1行出力する。
+    """
+
+    def __init__(self, operation, cold_start=False, namespace=None):
+        self.operation = operation
+        self.cold_start = cold_start
+        self.namespace = namespace or os.environ.get('METRICS_NAMESPACE', 'SimpleChat')
+        self.started_at = time.perf_counter()
+        self.values = {}
+        self.units = {}
+        self.properties = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        """with ブロックの処理時間を {name}Ms として記録（同じ名前は合計する）"""
+        started_at = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed_ms = (time.perf_counter() - started_at) * 1000
+            self.add(f"{name}Ms", elapsed_ms, "Milliseconds")
+
+    def add(self, name, value, unit="Count"):
+        """計測値を加算して記録"""
+        with self.lock:
+            self.values[name] = self.values.get(name, 0) + value
+            self.units[name] = unit
+
+    def put(self, name, value, unit="Count"):
+        """計測値を上書きして記録"""
+        with self.lock:
+            self.values[name] = value
+            self.units[name] = unit
+
+    def set_property(self, name, value):
+        """集計対象外の付加情報（キャッシュヒットの有無など）を記録"""
+        with self.lock:
+            self.properties[name] = value
+
+    def record_usage(self, response_body):
+        """Bedrockのレスポンスに含まれる入出力トークン数を記録"""
+        usage = response_body.get('usage') or {}
+        if 'inputTokens' in usage:
+            self.add("InputTokens", usage['inputTokens'])
+        if 'outputTokens' in usage:
+            self.add("OutputTokens", usage['outputTokens'])
+
+    def to_emf(self):
+        with self.lock:
+            self.values["TotalMs"] = (time.perf_counter() - self.started_at) * 1000
+            self.units["TotalMs"] = "Milliseconds"
+            record = {
+                "_aws": {
+                    "Timestamp": int(time.time() * 1000),
+                    "CloudWatchMetrics": [{
+                        "Namespace": self.namespace,
+                        "Dimensions": [["Operation"]],
+                        "Metrics": [{"Name": name, "Unit": unit} for name, unit in self.units.items()]
+                    }]
+                },
+                "Operation": self.operation,
+                "ColdStart": self.cold_start,
+                **self.properties
+            }
+            for name, value in self.values.items():
+                record[name] = round(value, 2) if isinstance(value, float) else value
+        return record
+
+    def emit(self):
+        # EMFはログ1行がJSONである必要があるため、ロガーの書式を通さずに標準出力へ書く
+        print(json.dumps(self.to_emf(), ensure_ascii=False), flush=True)
+
+
+class _NullMetrics:
+    """計測中のリクエストがない場合に使う何もしない実装"""
+
+    @contextmanager
+    def span(self, name):
+        yield self
+
+    def add(self, name, value, unit="Count"):
+        pass
+
+    def put(self, name, value, unit="Count"):
+        pass
+
+    def set_property(self, name, value):
+        pass
+
+    def record_usage(self, response_body):
+        pass
+
+
+NULL_METRICS = _NullMetrics()
+
+
+def current_metrics():
+    """計測中のリクエストのメトリクスを返す（計測中でなければ何もしない実装）"""
+    return _current.get() or NULL_METRICS
+
+
+@contextmanager
+def request_metrics(operation):
+    """リクエスト全体を計測し、終了時にメトリクスを出力する"""
+    global _cold_start
+    if not metrics_enabled():
+        yield NULL_METRICS
+        return
+
+    metrics = RequestMetrics(operation, cold_start=_cold_start)
+    _cold_start = False
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+        metrics.emit()
+
+
+def span(name):
+    """計測中のリクエストに段階の処理時間を記録する"""
+    return current_metrics().span(name)
@@ -0,0 +1,241 @@
+#lambda/model_client.py
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger()
+
+# 再試行するエラー（スロットリングや一時的な障害）
+RETRYABLE_ERROR_CODES = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceUnavailableException',
+    'InternalServerException',
+    'ModelNotReadyException',
+    'ModelTimeoutException'
+}
+THROTTLING_ERROR_CODES = {'ThrottlingException', 'TooManyRequestsException'}
+
+# ネットワークの一時的なエラー（botocore の例外クラス名）
+RETRYABLE_EXCEPTION_NAMES = {
+    'ReadTimeoutError',
+    'ConnectTimeoutError',
+    'EndpointConnectionError',
+    'ConnectionClosedError'
+}
+
+
+def error_code(error):
+    """botocore の ClientError からエラーコードを取り出す（それ以外は None）"""
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        return response.get('Error', {}).get('Code')
+    return None
+
+
+def is_retryable(error):
+    return error_code(error) in RETRYABLE_ERROR_CODES or type(error).__name__ in RETRYABLE_EXCEPTION_NAMES
+
+
+class TokenBucket:
+    """クライアント側のトークンバケットによるレート制限（rate: 1秒あたりのリクエスト数）
+
+    adaptive=True の場合は、スロットリングされるたびにレートを半分（min_rate まで）に下げ、
+    成功するたびに少しずつ max_rate まで戻す（AIMD）。
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep,
+                 adaptive=False, min_rate=0.5, max_rate=None, increase=0.1):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.adaptive = adaptive
+        self.min_rate = min(min_rate, rate)
+        self.max_rate = max_rate or rate
+        self.increase = increase
+        self.updated_at = clock()
+        self.lock = threading.Lock()
+
+    def on_throttle(self):
+        """スロットリングされたときに呼ぶ（adaptive の場合はレートを下げ、溜まったトークンを捨てる）"""
+        if not self.adaptive:
+            return
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+
+    def on_success(self):
+        """呼び出しが成功したときに呼ぶ（adaptive の場合はレートを少し戻す）"""
+        if not self.adaptive or self.rate >= self.max_rate:
+            return
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def acquire(self):
+        """トークンを1つ取得する（足りない場合は補充されるまで待つ）。待った秒数を返す"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                # 浮動小数点の誤差で待ち時間が0に近づき続けないよう、わずかな不足は許容する
+                if self.tokens >= 1 - 1e-9:
+                    self.tokens = max(0.0, self.tokens - 1)
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+            waited += wait
+
+
+class ModelClient:
+    """Bedrockクライアントのラッパー（再試行・レート制限・並列呼び出し）
+
+    invoke_model は boto3 クライアントと同じ引数で呼び出せる。
+    スロットリングなどの一時的なエラーは、指数バックオフ（フルジッター）で再試行する。
+    deadline を指定した場合は、再試行が最初の呼び出しから deadline 秒以内に終わらない
+    （待ち時間 + 1回の呼び出しの上限 attempt_timeout 秒を足すと超える）ときは再試行しない。
+    API Gatewayがタイムアウトした後にBedrockの呼び出しを続けないため。
+    """
+
+    def __init__(self, client, max_attempts=4, base_delay=0.25, max_delay=8.0,
+                 rate_limiter=None, max_workers=8, deadline=None, attempt_timeout=0.0,
+                 sleep=time.sleep, clock=time.monotonic):
+        self.client = client
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limiter = rate_limiter
+        self.max_workers = max_workers
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.sleep = sleep
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.throttles = 0
+        self.failures = 0
+
+    def backoff(self, attempt):
+        """attempt 回目の失敗後に待つ秒数（フルジッター）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _call(self, method, **kwargs):
+        started_at = self.clock()
+        for attempt in range(self.max_attempts):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            with self.lock:
+                self.calls += 1
+            try:
+                result = method(**kwargs)
+            except Exception as e:
+                throttled = error_code(e) in THROTTLING_ERROR_CODES
+                if throttled and self.rate_limiter is not None:
+                    self.rate_limiter.on_throttle()
+                delay = self.backoff(attempt)
+                out_of_time = (self.deadline is not None
+                               and self.clock() - started_at + delay + self.attempt_timeout > self.deadline)
+                with self.lock:
+                    if throttled:
+                        self.throttles += 1
+                    if not is_retryable(e) or attempt == self.max_attempts - 1 or out_of_time:
+                        self.failures += 1
+                        raise
+                    self.retries += 1
+                logger.warning(f"Bedrockの呼び出しに失敗したため再試行します（{attempt + 1}回目, {delay:.2f}秒後）: {str(e)}")
+                self.sleep(delay)
+            else:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.on_success()
+                return result
+
+    def invoke_model(self, **kwargs):
+        return self._call(self.client.invoke_model, **kwargs)
+
+    def map(self, fn, items, max_workers=None):
+        """items の各要素に fn を並列に適用し、入力と同じ順番で結果を返す"""
+        items = list(items)
+        if not items:
+            return []
+        workers = min(max_workers or self.max_workers, len(items))
+        # スレッドでもリクエストのメトリクスなどのコンテキストを引き継ぐ（Context は要素ごとに複製する）
+        contexts = [contextvars.copy_context() for _ in items]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda context, item: context.run(fn, item), contexts, items))
+
+    def stats(self):
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "throttles": self.throttles,
+                "failures": self.failures
+            }
+
+
+def create_model_client(region_name='us-east-1'):
+    """環境変数の設定に従ってBedrockクライアントを作成"""
+    import boto3
+    from botocore.config import Config
+
+    max_workers = int(os.environ.get('BEDROCK_MAX_CONCURRENCY', '8'))
+    # API Gatewayは29秒で応答を打ち切るため、1回の呼び出しと再試行全体をそれより短くする
+    connect_timeout = float(os.environ.get('BEDROCK_CONNECT_TIMEOUT', '3'))
+    read_timeout = float(os.environ.get('BEDROCK_READ_TIMEOUT', '20'))
+    config = Config(
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        # 並列呼び出しで接続待ちが起きないよう、同時実行数以上の接続を確保する
+        max_pool_connections=max(10, max_workers * 2),
+        # 再試行は ModelClient で行うため botocore 側では行わない
+        retries={'max_attempts': 1, 'mode': 'standard'}
+    )
+    client = boto3.client('bedrock-runtime', region_name=region_name, config=config)
+
+    # BEDROCK_RATE_MODE: adaptive（既定。スロットリングに応じてレートを調整）/ fixed / off
+    mode = os.environ.get('BEDROCK_RATE_MODE', 'adaptive')
+    rate = float(os.environ.get('BEDROCK_RATE_LIMIT', '20'))
+    rate_limiter = None
+    if mode != 'off' and rate > 0:
+        burst = os.environ.get('BEDROCK_RATE_BURST')
+        rate_limiter = TokenBucket(rate, float(burst) if burst else None, adaptive=(mode == 'adaptive'))
+
+    return ModelClient(
+        client,
+        max_attempts=int(os.environ.get('BEDROCK_MAX_ATTEMPTS', '4')),
+        rate_limiter=rate_limiter,
+        max_workers=max_workers,
+        deadline=float(os.environ.get('BEDROCK_RETRY_DEADLINE', '27')),
+        attempt_timeout=connect_timeout + read_timeout
+    )
+
+
+_model_client = None
+_model_client_lock = threading.Lock()
+
+
+def get_model_client():
+    """Bedrockクライアントを取得（初回利用時に作成し、コンテナ内で使い回す）
+
+    boto3 の読み込みとクライアントの作成には時間がかかるため、モジュールの読み込み時には行わない。
+    """
+    global _model_client
+    if _model_client is None:
+        with _model_client_lock:
+            if _model_client is None:
+                _model_client = create_model_client(region_name='us-east-1')
+    return _model_client
+
+
+def set_model_client(client):
+    """Bedrockクライアントを差し替える（テスト・ベンチマーク用）"""
+    global _model_client
+    _model_client = client
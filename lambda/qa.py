@@ -0,0 +1,184 @@
+#lambda/qa.py
+import json
+import re
+
+from tokens import estimate_tokens
+
+CHOICE_LETTERS = "ABCD"
+
+# 問題の種類ごとの既定の問題数・表示名・出力形式
+QUESTION_TYPES = {
+    "multiple": {
+        "count": 4,
+        "label": "4択",
+        "instruction": "正解が1つだけの4択問題",
+        "schema": '{"questions": [{"question": "問題文", "options": ["選択肢1", "選択肢2", "選択肢3", "選択肢4"], '
+                  '"answer": ["A"], "explanation": "正解の理由"}]}'
+    },
+    "multiple-select": {
+        "count": 4,
+        "label": "複数選択",
+        "instruction": "正解が2つ以上ある4択の複数選択問題",
+        "schema": '{"questions": [{"question": "問題文（複数の正解があります）", '
+                  '"options": ["選択肢1", "選択肢2", "選択肢3", "選択肢4"], "answer": ["A", "C"], "explanation": "正解の理由"}]}'
+    },
+    "written": {
+        "count": 2,
+        "label": "記述",
+        "instruction": "文章で答える記述問題",
+        "schema": '{"questions": [{"question": "問題文", "model_answer": "模範解答", "points": ["採点ポイント1", "採点ポイント2"]}]}'
+    }
+}
+
+# 1種類あたりの問題数の上限
+MAX_QUESTIONS_PER_TYPE = 10
+
+# 選択肢の先頭に付いた「A)」「B．」などの記号
+OPTION_PREFIX_PATTERN = re.compile(r'^\s*[A-DＡ-Ｄ]\s*[)）.．:：]\s*')
+
+
+def parse_counts(counts):
+    """リクエストの問題数の指定（種類ごと）を既定値と上限で補正"""
+    counts = counts or {}
+    result = {}
+    for question_type, spec in QUESTION_TYPES.items():
+        count = counts.get(question_type, spec["count"])
+        result[question_type] = max(0, min(int(count), MAX_QUESTIONS_PER_TYPE))
+    return result
+
+
+def split_segments(chunks, count, token_budget):
+    """チャンクを連続した count 個の区間に分け、各区間をトークン予算内に収める
+
+    文書全体が予算に収まる場合は、どの区間にも全体を使う。
+    予算を超える区間からは、偏らないように等間隔でチャンクを選ぶ。
+    """
+    if not chunks:
+        return [[] for _ in range(count)]
+    if sum(estimate_tokens(chunk) for chunk in chunks) <= token_budget:
+        return [list(chunks) for _ in range(count)]
+
+    segments = []
+    size = -(-len(chunks) // count)
+    for i in range(count):
+        # 区間の数よりチャンクが少ない場合は先頭から使い回す
+        start = (i * size) % len(chunks)
+        segment = chunks[start:start + size]
+        segment_tokens = sum(estimate_tokens(chunk) for chunk in segment)
+        if segment_tokens > token_budget:
+            keep = max(1, len(segment) * token_budget // segment_tokens)
+            segment = [segment[j * len(segment) // keep] for j in range(keep)]
+        selected = []
+        used = 0
+        for chunk in segment:
+            tokens = estimate_tokens(chunk)
+            if selected and used + tokens > token_budget:
+                break
+            selected.append(chunk)
+            used += tokens
+        segments.append(selected)
+    return segments
+
+
+def build_prompt(question_type, count, difficulty, context):
+    """問題の種類ごとの生成プロンプト（JSONのみで出力させる）"""
+    spec = QUESTION_TYPES[question_type]
+    return (
+        f"以下の資料の内容を基に、難易度「{difficulty}」の{spec['instruction']}を{count}個作成してください。\n"
+        "資料に書かれている内容だけから出題し、問題同士で内容が重複しないようにしてください。\n\n"
+        "【出力形式】\n"
+        "次の形式のJSONのみを出力してください（前後に説明文やマークダウンを付けないこと）:\n"
+        f"{spec['schema']}\n\n"
+        f"【資料】\n{context}"
+    )
+
+
+def parse_json_object(text):
+    """モデルの出力からJSONオブジェクトを取り出す（コードブロックや前後の文章は無視する）"""
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("JSONが見つかりません")
+    return json.loads(text[start:end + 1])
+
+
+def normalize_answer(answer):
+    """正解の指定（["A", "C"] / "A, C" など）を "A,C" の形式にする"""
+    if isinstance(answer, str):
+        answer = re.findall(r'[A-DＡ-Ｄ]', answer.upper())
+    letters = set()
+    for letter in answer or []:
+        letter = str(letter).strip().upper().translate(str.maketrans("ＡＢＣＤ", "ABCD"))
+        if letter in CHOICE_LETTERS and len(letter) == 1:
+            letters.add(letter)
+    return ",".join(sorted(letters))
+
+
+def validate_question(question_type, item):
+    """1問分の出力を検証し、フロントエンドの問題オブジェクトの形式に変換（不正な場合は None）"""
+    if not isinstance(item, dict):
+        return None
+    question = str(item.get("question") or "").strip()
+    if not question:
+        return None
+
+    if question_type == "written":
+        points = [str(point).strip() for point in item.get("points") or [] if str(point).strip()]
+        model_answer = str(item.get("model_answer") or item.get("explanation") or "").strip()
+        if not model_answer and not points:
+            return None
+        return {"type": "written", "question": question, "explanation": model_answer, "points": points}
+
+    options = [OPTION_PREFIX_PATTERN.sub("", str(option)).strip() for option in item.get("options") or []]
+    if len(options) != 4 or not all(options):
+        return None
+    correct_answer = normalize_answer(item.get("answer"))
+    answer_count = len(correct_answer.split(",")) if correct_answer else 0
+    if question_type == "multiple" and answer_count != 1:
+        return None
+    if question_type == "multiple-select" and answer_count < 2:
+        return None
+    return {
+        "type": question_type,
+        "question": question,
+        "options": [f"{letter}) {option}" for letter, option in zip(CHOICE_LETTERS, options)],
+        "correctAnswer": correct_answer,
+        "explanation": str(item.get("explanation") or "").strip()
+    }
+
+
+def parse_questions(question_type, text, count):
+    """モデルの出力を解析し、検証済みの問題を最大 count 個返す"""
+    data = parse_json_object(text)
+    items = data.get("questions", []) if isinstance(data, dict) else []
+    questions = []
+    seen = set()
+    for item in items:
+        question = validate_question(question_type, item)
+        if question is None or question["question"] in seen:
+            continue
+        seen.add(question["question"])
+        questions.append(question)
+        if len(questions) >= count:
+            break
+    return questions
+
+
+def render_markdown(questions, difficulty):
+    """問題集をマークダウンに変換（プレビュー・ダウンロード・チャット履歴への保存用）"""
+    labels = {question_type: spec["label"] for question_type, spec in QUESTION_TYPES.items()}
+    lines = ["# 学習問題集", "", f"## 難易度: {difficulty}", ""]
+    for number, question in enumerate(questions, 1):
+        lines.append(f"### 問題{number} ({labels[question['type']]})")
+        lines.append(question["question"])
+        lines.append("")
+        if question["type"] == "written":
+            lines.extend(["**解答例:**", question["explanation"], "", "**採点ポイント:**"])
+            lines.extend(f"- {point}" for point in question["points"])
+        else:
+            lines.extend(question["options"])
+            lines.append("")
+            lines.append(f"**正解: {question['correctAnswer'].replace(',', ', ')}**")
+            lines.append(f"**解説: {question['explanation']}**")
+        lines.append("")
+    return "\n".join(lines).rstrip() + "\n"
@@ -0,0 +1,252 @@
+#lambda/response_cache.py
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import current_metrics
+
+logger = logging.getLogger()
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_prompt(text):
+    """空白の違いだけのプロンプトが同じキーになるように正規化"""
+    return WHITESPACE_PATTERN.sub(' ', text).strip()
+
+
+def _normalize_content(content):
+    return [
+        {**block, "text": normalize_prompt(block["text"])} if "text" in block else block
+        for block in content
+    ]
+
+
+def compute_response_key(model_id, payload):
+    """正規化したプロンプト・モデルID・推論設定からキャッシュキーを生成"""
+    normalized = {
+        "model_id": model_id,
+        "system": _normalize_content(payload.get("system", [])),
+        "messages": [
+            {"role": message["role"], "content": _normalize_content(message["content"])}
+            for message in payload.get("messages", [])
+        ],
+        "inference_config": payload.get("inferenceConfig", {})
+    }
+    body = json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """モデル応答のキャッシュの基底クラス（有効期限・件数上限・ヒット率の統計）
+
+    サブクラスは _load / _store / _clear を実装する。
+    """
+
+    def __init__(self, ttl=3600, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self._load(key)
+        now = time.time()
+        with self.stats_lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            value, stored_at = entry
+            if self.ttl and now - stored_at > self.ttl:
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        evicted = self._store(key, value, time.time())
+        if evicted:
+            with self.stats_lock:
+                self.evictions += evicted
+
+    def stats(self):
+        """ヒット/ミス数などの統計情報を返す"""
+        with self.stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+    def clear(self):
+        self._clear()
+
+    def _load(self, key):
+        raise NotImplementedError
+
+    def _store(self, key, value, stored_at):
+        raise NotImplementedError
+
+    def _clear(self):
+        raise NotImplementedError
+
+
+class MemoryResponseCache(ResponseCache):
+    """コンテナ内のLRUによる応答キャッシュ"""
+
+    def __init__(self, ttl=3600, max_entries=1000):
+        super().__init__(ttl, max_entries)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _load(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def _store(self, key, value, stored_at):
+        evicted = 0
+        with self.lock:
+            self.entries[key] = (value, stored_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def _clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SQLiteResponseCache(ResponseCache):
+    """SQLiteファイルによる応答キャッシュ（コンテナの再利用時やローカル実行で共有）"""
+
+    def __init__(self, db_path, ttl=3600, max_entries=1000):
+        super().__init__(ttl, max_entries)
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "cache_key TEXT PRIMARY KEY, "
+            "body TEXT NOT NULL, "
+            "stored_at REAL NOT NULL, "
+            "accessed_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def _load(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT body, stored_at FROM responses WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE cache_key = ?", (time.time(), key)
+            )
+            self.conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def _store(self, key, value, stored_at):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (cache_key, body, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), stored_at, stored_at)
+            )
+            # 上限を超えた分は最後に参照された時刻が古い順に削除
+            evicted = self.conn.execute(
+                "DELETE FROM responses WHERE cache_key IN ("
+                "SELECT cache_key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+            self.conn.commit()
+        return evicted
+
+    def _clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+
+
+def invoke_model_cached(client, model_id, payload, cache=None, bypass=False):
+    """キャッシュを確認してから invoke_model を呼び出し、レスポンスボディ（dict）を返す
+
+    bypass=True の場合はキャッシュを参照せずにモデルを呼び出し、結果でキャッシュを更新する。
+    """
+    metrics = current_metrics()
+    key = None
+    if cache is not None:
+        key = compute_response_key(model_id, payload)
+        if not bypass:
+            cached = cache.get(key)
+            metrics.set_property("ResponseCacheHit", cached is not None)
+            if cached is not None:
+                logger.info(f"Response cache hit, stats: {json.dumps(cache.stats())}")
+                return cached
+
+    response = client.invoke_model(
+        modelId=model_id,
+        body=json.dumps(payload),
+        contentType='application/json'
+    )
+    response_body = json.loads(response['body'].read())
+    metrics.record_usage(response_body)
+
+    if cache is not None:
+        try:
+            cache.put(key, response_body)
+        except Exception as e:
+            logger.error(f"応答キャッシュへの保存に失敗しました: {str(e)}")
+        logger.info(f"Response cache miss, stats: {json.dumps(cache.stats())}")
+    return response_body
+
+
+_response_cache = None
+_response_cache_initialized = False
+
+
+def get_response_cache():
+    """環境変数の設定に従って応答キャッシュを取得（無効な場合は None、コンテナ内で使い回す）"""
+    global _response_cache, _response_cache_initialized
+    if not _response_cache_initialized:
+        backend = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')
+        ttl = int(os.environ.get('RESPONSE_CACHE_TTL', '3600'))
+        max_entries = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+
+        if backend == 'memory':
+            _response_cache = MemoryResponseCache(ttl=ttl, max_entries=max_entries)
+        elif backend == 'sqlite':
+            db_path = os.environ.get('RESPONSE_CACHE_DB_PATH', '/tmp/responses.db')
+            _response_cache = SQLiteResponseCache(db_path, ttl=ttl, max_entries=max_entries)
+        elif backend == 'none':
+            _response_cache = None
+        else:
+            raise ValueError(f"不明な応答キャッシュのバックエンドです: {backend}")
+
+        _response_cache_initialized = True
+        logger.info(f"Response cache initialized: {backend}")
+    return _response_cache
+
+
+def set_response_cache(cache):
+    """応答キャッシュを差し替える（テスト用）"""
+    global _response_cache, _response_cache_initialized
+    _response_cache = cache
+    _response_cache_initialized = True
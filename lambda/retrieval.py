@@ -0,0 +1,138 @@
+#lambda/retrieval.py
+import math
+import re
+from collections import Counter
+
+from tokens import estimate_tokens
+
+INDEX_VERSION = 1
+DEFAULT_CHUNK_CHARS = 400
+
+# 英数字は単語単位、日本語は文字bigram単位で索引化する（形態素解析器なしで動作させるため）
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+CJK_RUN_PATTERN = re.compile(r'[\u3040-\u30FF\u3400-\u9FFF\uF900-\uFAFF]+')
+
+# BM25のパラメータ
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text):
+    """検索用の語（英数字の単語と日本語の文字bigram）に分割"""
+    text = text.lower()
+    terms = WORD_PATTERN.findall(text)
+    for run in CJK_RUN_PATTERN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def chunk_text(text, chunk_chars=DEFAULT_CHUNK_CHARS):
+    """段落の区切りを優先してテキストをチャンクに分割"""
+    chunks = []
+    current = []
+    current_len = 0
+
+    for paragraph in text.split("\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+
+        # 1段落がチャンク上限を超える場合は文字数で分割
+        pieces = [paragraph[i:i + chunk_chars] for i in range(0, len(paragraph), chunk_chars)]
+        for piece in pieces:
+            if current and current_len + len(piece) > chunk_chars:
+                chunks.append("\n".join(current))
+                current = []
+                current_len = 0
+            current.append(piece)
+            current_len += len(piece) + 1
+
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def build_index(text, chunk_chars=DEFAULT_CHUNK_CHARS):
+    """BM25検索用の索引を構築（JSONで保存できる形式）"""
+    chunks = chunk_text(text, chunk_chars)
+    chunk_terms = []
+    doc_freq = Counter()
+    total_len = 0
+
+    for chunk in chunks:
+        counts = Counter(tokenize(chunk))
+        chunk_terms.append(dict(counts))
+        doc_freq.update(counts.keys())
+        total_len += sum(counts.values())
+
+    return {
+        "version": INDEX_VERSION,
+        "chunks": chunks,
+        "chunk_terms": chunk_terms,
+        "chunk_lengths": [sum(terms.values()) for terms in chunk_terms],
+        "chunk_tokens": [estimate_tokens(chunk) for chunk in chunks],
+        "doc_freq": dict(doc_freq),
+        "avg_len": total_len / len(chunks) if chunks else 0.0
+    }
+
+
+def score_chunks(index, query):
+    """クエリに対する各チャンクのBM25スコアを返す"""
+    query_terms = set(tokenize(query))
+    num_chunks = len(index["chunks"])
+    avg_len = index["avg_len"] or 1.0
+    scores = []
+
+    for terms, length in zip(index["chunk_terms"], index["chunk_lengths"]):
+        score = 0.0
+        for term in query_terms:
+            tf = terms.get(term)
+            if not tf:
+                continue
+            df = index["doc_freq"].get(term, 0)
+            idf = math.log(1 + (num_chunks - df + 0.5) / (df + 0.5))
+            score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len))
+        scores.append(score)
+    return scores
+
+
+def select_context(indexes, query, token_budget):
+    """複数文書の索引から、トークン予算内でクエリに関連するチャンクを選択
+
+    indexes は (文書名, 索引) のリスト。戻り値は文書名ごとに選ばれたチャンクを
+    元の出現順に並べたリスト。全文が予算内に収まる場合は全チャンクを返す。
+    最もスコアの高いチャンクは予算を超える場合でも必ず含める。
+    """
+    candidates = []
+    total_tokens = 0
+    for doc_pos, (_, index) in enumerate(indexes):
+        scores = score_chunks(index, query)
+        for chunk_pos, (tokens, score) in enumerate(zip(index["chunk_tokens"], scores)):
+            total_tokens += tokens
+            candidates.append((score, doc_pos, chunk_pos, tokens))
+
+    if total_tokens > token_budget:
+        # スコアの高い順（同点は文書の先頭側を優先）に予算まで詰める
+        candidates.sort(key=lambda c: (-c[0], c[1], c[2]))
+        selected = []
+        used = 0
+        for candidate in candidates:
+            if selected and used + candidate[3] > token_budget:
+                continue
+            selected.append(candidate)
+            used += candidate[3]
+        candidates = selected
+
+    selected_positions = {}
+    for _, doc_pos, chunk_pos, _ in candidates:
+        selected_positions.setdefault(doc_pos, []).append(chunk_pos)
+
+    results = []
+    for doc_pos, (name, index) in enumerate(indexes):
+        positions = sorted(selected_positions.get(doc_pos, []))
+        if positions:
+            results.append((name, [index["chunks"][pos] for pos in positions]))
+    return results
@@ -0,0 +1,427 @@
+#lambda/sessions.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from decimal import Decimal
+
+from startup import lazy_import
+
+logger = logging.getLogger()
+
+# セッションの付加情報（アップロードしたファイルの参照・問題集・問題の評価・会話の要約）
+SESSION_DATA_FIELDS = ("files", "qa", "question_ratings", "summary")
+
+# 一覧で返すセッションの最大件数
+MAX_LISTED_SESSIONS = 100
+
+
+def user_id_from_event(event):
+    """Cognitoオーソライザーのクレームからユーザーを特定（ローカル実行では anonymous）"""
+    claims = ((event.get("requestContext") or {}).get("authorizer") or {}).get("claims") or {}
+    return claims.get("sub") or claims.get("cognito:username") or "anonymous"
+
+
+def session_summary(session):
+    """一覧表示用のセッション情報（問題集などの大きな項目は含めない）"""
+    return {
+        "sessionId": session["session_id"],
+        "title": session.get("title") or "",
+        "createdAt": session.get("created_at"),
+        "updatedAt": session.get("updated_at"),
+        "messageCount": session.get("message_count", 0),
+        "fileCount": len(session.get("files") or []),
+        "hasQA": bool(session.get("qa"))
+    }
+
+
+class SessionStore:
+    """チャットセッションの保存先の基底クラス
+
+    セッションはユーザーIDとセッションIDで識別する。会話の発言は追記のみで、
+    リクエストごとに今回のターンだけを書き込み、必要な範囲（start 番目以降）だけを読み込む。
+    セッションの情報は dict（session_id, title, created_at, updated_at, message_count,
+    summarized_count と SESSION_DATA_FIELDS の各項目）で表す。
+    """
+
+    def get_session(self, user_id, session_id):
+        raise NotImplementedError
+
+    def list_sessions(self, user_id, limit=MAX_LISTED_SESSIONS):
+        """更新日時の新しい順にセッションを返す"""
+        raise NotImplementedError
+
+    def append_messages(self, user_id, session_id, messages, title=None):
+        """発言を追記し、追記後の発言数を返す（セッションがなければ作成する）"""
+        raise NotImplementedError
+
+    def load_messages(self, user_id, session_id, start=0):
+        """start 番目（0始まり）以降の発言を古い順に返す"""
+        raise NotImplementedError
+
+    def update_session(self, user_id, session_id, **fields):
+        """タイトル・summarized_count・付加情報を更新（セッションがなければ作成する）"""
+        raise NotImplementedError
+
+    def delete_session(self, user_id, session_id):
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    """プロセス内のメモリに保存するセッションストア（テスト用）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.messages = {}
+
+    def _session(self, user_id, session_id, now):
+        key = (user_id, session_id)
+        if key not in self.sessions:
+            self.sessions[key] = {"session_id": session_id, "title": "", "created_at": now, "updated_at": now,
+                                  "message_count": 0, "summarized_count": 0}
+            self.messages[key] = []
+        return self.sessions[key]
+
+    def get_session(self, user_id, session_id):
+        with self.lock:
+            session = self.sessions.get((user_id, session_id))
+            return dict(session) if session else None
+
+    def list_sessions(self, user_id, limit=MAX_LISTED_SESSIONS):
+        with self.lock:
+            sessions = [dict(session) for (owner, _), session in self.sessions.items() if owner == user_id]
+        return sorted(sessions, key=lambda session: session["updated_at"], reverse=True)[:limit]
+
+    def append_messages(self, user_id, session_id, messages, title=None):
+        now = time.time()
+        with self.lock:
+            session = self._session(user_id, session_id, now)
+            self.messages[(user_id, session_id)].extend(
+                {"role": msg["role"], "content": msg["content"]} for msg in messages
+            )
+            session["message_count"] += len(messages)
+            session["updated_at"] = now
+            if title and not session["title"]:
+                session["title"] = title
+            return session["message_count"]
+
+    def load_messages(self, user_id, session_id, start=0):
+        with self.lock:
+            return [dict(msg) for msg in self.messages.get((user_id, session_id), [])[start:]]
+
+    def update_session(self, user_id, session_id, **fields):
+        now = time.time()
+        with self.lock:
+            session = self._session(user_id, session_id, now)
+            session.update(fields)
+            session["updated_at"] = now
+
+    def delete_session(self, user_id, session_id):
+        with self.lock:
+            self.sessions.pop((user_id, session_id), None)
+            self.messages.pop((user_id, session_id), None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLiteによるセッションストア（ローカル実行用）"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id TEXT NOT NULL, "
+            "session_id TEXT NOT NULL, "
+            "title TEXT NOT NULL DEFAULT '', "
+            "message_count INTEGER NOT NULL DEFAULT 0, "
+            "summarized_count INTEGER NOT NULL DEFAULT 0, "
+            "data TEXT NOT NULL DEFAULT '{}', "
+            "created_at REAL NOT NULL, "
+            "updated_at REAL NOT NULL, "
+            "PRIMARY KEY (user_id, session_id))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_messages ("
+            "user_id TEXT NOT NULL, "
+            "session_id TEXT NOT NULL, "
+            "seq INTEGER NOT NULL, "
+            "role TEXT NOT NULL, "
+            "content TEXT NOT NULL, "
+            "PRIMARY KEY (user_id, session_id, seq))"
+        )
+        self.conn.commit()
+
+    def _ensure(self, user_id, session_id, now):
+        self.conn.execute(
+            "INSERT OR IGNORE INTO sessions (user_id, session_id, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            (user_id, session_id, now, now)
+        )
+
+    @staticmethod
+    def _to_session(row):
+        session_id, title, message_count, summarized_count, data, created_at, updated_at = row
+        return {"session_id": session_id, "title": title, "created_at": created_at, "updated_at": updated_at,
+                "message_count": message_count, "summarized_count": summarized_count, **json.loads(data)}
+
+    def get_session(self, user_id, session_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT session_id, title, message_count, summarized_count, data, created_at, updated_at "
+                "FROM sessions WHERE user_id = ? AND session_id = ?", (user_id, session_id)
+            ).fetchone()
+        return self._to_session(row) if row else None
+
+    def list_sessions(self, user_id, limit=MAX_LISTED_SESSIONS):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT session_id, title, message_count, summarized_count, data, created_at, updated_at "
+                "FROM sessions WHERE user_id = ? ORDER BY updated_at DESC LIMIT ?", (user_id, limit)
+            ).fetchall()
+        return [self._to_session(row) for row in rows]
+
+    def append_messages(self, user_id, session_id, messages, title=None):
+        now = time.time()
+        with self.lock:
+            self._ensure(user_id, session_id, now)
+            count, = self.conn.execute(
+                "SELECT message_count FROM sessions WHERE user_id = ? AND session_id = ?", (user_id, session_id)
+            ).fetchone()
+            self.conn.executemany(
+                "INSERT INTO session_messages (user_id, session_id, seq, role, content) VALUES (?, ?, ?, ?, ?)",
+                [(user_id, session_id, count + i, msg["role"], msg["content"]) for i, msg in enumerate(messages)]
+            )
+            self.conn.execute(
+                "UPDATE sessions SET message_count = ?, updated_at = ?, "
+                "title = CASE WHEN title = '' THEN ? ELSE title END "
+                "WHERE user_id = ? AND session_id = ?",
+                (count + len(messages), now, title or "", user_id, session_id)
+            )
+            self.conn.commit()
+        return count + len(messages)
+
+    def load_messages(self, user_id, session_id, start=0):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT role, content FROM session_messages WHERE user_id = ? AND session_id = ? AND seq >= ? "
+                "ORDER BY seq", (user_id, session_id, start)
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def update_session(self, user_id, session_id, **fields):
+        now = time.time()
+        with self.lock:
+            self._ensure(user_id, session_id, now)
+            data, = self.conn.execute(
+                "SELECT data FROM sessions WHERE user_id = ? AND session_id = ?", (user_id, session_id)
+            ).fetchone()
+            data = json.loads(data)
+            data.update({name: value for name, value in fields.items() if name in SESSION_DATA_FIELDS})
+            self.conn.execute(
+                "UPDATE sessions SET title = COALESCE(?, title), summarized_count = COALESCE(?, summarized_count), "
+                "data = ?, updated_at = ? WHERE user_id = ? AND session_id = ?",
+                (fields.get("title"), fields.get("summarized_count"), json.dumps(data, ensure_ascii=False),
+                 now, user_id, session_id)
+            )
+            self.conn.commit()
+
+    def delete_session(self, user_id, session_id):
+        with self.lock:
+            self.conn.execute("DELETE FROM sessions WHERE user_id = ? AND session_id = ?", (user_id, session_id))
+            self.conn.execute(
+                "DELETE FROM session_messages WHERE user_id = ? AND session_id = ?", (user_id, session_id)
+            )
+            self.conn.commit()
+
+
+def to_dynamodb(value):
+    """DynamoDBに保存できる値に変換（float は Decimal にする）"""
+    return json.loads(json.dumps(value, ensure_ascii=False), parse_float=Decimal)
+
+
+def from_dynamodb(value):
+    """DynamoDBから読み込んだ値の Decimal を int / float に戻す"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, dict):
+        return {name: from_dynamodb(item) for name, item in value.items()}
+    if isinstance(value, list):
+        return [from_dynamodb(item) for item in value]
+    return value
+
+
+class DynamoDBSessionStore(SessionStore):
+    """DynamoDBによるセッションストア（本番用）
+
+    1つのテーブル（パーティションキー pk・ソートキー sk、どちらも文字列）に、
+    セッションの情報（pk=USER#ユーザーID, sk=SESSION#セッションID）と
+    発言（pk=MESSAGES#ユーザーID#セッションID, sk=連番）を保存する。
+    """
+
+    # 一覧で読み込む項目（問題集や要約などの大きな項目は読み込まない）
+    LIST_ATTRIBUTES = ("pk", "sk", "title", "created_at", "updated_at", "message_count", "summarized_count",
+                       "files", "has_qa")
+
+    def __init__(self, table_name, resource=None):
+        if resource is None:
+            resource = lazy_import('boto3').resource('dynamodb')
+        self.table = resource.Table(table_name)
+
+    @staticmethod
+    def _session_key(user_id, session_id):
+        return {"pk": f"USER#{user_id}", "sk": f"SESSION#{session_id}"}
+
+    @staticmethod
+    def _messages_pk(user_id, session_id):
+        return f"MESSAGES#{user_id}#{session_id}"
+
+    @staticmethod
+    def _to_session(item):
+        session = from_dynamodb({name: value for name, value in item.items() if name not in ("pk", "sk")})
+        session["session_id"] = item["sk"][len("SESSION#"):]
+        session.setdefault("title", "")
+        session.setdefault("message_count", 0)
+        session.setdefault("summarized_count", 0)
+        return session
+
+    def _query_all(self, **query):
+        items = []
+        while True:
+            response = self.table.query(**query)
+            items.extend(response.get("Items", []))
+            if "LastEvaluatedKey" not in response:
+                return items
+            query["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def get_session(self, user_id, session_id):
+        item = self.table.get_item(Key=self._session_key(user_id, session_id)).get("Item")
+        return self._to_session(item) if item else None
+
+    def list_sessions(self, user_id, limit=MAX_LISTED_SESSIONS):
+        conditions = lazy_import('boto3.dynamodb.conditions')
+        items = self._query_all(
+            KeyConditionExpression=conditions.Key("pk").eq(f"USER#{user_id}") & conditions.Key("sk").begins_with("SESSION#"),
+            ProjectionExpression=", ".join(f"#{name}" for name in self.LIST_ATTRIBUTES),
+            ExpressionAttributeNames={f"#{name}": name for name in self.LIST_ATTRIBUTES}
+        )
+        sessions = []
+        for item in items:
+            session = self._to_session(item)
+            session["qa"] = session.pop("has_qa", False)
+            sessions.append(session)
+        return sorted(sessions, key=lambda session: session.get("updated_at", 0), reverse=True)[:limit]
+
+    def append_messages(self, user_id, session_id, messages, title=None):
+        now = to_dynamodb(time.time())
+        expression = "ADD #message_count :n SET #updated_at = :now, #created_at = if_not_exists(#created_at, :now)"
+        names = {"#message_count": "message_count", "#updated_at": "updated_at", "#created_at": "created_at"}
+        values = {":n": len(messages), ":now": now}
+        if title:
+            expression += ", #title = if_not_exists(#title, :title)"
+            names["#title"] = "title"
+            values[":title"] = title
+        # 発言数を原子的に加算し、加算後の値から今回の発言の連番を決める
+        response = self.table.update_item(
+            Key=self._session_key(user_id, session_id),
+            UpdateExpression=expression,
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+            ReturnValues="UPDATED_NEW"
+        )
+        count = int(response["Attributes"]["message_count"])
+        pk = self._messages_pk(user_id, session_id)
+        with self.table.batch_writer() as batch:
+            for seq, msg in enumerate(messages, count - len(messages)):
+                batch.put_item(Item={"pk": pk, "sk": f"{seq:010d}", "role": msg["role"], "content": msg["content"]})
+        return count
+
+    def load_messages(self, user_id, session_id, start=0):
+        conditions = lazy_import('boto3.dynamodb.conditions')
+        items = self._query_all(
+            KeyConditionExpression=conditions.Key("pk").eq(self._messages_pk(user_id, session_id))
+            & conditions.Key("sk").gte(f"{start:010d}")
+        )
+        return [{"role": item["role"], "content": item["content"]} for item in items]
+
+    def update_session(self, user_id, session_id, **fields):
+        if "qa" in fields:
+            # 一覧で問題集の有無を表示するための項目（問題集自体は一覧で読み込まない）
+            fields["has_qa"] = bool(fields["qa"])
+        fields["updated_at"] = time.time()
+        assignments = [f"#{name} = :{name}" for name in fields]
+        assignments.append("#created_at = if_not_exists(#created_at, :updated_at)")
+        names = {f"#{name}": name for name in fields}
+        names["#created_at"] = "created_at"
+        self.table.update_item(
+            Key=self._session_key(user_id, session_id),
+            UpdateExpression="SET " + ", ".join(assignments),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={f":{name}": to_dynamodb(value) for name, value in fields.items()}
+        )
+
+    def delete_session(self, user_id, session_id):
+        self.table.delete_item(Key=self._session_key(user_id, session_id))
+        conditions = lazy_import('boto3.dynamodb.conditions')
+        items = self._query_all(
+            KeyConditionExpression=conditions.Key("pk").eq(self._messages_pk(user_id, session_id)),
+            ProjectionExpression="pk, sk"
+        )
+        with self.table.batch_writer() as batch:
+            for item in items:
+                batch.delete_item(Key={"pk": item["pk"], "sk": item["sk"]})
+
+
+def load_history(store, user_id, session_id):
+    """セッションの情報と、まだ要約に畳み込まれていない発言を返す（セッションがなければ (None, [])）"""
+    session = store.get_session(user_id, session_id)
+    if session is None:
+        return None, []
+    return session, store.load_messages(user_id, session_id, session.get("summarized_count", 0))
+
+
+def fold_history(store, user_id, session_id, session, messages, manager):
+    """直近の発言（manager.max_messages 件）より古い発言を、fold_size 件単位でセッションの要約に畳み込む
+
+    messages は summarized_count 番目以降の発言。畳み込んだ分は以降のリクエストで読み込まない。
+    """
+    overflow = len(messages) - manager.max_messages
+    if overflow < manager.fold_size:
+        return
+    folded = overflow - overflow % manager.fold_size
+    summary = manager.summarizer(session.get("summary") or "", messages[:folded], manager.summary_tokens)
+    store.update_session(user_id, session_id, summary=summary,
+                         summarized_count=session.get("summarized_count", 0) + folded)
+
+
+_session_store = None
+
+
+def get_session_store():
+    """環境変数の設定に従ってセッションストアを取得（コンテナ内で使い回す）"""
+    global _session_store
+    if _session_store is None:
+        backend = os.environ.get('SESSION_STORE_BACKEND')
+        table_name = os.environ.get('SESSION_TABLE')
+        if backend is None:
+            backend = 'dynamodb' if table_name else 'sqlite'
+
+        if backend == 'dynamodb':
+            _session_store = DynamoDBSessionStore(table_name)
+        elif backend == 'sqlite':
+            _session_store = SQLiteSessionStore(os.environ.get('SESSION_DB_PATH', '/tmp/sessions.db'))
+        elif backend == 'memory':
+            _session_store = MemorySessionStore()
+        else:
+            raise ValueError(f"不明なセッションストアのバックエンドです: {backend}")
+
+        logger.info(f"Session store initialized: {backend}")
+    return _session_store
+
+
+def set_session_store(store):
+    """セッションストアを差し替える（テスト用）"""
+    global _session_store
+    _session_store = store
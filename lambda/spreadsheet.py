@@ -0,0 +1,154 @@
+#lambda/spreadsheet.py
+import codecs
+import csv
+import io
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+
+# SpreadsheetML の名前空間
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+# 行をまとめて返す単位（文字数）
+BLOCK_CHARS = 16 * 1024
+
+# 文字コードの判定に使う先頭部分のサイズ
+SNIFF_BYTES = 64 * 1024
+
+
+def column_index(cell_reference):
+    """セル参照（例: "C12"）から0始まりの列番号を返す"""
+    index = 0
+    for char in cell_reference:
+        if not char.isalpha():
+            break
+        index = index * 26 + (ord(char.upper()) - ord('A') + 1)
+    return index - 1
+
+
+def read_shared_strings(archive):
+    """共有文字列テーブル（xl/sharedStrings.xml）を読み込む"""
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+    strings = []
+    with archive.open('xl/sharedStrings.xml') as f:
+        for _, element in ET.iterparse(f):
+            if element.tag == f'{MAIN_NS}si':
+                # リッチテキストは複数の <t> に分かれているため連結する
+                strings.append("".join(t.text or "" for t in element.iter(f'{MAIN_NS}t')))
+                element.clear()
+    return strings
+
+
+def read_sheet_paths(archive):
+    """ブックのシートを (シート名, ZIP内のパス) で表示順に返す"""
+    with archive.open('xl/_rels/workbook.xml.rels') as f:
+        targets = {
+            rel.get('Id'): rel.get('Target')
+            for rel in ET.parse(f).getroot().iter(f'{PACKAGE_REL_NS}Relationship')
+        }
+    with archive.open('xl/workbook.xml') as f:
+        sheets = ET.parse(f).getroot().iter(f'{MAIN_NS}sheet')
+        result = []
+        for sheet in sheets:
+            target = targets.get(sheet.get(f'{REL_NS}id'))
+            if not target:
+                continue
+            path = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+            result.append((sheet.get('name'), path))
+    return result
+
+
+def cell_text(cell, shared_strings):
+    cell_type = cell.get('t')
+    if cell_type == 'inlineStr':
+        return "".join(t.text or "" for t in cell.iter(f'{MAIN_NS}t'))
+    value = cell.find(f'{MAIN_NS}v')
+    if value is None or value.text is None:
+        return ""
+    if cell_type == 's':
+        index = int(value.text)
+        return shared_strings[index] if index < len(shared_strings) else ""
+    if cell_type == 'b':
+        return "TRUE" if value.text == '1' else "FALSE"
+    return value.text
+
+
+def iter_sheet_rows(archive, path, shared_strings):
+    """シートの行を、セルの値のリストとして1行ずつ返す（シート全体をメモリに載せない）"""
+    with archive.open(path) as f:
+        for _, element in ET.iterparse(f):
+            if element.tag != f'{MAIN_NS}row':
+                continue
+            values = []
+            for cell in element.iter(f'{MAIN_NS}c'):
+                reference = cell.get('r')
+                if reference:
+                    # 空のセルは省略されているため、列の位置を合わせる
+                    index = column_index(reference)
+                    values.extend([""] * (index - len(values)))
+                values.append(cell_text(cell, shared_strings))
+            element.clear()
+            if any(values):
+                yield values
+
+
+def iter_blocks(lines):
+    """行を一定の文字数ごとにまとめて返す"""
+    block = []
+    size = 0
+    for line in lines:
+        block.append(line)
+        size += len(line)
+        if size >= BLOCK_CHARS:
+            yield "".join(block)
+            block = []
+            size = 0
+    if block:
+        yield "".join(block)
+
+
+def iter_xlsx_lines(file_content):
+    archive = zipfile.ZipFile(io.BytesIO(file_content))
+    with archive:
+        shared_strings = read_shared_strings(archive)
+        for sheet_name, path in read_sheet_paths(archive):
+            if path not in archive.namelist():
+                continue
+            yield f"--- シート: {sheet_name} ---\n"
+            for values in iter_sheet_rows(archive, path, shared_strings):
+                yield "\t".join(values).rstrip("\t") + "\n"
+            yield "\n"
+
+
+def iter_xlsx_text(file_content):
+    """XLSXのテキストをシート・行の順に返す（行はタブ区切り）"""
+    return iter_blocks(iter_xlsx_lines(file_content))
+
+
+def detect_csv_encoding(file_content):
+    """CSVの文字コードを判定（UTF-8として読めない場合はExcelが出力するShift_JIS（cp932）とみなす）"""
+    if file_content.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        # 先頭部分の末尾で文字が途切れていてもエラーにしない
+        decoder.decode(file_content[:SNIFF_BYTES], final=len(file_content) <= SNIFF_BYTES)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'cp932'
+
+
+def iter_csv_lines(file_content):
+    stream = io.TextIOWrapper(io.BytesIO(file_content), encoding=detect_csv_encoding(file_content),
+                              errors='replace', newline='')
+    for row in csv.reader(stream):
+        if any(row):
+            yield "\t".join(row) + "\n"
+
+
+def iter_csv_text(file_content):
+    """CSVのテキストを行の順に返す（行はタブ区切り）"""
+    return iter_blocks(iter_csv_lines(file_content))
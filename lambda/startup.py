@@ -0,0 +1,65 @@
+#lambda/startup.py
+import importlib
+import logging
+import os
+import threading
+import time
+
+from metrics import current_metrics
+
+logger = logging.getLogger()
+
+_modules = {}
+_lock = threading.Lock()
+
+
+def lazy_import(name):
+    """重いモジュール（PDF・PowerPoint・Wordの解析ライブラリなど）を初回利用時に一度だけ読み込む
+
+    読み込みにかかった時間は、そのリクエストのメトリクスに ModuleImportMs として記録する。
+    """
+    module = _modules.get(name)
+    if module is not None:
+        return module
+    with _lock:
+        module = _modules.get(name)
+        if module is None:
+            started_at = time.perf_counter()
+            module = importlib.import_module(name)
+            elapsed_ms = (time.perf_counter() - started_at) * 1000
+            current_metrics().add("ModuleImportMs", elapsed_ms, "Milliseconds")
+            logger.info(f"Module loaded: {name} ({elapsed_ms:.1f}ms)")
+            _modules[name] = module
+    return module
+
+
+def prewarm_targets_from_env():
+    """環境変数 PREWARM_MODULES（カンマ区切り、all で全て）から事前初期化する対象を取得"""
+    value = os.environ.get('PREWARM_MODULES', '').strip()
+    if not value:
+        return []
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def prewarm(targets, names):
+    """指定された対象を事前に初期化し、対象ごとの所要時間（ミリ秒）を返す
+
+    初期化の失敗はリクエストの処理に影響させず、ログに記録するだけにする。
+    """
+    if 'all' in names:
+        names = list(targets)
+    timings = {}
+    for name in names:
+        loader = targets.get(name)
+        if loader is None:
+            logger.warning(f"不明な事前初期化の対象です: {name}")
+            continue
+        started_at = time.perf_counter()
+        try:
+            loader()
+        except Exception as e:
+            logger.error(f"事前初期化に失敗しました: {name}: {str(e)}")
+            continue
+        timings[name] = round((time.perf_counter() - started_at) * 1000, 1)
+    logger.info(f"Prewarmed: {timings}")
+    return timings
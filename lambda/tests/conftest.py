@@ -0,0 +1,83 @@
+#lambda/tests/conftest.py
+import base64
+import io
+import json
+import os
+import sys
+
+import pytest
+
+# Lambda関数のモジュール（index.py など）はデプロイ時と同じくトップレベルで import する
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import document_store  # noqa: E402
+import extraction_cache  # noqa: E402
+import index  # noqa: E402
+import model_client  # noqa: E402
+import sessions  # noqa: E402
+from document_store import SQLiteDocumentStore  # noqa: E402
+from extraction_cache import ExtractionCache  # noqa: E402
+from model_client import ModelClient  # noqa: E402
+from sessions import MemorySessionStore  # noqa: E402
+
+
+class StubBedrock:
+    """固定の応答を返すBedrockクライアントのスタブ
+
+    受け取ったリクエスト（デコード済み）は requests に、その文字列表現は prompts に記録する。
+    """
+
+    def __init__(self, text="回答です"):
+        self.text = text
+        self.requests = []
+        self.prompts = []
+
+    def invoke_model(self, modelId, body, contentType=None, **kwargs):
+        payload = json.loads(body)
+        self.requests.append(payload)
+        self.prompts.append(json.dumps(payload, ensure_ascii=False))
+        response_body = {"output": {"message": {"content": [{"text": self.text}]}},
+                         "usage": {"inputTokens": 10, "outputTokens": 20}}
+        return {"body": io.BytesIO(json.dumps(response_body).encode('utf-8'))}
+
+
+@pytest.fixture
+def bedrock(monkeypatch):
+    """StubBedrock を ModelClient 経由で使うように差し替える"""
+    stub = StubBedrock()
+    monkeypatch.setattr(model_client, "_model_client", ModelClient(stub, sleep=lambda seconds: None))
+    return stub
+
+
+@pytest.fixture
+def documents(tmp_path, monkeypatch):
+    """テストごとの文書ストアと、それを永続レイヤーに使う抽出キャッシュ（EXTRACTION_CACHE_PERSISTENT=true 相当）"""
+    store = SQLiteDocumentStore(str(tmp_path / "documents.db"))
+    monkeypatch.setattr(document_store, "_document_store", store)
+    monkeypatch.setattr(document_store, "_document_cache", None)
+    monkeypatch.setattr(extraction_cache, "_extraction_cache", ExtractionCache(persistent=store))
+    return store
+
+
+@pytest.fixture
+def session_store(monkeypatch):
+    store = MemorySessionStore()
+    monkeypatch.setattr(sessions, "_session_store", store)
+    return store
+
+
+def api_event(path, body, base64_encoded=False):
+    """API Gateway（Lambdaプロキシ統合）から渡されるイベント"""
+    raw = json.dumps(body, ensure_ascii=False)
+    if base64_encoded:
+        raw = base64.b64encode(raw.encode('utf-8')).decode('ascii')
+    return {"httpMethod": "POST", "path": path, "resource": path, "body": raw, "isBase64Encoded": base64_encoded}
+
+
+@pytest.fixture
+def api():
+    """ルートを呼び出し、(ステータスコード, デコード済みのボディ) を返す関数"""
+    def call(path, body, base64_encoded=False):
+        response = index.route_request(api_event(path, body, base64_encoded), None)
+        return response["statusCode"], json.loads(response["body"])
+    return call
@@ -0,0 +1,23 @@
+#lambda/tests/test_chat.py
+import pytest
+
+import index
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, index.CONTEXT_TOKEN_BUDGET),
+    ("1500", 1500),
+    ("多め", index.CONTEXT_TOKEN_BUDGET),
+    ([1], index.CONTEXT_TOKEN_BUDGET),
+    (10 ** 9, index.MAX_CONTEXT_TOKEN_BUDGET),
+    (-5, 0)
+])
+def test_parse_context_token_budget(value, expected):
+    assert index.parse_context_token_budget({"contextTokenBudget": value}) == expected
+
+
+def test_chat_accepts_invalid_context_token_budget(bedrock, api):
+    status, body = api("/chat", {"message": "質問です", "contextTokenBudget": "abc"})
+
+    assert status == 200
+    assert body["response"] == "回答です"
@@ -0,0 +1,44 @@
+#lambda/tests/test_document_store.py
+import pytest
+
+import document_store
+from document_store import DocumentCache, load_document
+
+
+@pytest.fixture
+def reads(documents, monkeypatch):
+    """文書ストアからの読み込み回数"""
+    calls = []
+    get_raw = documents.get_raw
+    monkeypatch.setattr(documents, "get_raw", lambda document_id: calls.append(document_id) or get_raw(document_id))
+    return calls
+
+
+def test_load_document_reads_store_once(documents, reads):
+    documents.put("doc1", {"extracted_text": "本文", "retrieval_index": {"chunks": ["本文"]}})
+
+    for _ in range(3):
+        assert load_document("doc1")["extracted_text"] == "本文"
+
+    assert len(reads) == 1
+    assert document_store.get_document_cache().stats()["hits"] == 2
+
+
+def test_missing_document_is_not_cached(reads):
+    assert load_document("missing") is None
+    assert load_document("missing") is None
+    assert len(reads) == 2
+
+
+def test_cache_is_bounded_by_stored_bytes():
+    cache = DocumentCache(max_bytes=100)
+    for n in range(5):
+        cache.put(f"doc{n}", {"n": n}, 40)
+
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["total_bytes"] == 80 and stats["evictions"] == 3
+    assert cache.get("doc0") is None
+    assert cache.get("doc4") == {"n": 4}
+
+    cache.put("huge", {}, 101)
+    assert cache.get("huge") is None
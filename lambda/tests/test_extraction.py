@@ -0,0 +1,56 @@
+#lambda/tests/test_extraction.py
+import pytest
+
+import extraction_cache
+import index
+from document_store import compute_document_id
+from extraction_engine import ExtractionError
+
+
+def test_failed_extraction_is_not_cached_or_stored(documents):
+    broken_pdf = b"%PDF-1.4\nbroken"
+
+    for _ in range(2):
+        with pytest.raises(ExtractionError, match="PDFの処理中にエラーが発生しました"):
+            index.extract_and_store(broken_pdf, "application/pdf", "broken.pdf", 1000)
+
+    stats = extraction_cache.get_extraction_cache().stats()
+    assert stats["hits"] == 0 and stats["persistent_hits"] == 0 and stats["entries"] == 0
+    assert documents.get(compute_document_id(broken_pdf, 1000)) is None
+
+
+def test_unsupported_format_raises(documents):
+    with pytest.raises(ExtractionError, match="サポートされていないファイル形式です"):
+        index.process_file_content(b"\x00\x01binary", "application/octet-stream", "data.bin")
+
+
+def test_successful_extraction_is_cached_and_stored(documents):
+    content = "教科書の本文です。\n".encode('utf-8')
+
+    first = index.extract_and_store(content, "text/plain", "notes.txt", 1000)
+    second = index.extract_and_store(content, "text/plain", "notes.txt", 1000)
+
+    assert first["extracted_text"] == second["extracted_text"] == "教科書の本文です。\n"
+    assert extraction_cache.get_extraction_cache().stats()["hits"] == 1
+    assert documents.get(first["document_id"])["extracted_text"] == "教科書の本文です。\n"
+
+
+def test_documents_with_different_max_chars_are_stored_separately(documents):
+    content = ("あ" * 50).encode('utf-8')
+
+    short = index.extract_and_store(content, "text/plain", "short.txt", 10)
+    full = index.extract_and_store(content, "text/plain", "full.txt", 1000)
+    again = index.extract_and_store(content, "text/plain", "renamed.txt", 10)
+
+    assert short["document_id"] != full["document_id"]
+    assert again["document_id"] == short["document_id"]
+    assert documents.get(full["document_id"])["extracted_text"] == "あ" * 50
+    stored = documents.get(short["document_id"])
+    assert stored["extracted_text"].startswith("あ" * 10 + "\n...")
+    assert stored["file_name"] == "short.txt"
+
+
+def test_upload_route_returns_extraction_error(documents, api):
+    status, body = api("/upload", {"file": "JVBERi0xLjQKYnJva2Vu", "fileName": "broken.pdf", "fileType": "application/pdf"})
+    assert status == 400
+    assert "PDFの処理中にエラーが発生しました" in body["error"]
@@ -0,0 +1,54 @@
+#lambda/tests/test_extraction_engine.py
+import os
+import threading
+
+import pytest
+
+from extraction_engine import PARALLEL_MIN_UNITS, collect_text, iter_units
+
+
+def extract_with_pid(document, index):
+    return (document[index], os.getpid())
+
+
+@pytest.fixture
+def background_thread():
+    """ジョブのワーカーなど、別のスレッドが動いている状態を再現する"""
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait, daemon=True)
+    thread.start()
+    yield thread
+    stop.set()
+    thread.join()
+
+
+def test_iter_units_keeps_page_order_in_workers():
+    if threading.active_count() > 1:
+        pytest.skip("別のスレッドが動いているため並列化されない")
+    pages = [f"page{n}" for n in range(PARALLEL_MIN_UNITS * 2)]
+
+    results = list(iter_units(pages, len(pages), extract_with_pid, workers=2))
+
+    assert [text for text, _ in results] == pages
+    assert os.getpid() not in {pid for _, pid in results}
+
+
+def test_iter_units_runs_serially_while_other_threads_are_alive(background_thread):
+    pages = [f"page{n}" for n in range(PARALLEL_MIN_UNITS * 2)]
+
+    results = list(iter_units(pages, len(pages), extract_with_pid, workers=2))
+
+    assert [text for text, _ in results] == pages
+    assert {pid for _, pid in results} == {os.getpid()}
+
+
+def test_collect_text_stops_at_max_chars():
+    consumed = []
+
+    def chunks():
+        for n in range(10):
+            consumed.append(n)
+            yield "x" * 10
+
+    assert collect_text(chunks(), max_chars=25) == "x" * 30
+    assert consumed == [0, 1, 2]
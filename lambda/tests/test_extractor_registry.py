@@ -0,0 +1,94 @@
+#lambda/tests/test_extractor_registry.py
+import io
+import struct
+import zipfile
+
+import pytest
+
+from extractor_registry import OLE_MAGIC, ExtractorRegistry, list_ole_streams
+from index import extractors
+
+SECTOR_SIZE = 512
+FREE_SECTOR = 0xFFFFFFFF
+END_OF_CHAIN = 0xFFFFFFFE
+FAT_SECTOR = 0xFFFFFFFD
+NO_STREAM = 0xFFFFFFFF
+
+
+def directory_entry(name, entry_type, start_sector=END_OF_CHAIN, size=0, child=NO_STREAM, right=NO_STREAM):
+    encoded = (name + "\x00").encode('utf-16-le') if name else b""
+    return (encoded.ljust(64, b"\x00")
+            + struct.pack('<HBB', len(encoded), entry_type, 1)
+            + struct.pack('<III', NO_STREAM, right, child)
+            + b"\x00" * 36 + struct.pack('<IQ', start_sector, size))
+
+
+def build_compound_file(streams):
+    """ストリーム名の一覧から OLE2 複合ファイルを作る（各ストリームは 4096 バイトで、ミニストリームを使わない）"""
+    data = b"\x00" * 4096
+    sectors = len(data) // SECTOR_SIZE
+    fat = [FAT_SECTOR, END_OF_CHAIN]
+    starts = []
+    for _ in streams:
+        starts.append(len(fat))
+        fat.extend(range(len(fat) + 1, len(fat) + sectors))
+        fat.append(END_OF_CHAIN)
+    fat.extend([FREE_SECTOR] * (SECTOR_SIZE // 4 - len(fat)))
+
+    # 名前は (長さ, 大文字) の順で比較されるため、短い名前を子、長い名前をその右の兄弟にする
+    order = sorted(range(len(streams)), key=lambda i: (len(streams[i]), streams[i].upper()))
+    entries = [directory_entry("Root Entry", 5, child=order[0] + 1)]
+    for i, name in enumerate(streams):
+        position = order.index(i)
+        right = order[position + 1] + 1 if position + 1 < len(order) else NO_STREAM
+        entries.append(directory_entry(name, 2, starts[i], len(data), right=right))
+    while len(entries) < SECTOR_SIZE // 128:
+        entries.append(directory_entry("", 0))
+
+    header = (OLE_MAGIC + b"\x00" * 16
+              + struct.pack('<HHHHH', 0x3E, 3, 0xFFFE, 9, 6) + b"\x00" * 6
+              + struct.pack('<IIIIIIIII', 0, 1, 1, 0, 4096, END_OF_CHAIN, 0, END_OF_CHAIN, 0)
+              + struct.pack('<109I', 0, *[FREE_SECTOR] * 108))
+    return header + struct.pack(f'<{len(fat)}I', *fat) + b"".join(entries) + data * len(streams)
+
+
+def build_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for member in members:
+            archive.writestr(member, "<xml/>")
+    return buffer.getvalue()
+
+
+def test_ole_streams_are_listed():
+    assert list_ole_streams(build_compound_file(["WordDocument", "1Table"])) == {"WordDocument", "1Table"}
+
+
+@pytest.mark.parametrize("content, file_type, file_name, expected", [
+    # マジックバイトが拡張子・MIMEタイプより優先される
+    (b"%PDF-1.4\n", "text/plain", "report.txt", "pdf"),
+    (build_zip(["[Content_Types].xml", "xl/workbook.xml"]), "application/octet-stream", "book.bin", "xlsx"),
+    (build_zip(["word/document.xml"]), "", "renamed.pptx", "docx"),
+    (build_zip(["ppt/presentation.xml"]), "", "slides", "pptx"),
+    # OLE2 はストリーム名で判定する
+    (build_compound_file(["WordDocument", "1Table"]), "application/vnd.ms-powerpoint", "old.ppt", "doc"),
+    (build_compound_file(["Current User", "PowerPoint Document"]), "", "old.doc", "ppt"),
+    # 壊れたコンテナや判定できないコンテナは拡張子、MIMEタイプの順で判定する
+    (OLE_MAGIC + b"broken", "", "broken.doc", "doc"),
+    (build_compound_file(["Workbook"]), "application/msword", "book.xls", "doc"),
+    (b"a,b\n1,2\n", "application/octet-stream", "data.csv", "csv"),
+    (b"plain", "text/markdown", "notes.md", "txt"),
+    (b"\x00\x01binary", "application/octet-stream", "data.bin", None)
+])
+def test_detect(content, file_type, file_name, expected):
+    assert extractors.detect(content, file_type, file_name) == expected
+
+
+def test_registration_order_breaks_ties():
+    registry = ExtractorRegistry()
+    registry.register('first', None, 'First', extensions=('.dat',))
+    registry.register('second', None, 'Second', extensions=('.dat',), mime_types=('application/x-data',))
+
+    assert registry.detect(b"", "application/x-data", "a.dat") == "first"
+    assert registry.detect(b"", "application/x-data", "a") == "second"
+    assert registry.labels() == "First, Second"
@@ -0,0 +1,73 @@
+#lambda/tests/test_history.py
+import json
+
+from history import HistoryManager, summarize_extractive
+from tokens import estimate_tokens
+
+TURNS = 200
+
+
+def turn_messages(turn):
+    return [
+        {"role": "user", "content": f"問題{turn}の答えはBだと思います。理由は教科書の第{turn}節に書かれているからです。"},
+        {"role": "assistant", "content": f"問題{turn}について解説します。" + "正解はBで、根拠となる記述は次の通りです。" * 8}
+    ]
+
+
+def run_session(manager, turns=TURNS):
+    """turns ターンの会話を行い、各ターンでモデルに渡す履歴のバイト数とトークン数を返す"""
+    history = []
+    sizes = []
+    for turn in range(1, turns + 1):
+        summary, window = manager.prepare(history)
+        payload = {"system": summary, "messages": window}
+        tokens = estimate_tokens(summary) + sum(estimate_tokens(msg["content"]) for msg in window)
+        sizes.append((len(json.dumps(payload, ensure_ascii=False).encode('utf-8')), tokens))
+        history = history + turn_messages(turn)
+    return sizes
+
+
+def counting_summarizer(calls):
+    def summarize(previous_summary, messages, max_tokens):
+        calls.append(len(messages))
+        return summarize_extractive(previous_summary, messages, max_tokens)
+    return summarize
+
+
+def test_payload_is_bounded_over_200_turns():
+    manager = HistoryManager(summarizer=counting_summarizer([]))
+    sizes = run_session(manager)
+
+    steady = sizes[20:]
+    payload_bytes = [size for size, _ in steady]
+    # ウィンドウと要約の上限に達した後は、ターン数が増えてもペイロードは増えない
+    assert max(tokens for _, tokens in steady) <= manager.token_budget + manager.summary_tokens
+    assert max(payload_bytes) <= min(payload_bytes) * 1.25
+    assert sizes[-1][0] <= max(size for size, _ in sizes[:40])
+
+    legacy_bytes = len(json.dumps([msg for turn in range(1, TURNS) for msg in turn_messages(turn)],
+                                  ensure_ascii=False).encode('utf-8'))
+    assert sizes[-1][0] * 10 < legacy_bytes
+
+
+def test_summarizer_runs_once_per_fold():
+    calls = []
+    manager = HistoryManager(summarizer=counting_summarizer(calls))
+    run_session(manager)
+
+    # 畳み込まれる発言は 2 * TURNS - max_messages 件程度で、要約は fold_size 件ごとに1回だけ計算される
+    expected = (2 * TURNS - manager.max_messages) / manager.fold_size
+    assert abs(len(calls) - expected) <= 2
+    assert all(count == manager.fold_size for count in calls[1:])
+
+
+def test_prepare_is_cached_for_repeated_history():
+    calls = []
+    manager = HistoryManager(summarizer=counting_summarizer(calls))
+    history = [msg for turn in range(1, 30) for msg in turn_messages(turn)]
+
+    first = manager.prepare(history)
+    second = manager.prepare(history)
+
+    assert first == second
+    assert len(calls) == 1
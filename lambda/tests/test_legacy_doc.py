@@ -0,0 +1,64 @@
+#lambda/tests/test_legacy_doc.py
+import struct
+
+import pytest
+
+from legacy_doc import (FC_COMPRESSED, FIB_CCP_TEXT_OFFSET, FIB_FC_CLX_OFFSET, FIB_FLAGS_OFFSET, FIB_IDENT,
+                        FLAG_ENCRYPTED, FLAG_WHICH_TABLE_STREAM, DocFormatError, iter_document_text, table_stream_name)
+
+TEXT_OFFSET = 0x400
+
+
+def build_doc(pieces, ccp_text=None, flags=FLAG_WHICH_TABLE_STREAM):
+    """ピース（文字列, 圧縮の有無）の並びから WordDocument ストリームと 1Table ストリームを作る"""
+    text = bytearray()
+    cps = [0]
+    descriptors = b""
+    for piece, compressed in pieces:
+        offset = TEXT_OFFSET + len(text)
+        if compressed:
+            text += piece.encode('cp1252')
+            fc = (offset * 2) | FC_COMPRESSED
+        else:
+            text += piece.encode('utf-16-le')
+            fc = offset
+        cps.append(cps[-1] + len(piece))
+        descriptors += struct.pack('<HIH', 0, fc, 0)
+    plc_pcd = struct.pack(f'<{len(cps)}I', *cps) + descriptors
+    # 書式の差分（Prc）の後ろにピーステーブル（Pcdt）を置く
+    clx = b"\x01" + struct.pack('<h', 3) + b"\x00\x00\x00" + b"\x02" + struct.pack('<I', len(plc_pcd)) + plc_pcd
+    table = b"\x00" * 16 + clx
+
+    word_document = bytearray(TEXT_OFFSET)
+    struct.pack_into('<H', word_document, 0, FIB_IDENT)
+    struct.pack_into('<H', word_document, FIB_FLAGS_OFFSET, flags)
+    struct.pack_into('<I', word_document, FIB_CCP_TEXT_OFFSET, cps[-1] if ccp_text is None else ccp_text)
+    struct.pack_into('<II', word_document, FIB_FC_CLX_OFFSET, 16, len(clx))
+    return bytes(word_document + text), table
+
+
+def test_compressed_and_unicode_pieces_are_joined():
+    word_document, table = build_doc([("Hello, caf\xe9\r", True), ("日本語の段落\r", False), ("End", True)])
+
+    assert table_stream_name(word_document) == '1Table'
+    assert "".join(iter_document_text(word_document, table)) == "Hello, caf\xe9\n日本語の段落\nEnd"
+
+
+def test_text_after_main_document_is_excluded():
+    word_document, table = build_doc([("本文\r", False), ("脚注", False)], ccp_text=3)
+
+    assert "".join(iter_document_text(word_document, table)) == "本文\n"
+
+
+def test_field_codes_are_dropped():
+    word_document, table = build_doc([("参照: \x13 HYPERLINK \"https://example.com\" \x14リンク\x15 です\x01", False)])
+
+    assert "".join(iter_document_text(word_document, table)) == "参照: リンク です"
+
+
+def test_encrypted_document_is_rejected():
+    word_document, table = build_doc([("secret", True)], flags=FLAG_ENCRYPTED)
+
+    assert table_stream_name(word_document) == '0Table'
+    with pytest.raises(DocFormatError, match="パスワード"):
+        list(iter_document_text(word_document, table))
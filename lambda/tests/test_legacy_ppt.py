@@ -0,0 +1,84 @@
+#lambda/tests/test_legacy_ppt.py
+import struct
+
+import pytest
+
+from legacy_ppt import PptFormatError, iter_all_texts, iter_slide_texts
+
+
+def record(rec_type, body, instance=0, version=0):
+    return struct.pack('<HHI', version | (instance << 4), rec_type, len(body)) + body
+
+
+def container(rec_type, children, instance=0):
+    return record(rec_type, b"".join(children), instance, version=0xF)
+
+
+def text_atom(text):
+    """ASCIIのみの場合は TextBytesAtom、それ以外は TextCharsAtom"""
+    text = text.replace("\n", "\r")
+    if text.isascii():
+        return record(0x0FA8, text.encode('latin-1'))
+    return record(0x0FA0, text.encode('utf-16-le'))
+
+
+def build_powerpoint_document(slides):
+    """スライドごとの (プレースホルダーの本文, テキストボックスの本文) から
+    PowerPoint Document ストリームと Current User ストリームを作る"""
+    slide_list = []
+    for index, (placeholders, _) in enumerate(slides):
+        slide_list.append(record(0x03F3, struct.pack('<IIIII', index + 2, 0, len(placeholders), 256 + index, 0)))
+        slide_list.extend(text_atom(text) for text in placeholders)
+    # ノートの SlideListWithText（recInstance = 2）のテキストは含めない
+    notes_list = [record(0x03F3, struct.pack('<IIIII', 99, 0, 1, 0, 0)), text_atom("ノート")]
+    document = container(0x03E8, [record(0x03E9, b"\x00" * 40),
+                                  container(0x0FF0, slide_list, instance=0),
+                                  container(0x0FF0, notes_list, instance=2)])
+
+    # マスターのテキストはスライドの前に置く（構造を解析する場合は含めない）
+    stream = bytearray(container(0x03F8, [text_atom("マスターのタイトル")]))
+    offsets = [len(stream)]
+    stream += document
+    for _, text_boxes in slides:
+        offsets.append(len(stream))
+        stream += container(0x03EE, [container(0xF00D, [text_atom(text)]) for text in text_boxes])
+
+    persist_directory_offset = len(stream)
+    stream += record(0x1772, struct.pack('<I', 1 | (len(offsets) << 20)) + struct.pack(f'<{len(offsets)}I', *offsets))
+    user_edit_offset = len(stream)
+    stream += record(0x0FF5, struct.pack('<IHBBIIIIHH', 0, 0, 0, 3, 0, persist_directory_offset, 1, len(offsets) + 1, 1, 0))
+    current_user = record(0x0FF6, struct.pack('<III', 0x14, 0xE391C05F, user_edit_offset))
+    return bytes(stream), current_user
+
+
+SLIDES = [
+    (["第1章 光合成", "明反応と\n暗反応"], ["補足: 葉緑体"]),
+    (["Chapter 2"], []),
+    ([], ["テキストボックスのみ"])
+]
+
+
+def test_slide_texts_follow_slide_order():
+    document, current_user = build_powerpoint_document(SLIDES)
+
+    assert list(iter_slide_texts(document, current_user)) == [
+        ["第1章 光合成", "明反応と\n暗反応", "補足: 葉緑体"],
+        ["Chapter 2"],
+        ["テキストボックスのみ"]
+    ]
+
+
+def test_missing_current_user_is_format_error():
+    document, _ = build_powerpoint_document(SLIDES)
+
+    with pytest.raises(PptFormatError):
+        list(iter_slide_texts(document, b""))
+
+
+def test_all_texts_fallback_reads_records_in_stream_order():
+    document, _ = build_powerpoint_document(SLIDES)
+
+    assert list(iter_all_texts(document)) == [
+        "マスターのタイトル", "第1章 光合成", "明反応と\n暗反応", "Chapter 2", "ノート",
+        "補足: 葉緑体", "テキストボックスのみ"
+    ]
@@ -0,0 +1,28 @@
+#lambda/tests/test_log_utils.py
+import json
+
+from conftest import api_event
+from log_utils import redact
+
+BODY = {"fileName": "資料.pdf", "file": "JVBERi0xLjQK" * 100, "message": "質問です"}
+
+
+def test_redact_hides_file_in_plain_body():
+    redacted = redact(api_event("/upload", BODY))
+
+    assert redacted["body"]["file"] == "<redacted: 1200>"
+    assert redacted["body"]["message"] == "質問です"
+
+
+def test_redact_hides_file_in_base64_body():
+    redacted = redact(api_event("/upload", BODY, base64_encoded=True))
+
+    assert redacted["body"]["file"] == "<redacted: 1200>"
+    assert redacted["body"]["fileName"] == "資料.pdf"
+    assert "JVBERi0xLjQK" not in json.dumps(redacted, ensure_ascii=False)
+
+
+def test_redact_truncates_non_json_body():
+    redacted = redact({"body": "x" * 500, "isBase64Encoded": False})
+
+    assert redacted["body"].startswith("x" * 200) and redacted["body"].endswith("(500文字)")
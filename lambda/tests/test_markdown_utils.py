@@ -0,0 +1,41 @@
+#lambda/tests/test_markdown_utils.py
+import random
+
+import pytest
+
+from markdown_utils import MarkdownStreamStripper, remove_markdown_formatting
+
+# 記法の区切りがチャンクの境界をまたぐように分割した応答
+CANNED_CHUNKS = ["# 回答\n", "これは**重", "要**な点です。", "\n- `cod", "e` と [リン", "ク](https://example.com)", "\n最後の行"]
+
+
+def test_stream_stripper_matches_batch_for_any_split():
+    text = "".join(CANNED_CHUNKS)
+    for size in range(1, len(text) + 1):
+        stripper = MarkdownStreamStripper()
+        parts = [stripper.feed(text[start:start + size]) for start in range(0, len(text), size)]
+        parts.append(stripper.flush())
+        assert "".join(parts) == remove_markdown_formatting(text)
+
+
+def stream_strip(text, size, strip_blocks):
+    stripper = MarkdownStreamStripper(strip_blocks)
+    parts = [stripper.feed(text[start:start + size]) for start in range(0, len(text), size)]
+    parts.append(stripper.flush())
+    return "".join(parts)
+
+
+def test_stream_stripper_removes_whole_block_marker():
+    assert stream_strip("-   [a](b)", 1, True) == remove_markdown_formatting("-   [a](b)", True) == "a"
+
+
+@pytest.mark.parametrize("strip_blocks", [False, True])
+def test_stream_stripper_matches_batch_for_random_text(strip_blocks):
+    # 行頭記号・インライン記法・空白を組み合わせたテキストで、分割の仕方によらず一括処理と一致すること
+    pieces = ["-", "*", "+", "#", "##", " ", "  ", "\t", "\n", "**", "`", "[", "](u)", "a", "語", "x*"]
+    rng = random.Random(0)
+    for _ in range(2000):
+        text = "".join(rng.choice(pieces) for _ in range(rng.randint(1, 14)))
+        expected = remove_markdown_formatting(text, strip_blocks)
+        for size in (1, 2, 3):
+            assert stream_strip(text, size, strip_blocks) == expected, text
@@ -0,0 +1,112 @@
+#lambda/tests/test_model_client.py
+import contextvars
+
+import pytest
+
+from model_client import ModelClient, TokenBucket
+
+
+class ClientError(Exception):
+    """botocore の ClientError と同じ response 属性を持つ例外"""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FlakyBedrock:
+    """指定した回数だけスロットリングを返し、呼び出しごとに latency 秒進めるクライアント"""
+
+    def __init__(self, clock, throttles, latency=0.1):
+        self.clock = clock
+        self.throttles = throttles
+        self.latency = latency
+        self.calls = 0
+
+    def invoke_model(self, **kwargs):
+        self.calls += 1
+        self.clock.now += self.latency
+        if self.calls <= self.throttles:
+            raise ClientError("ThrottlingException")
+        return {"body": kwargs["body"]}
+
+
+def make_client(bedrock, clock, **kwargs):
+    return ModelClient(bedrock, sleep=clock.sleep, clock=clock, **kwargs)
+
+
+def test_retries_throttles_until_success():
+    clock = FakeClock()
+    bedrock = FlakyBedrock(clock, throttles=2)
+    client = make_client(bedrock, clock)
+
+    assert client.invoke_model(body="x") == {"body": "x"}
+    assert client.stats() == {"calls": 3, "retries": 2, "throttles": 2, "failures": 0}
+
+
+def test_non_retryable_error_is_raised_immediately():
+    clock = FakeClock()
+    client = make_client(None, clock)
+
+    def invoke(**kwargs):
+        raise ClientError("ValidationException")
+
+    with pytest.raises(ClientError):
+        client._call(invoke)
+    assert client.stats()["calls"] == 1
+
+
+def test_no_retry_that_cannot_finish_before_deadline():
+    clock = FakeClock()
+    bedrock = FlakyBedrock(clock, throttles=10, latency=20.0)
+    client = make_client(bedrock, clock, deadline=27.0, attempt_timeout=20.0)
+
+    with pytest.raises(ClientError):
+        client.invoke_model(body="x")
+    # 1回目が20秒かかった時点で、再試行すると27秒を超えるため打ち切る
+    assert bedrock.calls == 1
+    assert clock.now < 27.0
+
+
+def test_adaptive_rate_halves_on_throttle_and_recovers():
+    clock = FakeClock()
+    bucket = TokenBucket(8.0, clock=clock, sleep=clock.sleep, adaptive=True, increase=1.0)
+    bedrock = FlakyBedrock(clock, throttles=2, latency=0.0)
+    client = make_client(bedrock, clock, rate_limiter=bucket)
+
+    client.invoke_model(body="x")
+    # 2回のスロットリングで 8 → 4 → 2、成功で +1
+    assert bucket.rate == 3.0
+    for _ in range(10):
+        client.invoke_model(body="x")
+    assert bucket.rate == 8.0
+
+
+def test_fixed_rate_is_not_adjusted():
+    clock = FakeClock()
+    bucket = TokenBucket(5.0, clock=clock, sleep=clock.sleep)
+    client = make_client(FlakyBedrock(clock, throttles=1, latency=0.0), clock, rate_limiter=bucket)
+
+    client.invoke_model(body="x")
+    assert bucket.rate == 5.0
+
+
+def test_map_keeps_order_and_context():
+    request_id = contextvars.ContextVar("request_id")
+    request_id.set("req-1")
+    client = ModelClient(None)
+
+    results = client.map(lambda n: (n * 2, request_id.get()), range(20), max_workers=4)
+
+    assert results == [(n * 2, "req-1") for n in range(20)]
@@ -0,0 +1,81 @@
+#lambda/tests/test_sessions.py
+import pytest
+
+DOCUMENT_TEXT = "削除した資料の本文です。"
+
+
+@pytest.fixture
+def chat(bedrock, documents, session_store, api):
+    """セッション s1 でチャットする関数（資料 doc1 を保存済み）"""
+    documents.put("doc1", {"file_name": "資料.txt", "extracted_text": DOCUMENT_TEXT})
+
+    def send(message, **fields):
+        return api("/chat", {"message": message, "sessionId": "s1", "bypassCache": True, **fields})
+    return send
+
+
+def test_session_files_are_used_when_omitted(bedrock, chat):
+    chat("質問1", uploadedFiles=[{"name": "資料.txt", "documentId": "doc1"}])
+    chat("質問2")
+
+    assert DOCUMENT_TEXT in bedrock.prompts[-1]
+
+
+def test_empty_file_list_clears_session_files(bedrock, chat, api):
+    chat("質問1", uploadedFiles=[{"name": "資料.txt", "documentId": "doc1"}])
+    chat("質問2", uploadedFiles=[])
+    chat("質問3")
+
+    assert DOCUMENT_TEXT not in bedrock.prompts[-2]
+    assert DOCUMENT_TEXT not in bedrock.prompts[-1]
+    _, body = api("/sessions/get", {"sessionId": "s1"})
+    assert body["session"]["uploadedFiles"] == []
+
+
+def test_session_update_clears_files(bedrock, chat, api):
+    chat("質問1", uploadedFiles=[{"name": "資料.txt", "documentId": "doc1"}])
+
+    status, _ = api("/sessions/update", {"sessionId": "s1", "uploadedFiles": []})
+    assert status == 200
+    chat("質問2")
+
+    assert DOCUMENT_TEXT not in bedrock.prompts[-1]
+
+
+def test_history_is_read_from_session(bedrock, chat, api):
+    chat("最初の質問")
+    chat("次の質問")
+
+    _, body = api("/sessions/get", {"sessionId": "s1"})
+    assert [msg["content"] for msg in body["session"]["messages"]] == ["最初の質問", "回答です", "次の質問", "回答です"]
+    assert "最初の質問" in bedrock.prompts[-1]
+
+
+def test_expired_document_is_reported(bedrock, chat, api):
+    chat("質問1", uploadedFiles=[{"name": "古い資料.txt", "documentId": "expired"}])
+    status, body = chat("質問2")
+
+    assert status == 200
+    assert body["missingDocuments"] == ["古い資料.txt"]
+    assert "古い資料.txt" not in bedrock.prompts[-1]
+
+    status, body = api("/qa", {"sessionId": "s1"})
+    assert status == 400
+    assert "古い資料.txt" in body["error"]
+
+
+def test_missing_session_is_seeded_from_client_history(bedrock, chat, api):
+    history = [
+        {"role": "user", "content": "以前の質問"},
+        {"role": "assistant", "content": "以前の回答"},
+        {"role": "system", "content": "読み込みました"}
+    ]
+    chat("続きの質問", conversationHistory=history)
+    chat("さらに質問", conversationHistory=[{"role": "user", "content": "無視される履歴"}])
+
+    _, body = api("/sessions/get", {"sessionId": "s1"})
+    assert [msg["content"] for msg in body["session"]["messages"]] == [
+        "以前の質問", "以前の回答", "続きの質問", "回答です", "さらに質問", "回答です"
+    ]
+    assert "以前の質問" in bedrock.prompts[0]
+    assert "無視される履歴" not in bedrock.prompts[-1]
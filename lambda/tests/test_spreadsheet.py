@@ -0,0 +1,74 @@
+#lambda/tests/test_spreadsheet.py
+import codecs
+import io
+import zipfile
+
+from spreadsheet import SNIFF_BYTES, detect_csv_encoding, iter_csv_text, iter_xlsx_text
+
+MAIN = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+RELS = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+
+SHARED_STRINGS = f"""<?xml version="1.0" encoding="UTF-8"?>
+<sst {MAIN} count="3" uniqueCount="3">
+  <si><t>氏名</t></si>
+  <si><r><rPr><b/></rPr><t>太字の</t></r><r><t xml:space="preserve">リッチ テキスト</t></r></si>
+  <si><t>点数</t></si>
+</sst>"""
+
+SCORES_SHEET = f"""<?xml version="1.0" encoding="UTF-8"?>
+<worksheet {MAIN}><sheetData>
+  <row r="1"><c r="A1" t="s"><v>0</v></c><c r="C1" t="s"><v>2</v></c></row>
+  <row r="2"><c r="A2" t="s"><v>1</v></c><c r="D2"><v>95</v></c></row>
+  <row r="3"><c r="B3"/></row>
+  <row r="4"><c r="B4" t="inlineStr"><is><t>インライン</t></is></c><c r="C4" t="b"><v>1</v></c></row>
+</sheetData></worksheet>"""
+
+NOTES_SHEET = f"""<?xml version="1.0" encoding="UTF-8"?>
+<worksheet {MAIN}><sheetData><row r="1"><c r="A1" t="inlineStr"><is><t>メモ</t></is></c></row></sheetData></worksheet>"""
+
+
+def make_xlsx():
+    """2枚目のシートを先に表示するブック（シートの順番は workbook.xml に従う）"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('xl/workbook.xml', f"""<?xml version="1.0" encoding="UTF-8"?>
+<workbook {MAIN} {RELS}><sheets>
+  <sheet name="成績" sheetId="1" r:id="rId2"/>
+  <sheet name="メモ" sheetId="2" r:id="rId1"/>
+</sheets></workbook>""")
+        archive.writestr('xl/_rels/workbook.xml.rels', """<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+  <Relationship Id="rId1" Target="worksheets/sheet1.xml"/>
+  <Relationship Id="rId2" Target="/xl/worksheets/sheet2.xml"/>
+</Relationships>""")
+        archive.writestr('xl/sharedStrings.xml', SHARED_STRINGS)
+        archive.writestr('xl/worksheets/sheet1.xml', NOTES_SHEET)
+        archive.writestr('xl/worksheets/sheet2.xml', SCORES_SHEET)
+    return buffer.getvalue()
+
+
+def test_xlsx_rows_keep_sheet_order_rich_text_and_sparse_columns():
+    assert "".join(iter_xlsx_text(make_xlsx())) == (
+        "--- シート: 成績 ---\n"
+        "氏名\t\t点数\n"
+        "太字のリッチ テキスト\t\t\t95\n"
+        "\tインライン\tTRUE\n"
+        "\n"
+        "--- シート: メモ ---\n"
+        "メモ\n"
+        "\n"
+    )
+
+
+def test_csv_encoding_detection():
+    assert detect_csv_encoding("名前,点数\n".encode('cp932')) == 'cp932'
+    assert detect_csv_encoding(codecs.BOM_UTF8 + "名前".encode('utf-8')) == 'utf-8-sig'
+    # 判定に使う先頭部分の末尾で途切れたUTF-8の文字はShift_JISと誤判定しない
+    text = "a" * (SNIFF_BYTES - 1) + "あ"
+    assert detect_csv_encoding(text.encode('utf-8')) == 'utf-8'
+
+
+def test_cp932_csv_is_decoded():
+    content = '名前,コメント\n山田,"カンマ, を含む"\n,,\n'.encode('cp932')
+
+    assert "".join(iter_csv_text(content)) == "名前\tコメント\n山田\tカンマ, を含む\n"
@@ -0,0 +1,94 @@
+#lambda/tests/test_uploads.py
+import boto3
+import pytest
+import requests
+from moto import mock_aws
+
+import index
+import uploads
+from jobs import InProcessJobQueue
+
+BUCKET = "upload-test-bucket"
+
+
+@pytest.fixture
+def s3(documents, monkeypatch):
+    """moto のS3バケットと、テストごとのジョブキュー"""
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("UPLOAD_BUCKET", BUCKET)
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        monkeypatch.setattr(uploads, "_s3_client", client)
+        monkeypatch.setattr(index, "_job_queue", InProcessJobQueue(index.run_extraction_job))
+        yield client
+
+
+def upload(api, file_name, content):
+    """署名付きURLを発行し、ブラウザと同じようにPUTでアップロードする"""
+    status, body = api("/upload/url", {"fileName": file_name, "fileType": "text/plain", "fileSize": len(content)})
+    assert status == 200
+    response = requests.put(body["uploadUrl"], data=content, headers={"Content-Type": body["contentType"]})
+    assert response.status_code == 200
+    return body["objectKey"]
+
+
+def object_exists(s3, object_key):
+    return s3.list_objects_v2(Bucket=BUCKET, Prefix=object_key)["KeyCount"] > 0
+
+
+def test_presigned_upload_and_extraction(s3, api, documents):
+    content = "教科書の本文です。\n第1章 はじめに\n".encode('utf-8')
+    object_key = upload(api, "notes.txt", content)
+    assert object_exists(s3, object_key)
+
+    status, result = api("/upload/complete", {"objectKey": object_key, "fileName": "notes.txt", "fileType": "text/plain"})
+
+    assert status == 200
+    assert result["extracted_text"] == content.decode('utf-8')
+    assert documents.get(result["document_id"])["file_name"] == "notes.txt"
+    # 抽出後は元ファイルを削除する
+    assert not object_exists(s3, object_key)
+
+
+def test_async_extraction_job(s3, api):
+    object_key = upload(api, "notes.txt", "非同期で抽出する資料です。".encode('utf-8'))
+
+    status, queued = api("/upload/complete", {
+        "objectKey": object_key, "fileName": "notes.txt", "fileType": "text/plain", "async": True
+    })
+    assert status == 202 and queued["status"] == "queued"
+    index.get_job_queue().wait(queued["jobId"], timeout=10)
+
+    status, job = api("/upload/status", {"jobId": queued["jobId"]})
+    assert status == 200
+    assert job["status"] == "done"
+    assert job["result"]["extracted_text"] == "非同期で抽出する資料です。"
+
+
+def test_rejects_oversized_and_foreign_objects(s3, api, monkeypatch):
+    object_key = upload(api, "large.txt", b"x" * 11)
+    # 署名付きURLの発行後に上限を超えるファイルがアップロードされた場合
+    monkeypatch.setattr(index, "MAX_UPLOAD_BYTES", 10)
+
+    status, body = api("/upload/complete", {"objectKey": object_key, "fileName": "large.txt"})
+    assert status == 400 and "ファイルサイズ" in body["error"]
+    assert not object_exists(s3, object_key)
+
+    status, _ = api("/upload/complete", {"objectKey": "documents/secret.json", "fileName": "x.txt"})
+    assert status == 400
+
+
+def test_stalled_job_is_reported_as_error(s3, api):
+    job_store = index.get_job_store()
+    job_id = job_store.create({"fileName": "notes.txt"})
+    # ワーカーが異常終了し、実行中のまま更新が止まったジョブ
+    record = job_store.update(job_id, status="running")
+    job_store.store.put(job_store.prefix + job_id, {**record, "updated_at": record["updated_at"] - 3600})
+
+    status, job = api("/upload/status", {"jobId": job_id})
+
+    assert status == 200
+    assert job["status"] == "error" and "タイムアウト" in job["error"]
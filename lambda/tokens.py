@@ -0,0 +1,15 @@
+#lambda/tokens.py
+import re
+
+# 日本語（ひらがな・カタカナ・漢字・全角記号）はおおよそ1文字1トークン、
+# それ以外は英語の経験則に従いおおよそ4文字1トークンとして見積もる
+CJK_PATTERN = re.compile(r'[\u3000-\u30FF\u3400-\u9FFF\uF900-\uFAFF\uFF00-\uFFEF]')
+
+
+def estimate_tokens(text):
+    """テキストのトークン数を概算する（モデルのトークナイザーを使わない簡易版）"""
+    if not text:
+        return 0
+    cjk_chars = len(CJK_PATTERN.findall(text))
+    other_chars = len(text) - cjk_chars
+    return cjk_chars + (other_chars + 3) // 4
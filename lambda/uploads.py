@@ -0,0 +1,74 @@
+#lambda/uploads.py
+import os
+import re
+import uuid
+
+# ブラウザから直接アップロードされたファイルを置くプレフィックス
+UPLOAD_PREFIX = "uploads/"
+UPLOAD_URL_EXPIRES = 900
+
+_s3_client = None
+
+
+def get_s3_client():
+    """署名付きURL用のS3クライアントを取得（コンテナ内で使い回す）"""
+    global _s3_client
+    if _s3_client is None:
+        import boto3
+        from botocore.config import Config
+        _s3_client = boto3.client('s3', config=Config(signature_version='s3v4'))
+    return _s3_client
+
+
+def get_upload_bucket():
+    """アップロード先のバケット名（未設定の場合は文書用バケットを使う）"""
+    return os.environ.get('UPLOAD_BUCKET') or os.environ.get('DOCUMENT_BUCKET')
+
+
+def new_object_key(file_name):
+    """アップロード用のオブジェクトキーを生成"""
+    safe_name = re.sub(r'[^\w.\-]', '_', os.path.basename(file_name))[:200] or "file"
+    return f"{UPLOAD_PREFIX}{uuid.uuid4().hex}/{safe_name}"
+
+
+def is_upload_key(object_key):
+    """アップロード用プレフィックス配下の正しいキーかどうか"""
+    return (isinstance(object_key, str)
+            and object_key.startswith(UPLOAD_PREFIX)
+            and '..' not in object_key)
+
+
+def create_upload_url(s3, bucket, file_name, file_type):
+    """ファイルを直接PUTするための署名付きURLを発行"""
+    object_key = new_object_key(file_name)
+    content_type = file_type or 'application/octet-stream'
+    upload_url = s3.generate_presigned_url(
+        'put_object',
+        Params={
+            'Bucket': bucket,
+            'Key': object_key,
+            'ContentType': content_type
+        },
+        ExpiresIn=UPLOAD_URL_EXPIRES
+    )
+    return {
+        "uploadUrl": upload_url,
+        "objectKey": object_key,
+        "contentType": content_type,
+        "expiresIn": UPLOAD_URL_EXPIRES
+    }
+
+
+def get_object_size(s3, bucket, object_key):
+    """オブジェクトのサイズ（バイト）を取得"""
+    return s3.head_object(Bucket=bucket, Key=object_key)['ContentLength']
+
+
+def read_object(s3, bucket, object_key):
+    """オブジェクトを読み込む（抽出器はファイル全体を必要とするため、1回の read でバイト列にする）"""
+    response = s3.get_object(Bucket=bucket, Key=object_key)
+    return response['Body'].read()
+
+
+def delete_object(s3, bucket, object_key):
+    s3.delete_object(Bucket=bucket, Key=object_key)
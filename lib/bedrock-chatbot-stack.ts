@@ -9,6 +9,7 @@ import * as s3deploy from 'aws-cdk-lib/aws-s3-deployment';
 import * as cloudfront from 'aws-cdk-lib/aws-cloudfront';
 import * as origins from 'aws-cdk-lib/aws-cloudfront-origins';
 import * as cognito from 'aws-cdk-lib/aws-cognito';
+import * as dynamodb from 'aws-cdk-lib/aws-dynamodb';
 import * as path from 'path';
 import * as cr from 'aws-cdk-lib/custom-resources';
 import * as logs from 'aws-cdk-lib/aws-logs';
@@ -148,19 +149,72 @@ export class BedrockChatbotStack extends cdk.Stack {
       resources: ['*']
     }));
 
+    // アップロード文書の抽出テキストを保存するバケット（文書IDで参照）
+    const documentBucket = new s3.Bucket(this, 'DocumentBucket', {
+      blockPublicAccess: s3.BlockPublicAccess.BLOCK_ALL,
+      encryption: s3.BucketEncryption.S3_MANAGED,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+      autoDeleteObjects: true,
+      lifecycleRules: [
+        {
+          expiration: cdk.Duration.days(30),
+        },
+        {
+          // 署名付きURLでアップロードされた元ファイル（通常は抽出後に削除される）
+          prefix: 'uploads/',
+          expiration: cdk.Duration.days(1),
+        },
+      ],
+      cors: [
+        {
+          allowedHeaders: ['*'],
+          allowedMethods: [s3.HttpMethods.PUT],
+          allowedOrigins: ['*'],
+          maxAge: 3000,
+        },
+      ],
+    });
+    documentBucket.grantReadWrite(lambdaRole);
+    documentBucket.grantDelete(lambdaRole);
+
+    // チャットセッション（会話の発言・ファイル参照・問題集）を保存するテーブル
+    const sessionTable = new dynamodb.Table(this, 'SessionTable', {
+      partitionKey: { name: 'pk', type: dynamodb.AttributeType.STRING },
+      sortKey: { name: 'sk', type: dynamodb.AttributeType.STRING },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+    sessionTable.grantReadWriteData(lambdaRole);
+
+    // 大きなファイルの抽出ジョブを自身の非同期呼び出しで実行するための権限
+    // （関数ARNを直接参照すると循環依存になるため、論理IDを含む関数名で指定）
+    lambdaRole.addToPolicy(new iam.PolicyStatement({
+      actions: ['lambda:InvokeFunction'],
+      resources: [`arn:aws:lambda:${this.region}:${this.account}:function:*ChatFunction*`]
+    }));
+
     // ファイル処理Lambda関数は削除（権限を超えるため）
     
     // メインチャットLambda関数（ファイル処理も含む）
+    const chatFunctionTimeout = cdk.Duration.minutes(5); // ファイル処理のためタイムアウトを延長
     const chatFunction = new lambda.Function(this, 'ChatFunction', {
       runtime: lambda.Runtime.PYTHON_3_10,
       handler: 'index.lambda_handler',
-      code: lambda.Code.fromAsset(path.join(__dirname, '../lambda')),
-      timeout: cdk.Duration.minutes(5), // ファイル処理のためタイムアウトを延長
+      // テストはデプロイしない
+      code: lambda.Code.fromAsset(path.join(__dirname, '../lambda'), {
+        exclude: ['tests', '**/__pycache__'],
+      }),
+      timeout: chatFunctionTimeout,
       memorySize: 1024, // メモリを増加
       role: lambdaRole,
       environment: {
         MODEL_ID: modelId,
-        // S3関連の環境変数は削除（S3を使用しないため）
+        DOCUMENT_BUCKET: documentBucket.bucketName,
+        EXTRACTION_CACHE_PERSISTENT: 'true',
+        UPLOAD_BUCKET: documentBucket.bucketName,
+        SESSION_TABLE: sessionTable.tableName,
+        // 非同期抽出ジョブ（同じ関数の非同期呼び出し）の更新が止まったとみなすまでの秒数
+        EXTRACTION_JOB_TIMEOUT_SECONDS: chatFunctionTimeout.toSeconds().toString(),
       },
     });
 
@@ -173,6 +227,9 @@ export class BedrockChatbotStack extends cdk.Stack {
     const api = new apigateway.RestApi(this, 'ChatbotApi', {
       restApiName: 'Bedrock Chatbot API',
       description: 'API for Bedrock Converse chatbot',
+      // Lambdaが圧縮（gzip / br）してBase64で返したレスポンスをバイナリに戻して返す
+      // （リクエストボディもBase64で渡されるため、Lambda側で復号する）
+      binaryMediaTypes: ['*/*'],
       defaultCorsPreflightOptions: {
         allowOrigins: apigateway.Cors.ALL_ORIGINS,
         allowMethods: apigateway.Cors.ALL_METHODS,
@@ -199,6 +256,51 @@ export class BedrockChatbotStack extends cdk.Stack {
       authorizationType: apigateway.AuthorizationType.COGNITO,
     });
 
+    // S3への直接アップロード用のエンドポイント（署名付きURLの発行と完了通知）
+    for (const name of ['url', 'complete', 'status']) {
+      uploadResource.addResource(name).addMethod('POST', new apigateway.LambdaIntegration(chatFunction), {
+        authorizer,
+        authorizationType: apigateway.AuthorizationType.COGNITO,
+      });
+    }
+
+    // 記述問題の採点用のエンドポイント（1問ずつ / クイズ全体の一括採点）
+    const gradeResource = api.root.addResource('grade');
+    gradeResource.addMethod('POST', new apigateway.LambdaIntegration(chatFunction), {
+      authorizer,
+      authorizationType: apigateway.AuthorizationType.COGNITO,
+    });
+    gradeResource.addResource('batch').addMethod('POST', new apigateway.LambdaIntegration(chatFunction), {
+      authorizer,
+      authorizationType: apigateway.AuthorizationType.COGNITO,
+    });
+
+    // 学習問題集の生成用のエンドポイント
+    const qaResource = api.root.addResource('qa');
+    qaResource.addMethod('POST', new apigateway.LambdaIntegration(chatFunction), {
+      authorizer,
+      authorizationType: apigateway.AuthorizationType.COGNITO,
+    });
+
+    // 保存済みのチャットセッションの一覧・読み込み・更新・削除用のエンドポイント
+    const sessionsResource = api.root.addResource('sessions');
+    for (const action of ['list', 'get', 'update', 'delete']) {
+      sessionsResource.addResource(action).addMethod('POST', new apigateway.LambdaIntegration(chatFunction), {
+        authorizer,
+        authorizationType: apigateway.AuthorizationType.COGNITO,
+      });
+    }
+
+    // バイナリメディアタイプに */* を登録しているため、CORSプリフライト（OPTIONS）のモック統合は
+    // レスポンスをテキストとして扱うよう指定する（指定しないとプリフライトが500エラーになる）
+    // リソースを追加した場合もこの処理より前に追加すること
+    for (const method of api.methods) {
+      if (method.httpMethod === 'OPTIONS') {
+        const cfnMethod = method.node.defaultChild as apigateway.CfnMethod;
+        cfnMethod.addPropertyOverride('Integration.ContentHandling', 'CONVERT_TO_TEXT');
+      }
+    }
+
     // 設定生成用のLambdaロールを作成
     const configGeneratorRole = new iam.Role(this, 'ConfigGeneratorRole', {
       assumedBy: new iam.ServicePrincipal('lambda.amazonaws.com'),